@@ -0,0 +1,247 @@
+# Engagement aggregates over the crawl database (store.sqlite_store) per keyword, author or day.
+#
+# Rows are read with pandas in chunks, so memory grows with the number of groups, never with
+# the number of rows: repeated text columns (user_id, ip_location, type, source_keyword) are
+# categoricals and counts are int32 while a chunk is in memory. Every chunk is reduced with
+# vectorised group-bys to a partial aggregate that merges by addition:
+#   totals      per (group, day): notes, liked/collected/comment/share sums, stored comments
+#   histogram   per (group, bucket): notes per log-scaled engagement bucket
+# so partial aggregates of chunks, or of several databases, combine with merge(). Percentiles
+# are read from the merged histogram (BUCKETS_PER_OCTAVE buckets per doubling, about 9%
+# relative error). Growth compares the last `window` days with the `window` days before them,
+# per day it is the change from the previous day. Engagement is liked + collected + comment +
+# share count, days are Beijing time days of the note's publish time.
+#
+#   python -m analytics.engagement --by keyword
+#   python -m analytics.engagement --by author --top 20 --sort p90
+#   python -m analytics.engagement --by day --since 2023-06-01 --csv data/daily.csv
+import argparse
+import sqlite3
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+
+COUNT_COLUMNS = ["liked_count", "collected_count", "comment_count", "share_count"]
+CATEGORY_COLUMNS = ["user_id", "ip_location", "type", "source_keyword"]
+GROUP_COLUMNS = {"keyword": "source_keyword", "author": "user_id", "day": "day"}
+TOTAL_COLUMNS = ["notes", *COUNT_COLUMNS, "engagement", "stored_comments"]
+PERCENTILES = (0.5, 0.9, 0.99)
+BUCKETS_PER_OCTAVE = 8
+# group of notes without a keyword or author
+MISSING = "(none)"
+DAY_MS = 24 * 3600 * 1000
+# xhs timestamps are UTC milliseconds, days are counted in Beijing time
+DAY_OFFSET_MS = 8 * 3600 * 1000
+
+NOTE_SQL = ("SELECT type, time, user_id, ip_location, source_keyword, "
+            "liked_count, collected_count, comment_count, share_count FROM xhs_note")
+# comments count towards the author / keyword of their note and the day they were written
+COMMENT_SQL = ("SELECT c.create_time AS time, n.user_id, n.source_keyword "
+               "FROM xhs_note_comment AS c JOIN xhs_note AS n ON n.note_id = c.note_id")
+
+
+def to_day(timestamps: pd.Series) -> pd.Series:
+    return ((timestamps.fillna(0).astype("int64") + DAY_OFFSET_MS) // DAY_MS).astype("int32")
+
+
+def date_to_ms(value: str) -> int:
+    """
+    Start of a Beijing time day (YYYY-MM-DD) as a millisecond timestamp.
+    """
+    return int(pd.Timestamp(value).value // 1_000_000) - DAY_OFFSET_MS
+
+
+def engagement_bucket(engagement: pd.Series) -> np.ndarray:
+    return np.floor(np.log2(engagement.to_numpy() + 1) * BUCKETS_PER_OCTAVE).astype("int16")
+
+
+def bucket_value(bucket: np.ndarray) -> np.ndarray:
+    """
+    Geometric middle of a bucket, in engagement.
+    """
+    return np.round(np.exp2((bucket + 0.5) / BUCKETS_PER_OCTAVE) - 1)
+
+
+def read_chunks(conn: sqlite3.Connection, sql: str, time_column: str, chunksize: int,
+                since: Optional[int] = None, until: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f"{time_column} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{time_column} < ?")
+        params.append(until)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    yield from pd.read_sql_query(sql, conn, params=params, chunksize=chunksize)
+
+
+def prepare_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compact dtypes for a chunk as read from SQLite, plus its day column.
+    """
+    for column in COUNT_COLUMNS:
+        if column in chunk:
+            chunk[column] = chunk[column].fillna(0).astype("int32")
+    for column in CATEGORY_COLUMNS:
+        if column in chunk:
+            chunk[column] = chunk[column].fillna(MISSING).astype("category")
+    chunk["day"] = to_day(chunk.pop("time"))
+    return chunk
+
+
+class EngagementAggregate:
+    def __init__(self, by: str = "keyword"):
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"by must be one of {list(GROUP_COLUMNS)}")
+        self.by = by
+        self.totals = pd.DataFrame(
+            columns=TOTAL_COLUMNS, dtype="int64",
+            index=pd.MultiIndex.from_arrays([[], []], names=["group", "day"])
+        )
+        self.histogram = pd.Series(
+            dtype="int64", index=pd.MultiIndex.from_arrays([[], []], names=["group", "bucket"])
+        )
+        self.rows = 0
+
+    def _groups(self, chunk: pd.DataFrame) -> pd.Series:
+        return chunk[GROUP_COLUMNS[self.by]].rename("group")
+
+    def add_notes(self, chunk: pd.DataFrame):
+        """
+        Add a chunk of NOTE_SQL rows.
+        """
+        chunk = prepare_chunk(chunk)
+        engagement = chunk[COUNT_COLUMNS].sum(axis=1).astype("int64")
+        frame = chunk[COUNT_COLUMNS].assign(notes=1, engagement=engagement)
+        totals = frame.groupby([self._groups(chunk), chunk["day"]], observed=True).sum()
+        bucket = pd.Series(engagement_bucket(engagement), index=chunk.index, name="bucket")
+        histogram = bucket.groupby([self._groups(chunk), bucket], observed=True).size()
+        self._merge(totals, histogram)
+        self.rows += len(chunk)
+
+    def add_comments(self, chunk: pd.DataFrame):
+        """
+        Add a chunk of COMMENT_SQL rows.
+        """
+        chunk = prepare_chunk(chunk)
+        stored_comments = chunk.groupby([self._groups(chunk), chunk["day"]], observed=True).size()
+        self._merge(stored_comments.to_frame("stored_comments"), None)
+        self.rows += len(chunk)
+
+    def merge(self, other: "EngagementAggregate"):
+        if other.by != self.by:
+            raise ValueError(f"cannot merge an aggregate by {other.by} into one by {self.by}")
+        self._merge(other.totals, other.histogram)
+        self.rows += other.rows
+
+    def _merge(self, totals: pd.DataFrame, histogram: Optional[pd.Series]):
+        totals = pd.concat([self.totals, totals.reindex(columns=TOTAL_COLUMNS)])
+        self.totals = totals.groupby(level=["group", "day"]).sum().astype("int64")
+        if histogram is not None:
+            self.histogram = pd.concat([self.histogram, histogram]).groupby(level=["group", "bucket"]).sum()
+
+    def percentiles(self) -> pd.DataFrame:
+        """
+        Engagement percentiles per group, from the histogram.
+        """
+        histogram = self.histogram[self.histogram > 0].sort_index()
+        groups = histogram.index.get_level_values("group")
+        buckets = histogram.index.get_level_values("bucket").to_numpy()
+        cumulative = histogram.groupby(level="group").cumsum().to_numpy()
+        group_total = histogram.groupby(level="group").transform("sum").to_numpy()
+        result = {}
+        for q in PERCENTILES:
+            reached = cumulative >= q * group_total
+            # the histogram is sorted by group then bucket: the first bucket reaching q wins
+            first = pd.Series(buckets[reached], index=groups[reached]).groupby(level=0).first()
+            result[f"p{q * 100:g}"] = pd.Series(bucket_value(first.to_numpy()), index=first.index)
+        return pd.DataFrame(result)
+
+    def growth(self, window: int) -> pd.DataFrame:
+        """
+        Relative change in notes and engagement, NaN where there was nothing to compare with.
+        """
+        daily = self.totals[["notes", "engagement"]]
+        if self.by == "day":
+            days = daily.groupby(level="group").sum()
+            if days.empty:
+                return days.rename(columns=lambda column: f"{column}_growth")
+            days = days.reindex(range(int(days.index.min()), int(days.index.max()) + 1), fill_value=0)
+            recent, previous = days, days.shift(1)
+        else:
+            day = daily.index.get_level_values("day")
+            last_day = day.max() if len(day) else 0
+            recent = daily[day > last_day - window].groupby(level="group").sum()
+            previous = daily[(day <= last_day - window) & (day > last_day - 2 * window)].groupby(level="group").sum()
+            recent, previous = recent.align(previous, fill_value=0)
+        growth = (recent - previous) / previous.where(previous > 0)
+        return growth.rename(columns=lambda column: f"{column}_growth")
+
+    def result(self, window: int = 7) -> pd.DataFrame:
+        """
+        One row per group: totals, mean engagement per note, percentiles and growth.
+        """
+        totals = self.totals.groupby(level="group").sum()
+        totals["mean_engagement"] = totals["engagement"] / totals["notes"].where(totals["notes"] > 0)
+        result = totals.join(self.percentiles()).join(self.growth(window))
+        result.index.name = self.by
+        if self.by == "day":
+            result.index = pd.to_datetime(result.index.astype("int64"), unit="D").date
+            result.index.name = "day"
+        return result
+
+
+def aggregate_db(conn: sqlite3.Connection, by: str, chunksize: int = 100000,
+                 since: Optional[int] = None, until: Optional[int] = None) -> EngagementAggregate:
+    """
+    Aggregate the stored notes, and the stored comments of those notes, chunk by chunk.
+    since/until are millisecond timestamps of the note publish / comment time.
+    """
+    aggregate = EngagementAggregate(by)
+    for chunk in read_chunks(conn, NOTE_SQL, "time", chunksize, since, until):
+        aggregate.add_notes(chunk)
+    for chunk in read_chunks(conn, COMMENT_SQL, "c.create_time", chunksize, since, until):
+        aggregate.add_comments(chunk)
+    return aggregate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engagement aggregates of stored notes.")
+    parser.add_argument('--by', choices=list(GROUP_COLUMNS), default="keyword")
+    parser.add_argument('--db', type=str, default=config.sqlite_db_path)
+    parser.add_argument('--since', type=str, help="first day, YYYY-MM-DD")
+    parser.add_argument('--until', type=str, help="day after the last day, YYYY-MM-DD")
+    parser.add_argument('--window', type=int, default=7, help="days compared for growth")
+    parser.add_argument('--chunksize', type=int, default=100000, help="rows read at a time")
+    parser.add_argument('--sort', type=str, default=None, help="sort by this column, largest first")
+    parser.add_argument('--top', type=int, default=50, help="rows printed, 0 for all")
+    parser.add_argument('--csv', type=str, help="also write every row to this csv file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    begin = time.perf_counter()
+    aggregate = aggregate_db(
+        conn, args.by, args.chunksize,
+        since=date_to_ms(args.since) if args.since else None,
+        until=date_to_ms(args.until) if args.until else None,
+    )
+    result = aggregate.result(args.window)
+    cost = time.perf_counter() - begin
+    if args.sort:
+        result = result.sort_values(args.sort, ascending=False)
+    elif args.by != "day":
+        result = result.sort_values("engagement", ascending=False)
+    if args.csv:
+        result.to_csv(args.csv)
+    with pd.option_context("display.max_columns", None, "display.width", 200, "display.float_format", "{:.2f}".format):
+        print(result.head(args.top) if args.top else result)
+    print(f"{aggregate.rows} rows, {len(result)} groups in {cost:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+import httpx
+from playwright.async_api import Cookie, Page
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+from utils import convert_cookies
+
+
+class SignedRequest(NamedTuple):
+    url: str
+    headers: Dict
+    content: Optional[Union[str, bytes]] = None
+
+
+def is_retryable(ex: BaseException) -> bool:
+    """
+    网络错误和服务端 5xx 可以重试；接口返回的业务错误（DataFetchError/IPBlockError）重试没有意义
+    """
+    if isinstance(ex, httpx.HTTPStatusError):
+        return ex.response.status_code >= 500
+    return isinstance(ex, httpx.TransportError)
+
+
+class AbstractApiClient(ABC):
+    """
+    各平台接口客户端的公共部分：共享的连接池、可选限速器、签名钩子、重试和请求统计。
+    子类实现 sign()（怎么给一个请求签名）和 parse_response()（怎么判断接口是否成功），
+    接口方法只需要调用 get()/post()。
+    """
+
+    def __init__(self, host: str, timeout=10, proxies=None, headers: Optional[Dict] = None,
+                 playwright_page: Page = None, cookie_dict: Dict = None, max_retries: int = 3):
+        self._host = host
+        self.proxies = proxies
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.playwright_page = playwright_page
+        self.cookie_dict = cookie_dict or {}
+        self.max_retries = max_retries
+        # 所有请求共用一个连接池，避免每次请求都重新建立 TCP/TLS 连接
+        self._http_client: Optional[httpx.AsyncClient] = None
+        # 可选的限速器，需要提供 async acquire()，例如分布式模式下的 cluster.rate_limiter.RedisRateLimiter
+        self.rate_limiter = None
+        # 正在用某个页面签名的请求数（按 id(page)），换页面时等旧页面上的签名完成
+        self._page_users: Dict[int, int] = {}
+        # 已经发出、还没有返回的请求数；draining 之后不再发出新的请求（见 drain()）
+        self._in_flight = 0
+        self.draining = False
+        self.stats: Dict[str, Any] = {"requests": 0, "retries": 0, "failed": 0, "signs": 0,
+                                      "sign_seconds": 0.0, "request_seconds": 0.0, "max_request_seconds": 0.0}
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        共享的连接池，第一次使用时创建
+        :return:
+        """
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(proxies=self.proxies, timeout=self.timeout)
+        return self._http_client
+
+    async def close(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def update_cookies(self, cookies: List[Cookie]) -> bool:
+        """
+        换成浏览器当前的 cookies。Cookie 请求头和 cookie_dict 都整体换成新对象、中间没有 await，
+        签名时各取一次引用，所以并发的请求不会用到一半新一半旧的 cookies
+        :param cookies: browser_context.cookies()
+        :return: cookies 是否有变化
+        """
+        cookie_str, cookie_dict = convert_cookies(cookies)
+        if cookie_dict == self.cookie_dict:
+            return False
+        self.headers = {**self.headers, "Cookie": cookie_str}
+        self.cookie_dict = cookie_dict
+        return True
+
+    @abstractmethod
+    async def sign(self, method: str, uri: str, params: Optional[Dict] = None,
+                   data: Optional[Dict] = None) -> SignedRequest:
+        """
+        签名钩子：返回最终要发送的 url、请求头和请求体
+        :param method: GET / POST
+        :param uri: 不带 host 的接口路径
+        :param params: query 参数
+        :param data: POST 的 json 数据
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def parse_response(self, response: httpx.Response) -> Any:
+        """
+        解析响应，成功返回数据，失败抛出 DataFetchError/IPBlockError
+        :param response:
+        :return:
+        """
+        pass
+
+    async def request(self, method: str, uri: str, params: Optional[Dict] = None, data: Optional[Dict] = None):
+        """
+        签名并发送请求，网络错误和 5xx 按指数退避重试，每次尝试都重新签名并占用限速器的额度
+        :param method:
+        :param uri:
+        :param params:
+        :param data:
+        :return:
+        """
+        self.stats["requests"] += 1
+        try:
+            async for attempt in AsyncRetrying(
+                    stop=stop_after_attempt(self.max_retries),
+                    wait=wait_exponential(multiplier=1, max=10),
+                    retry=retry_if_exception(is_retryable),
+                    reraise=True,
+            ):
+                with attempt:
+                    if attempt.retry_state.attempt_number > 1:
+                        self.stats["retries"] += 1
+                    return await self._send(method, uri, params, data)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+    async def _send(self, method: str, uri: str, params: Optional[Dict], data: Optional[Dict]):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        if self.draining:
+            # 停止中：新的请求不再发出，一直等到爬虫任务被取消
+            await asyncio.Event().wait()
+        self._in_flight += 1
+        try:
+            return await self._send_signed(method, uri, params, data)
+        finally:
+            self._in_flight -= 1
+
+    async def _send_signed(self, method: str, uri: str, params: Optional[Dict], data: Optional[Dict]):
+        begin = time.perf_counter()
+        page_key = id(self.playwright_page)
+        self._page_users[page_key] = self._page_users.get(page_key, 0) + 1
+        try:
+            signed = await self.sign(method, uri, params, data)
+        finally:
+            self._page_users[page_key] -= 1
+            if not self._page_users[page_key]:
+                del self._page_users[page_key]
+        signed_at = time.perf_counter()
+        self.stats["signs"] += 1
+        self.stats["sign_seconds"] += signed_at - begin
+        response = await self.http_client.request(
+            method, signed.url, headers=signed.headers, content=signed.content, timeout=self.timeout
+        )
+        cost = time.perf_counter() - signed_at
+        self.stats["request_seconds"] += cost
+        self.stats["max_request_seconds"] = max(self.stats["max_request_seconds"], cost)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return self.parse_response(response)
+
+    async def swap_page(self, page: Page, drain_timeout: float = 30) -> Page:
+        """
+        换一个签名页面：之后的签名立即使用新页面，等旧页面上进行中的签名完成（最多 drain_timeout 秒）后返回旧页面，
+        调用方再关闭它
+        :param page:
+        :param drain_timeout:
+        :return:
+        """
+        old_page = self.playwright_page
+        self.playwright_page = page
+        deadline = time.monotonic() + drain_timeout
+        while self._page_users.get(id(old_page)) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return old_page
+
+    async def drain(self, timeout: float = 30) -> bool:
+        """
+        停止发出新的请求，等已经发出的请求返回（最多 timeout 秒）
+        :param timeout:
+        :return: 是否全部返回了
+        """
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self._in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self._in_flight
+
+    async def get(self, uri: str, params: Optional[Dict] = None):
+        return await self.request("GET", uri, params=params)
+
+    async def post(self, uri: str, data: Dict):
+        return await self.request("POST", uri, data=data)
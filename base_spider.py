@@ -1,4 +1,14 @@
+import asyncio
+import os
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from playwright.async_api import Browser, BrowserContext, Cookie, Page, Playwright
+
+import utils
+from base_client import AbstractApiClient
+from config import browser_blocked_resource_types, browser_blocked_url_keywords, browser_block_resources
 
 
 class Spider(ABC):
@@ -26,3 +36,172 @@ class Spider(ABC):
         :return:
         """
         pass
+
+
+class BrowserSpider(Spider, ABC):
+    """
+    用浏览器登录、签名的爬虫共用的部分：启动浏览器、恢复或保存登录态、等待登录完成、保存登录二维码
+    """
+    # 保存的登录态里代表已登录的 cookie
+    session_cookie = "web_session"
+
+    def __init__(self, index_url: str, storage_state_path: str):
+        self.login_type = None
+        self.web_session = None
+        self.cookies: Optional[List[Cookie]] = None
+        self.browser: Optional[Browser] = None
+        self.browser_context: Optional[BrowserContext] = None
+        self.context_page: Optional[Page] = None
+        self.proxy: Optional[Dict] = None
+        self.user_agent = utils.get_user_agent()
+        self.index_url = index_url
+        self.startup_profiler = None
+        self.storage_state_path = storage_state_path
+        self.block_resources = browser_block_resources
+        self.resource_policy = None
+
+    def init_spider(self, **kwargs):
+        for key in kwargs.keys():
+            setattr(self, key, kwargs[key])
+
+    def _profile(self, stage: str):
+        """
+        启动耗时统计，未开启 --startup-profile 时不做任何事
+        :param stage:
+        :return:
+        """
+        if self.startup_profiler is None:
+            return nullcontext()
+        return self.startup_profiler.measure(stage)
+
+    async def update_cookies(self):
+        """
+        设置cookies  保持登录
+        :return:
+        """
+        self.cookies = await self.browser_context.cookies()
+
+    @abstractmethod
+    def create_client(self) -> AbstractApiClient:
+        """
+        用当前的 cookies 创建请求客户端
+        :return:
+        """
+        pass
+
+    async def open_session(self, playwright: Playwright) -> AbstractApiClient:
+        """
+        启动浏览器并打开首页，保存的登录态没过期就直接恢复，否则登录并保存登录态
+        :param playwright:
+        :return: 用登录后的 cookies 创建的请求客户端
+        """
+        chromium = playwright.chromium
+        with self._profile("browser_launch"):
+            # 创建谷歌浏览器 ，开启启动无头模式
+            self.browser = await chromium.launch(headless=True)
+        # 上次保存的登录态没过期就直接恢复，省去登录以及登录后的重定向等待
+        state_restored = utils.is_storage_state_valid(self.storage_state_path, session_cookie=self.session_cookie)
+        with self._profile("context_setup"):
+            self.browser_context = await self.new_browser_context(
+                self.storage_state_path if state_restored else None
+            )
+            self.context_page = await self.browser_context.new_page()
+        with self._profile("index_page_load"):
+            await self.context_page.goto(self.index_url)
+        if self.startup_profiler is not None:
+            self.startup_profiler.report()
+        if self.resource_policy is not None:
+            self.logger.info("首页加载拦截的请求", extra={"fields": self.resource_policy.stats})
+
+        await self.update_cookies()
+        client = self.create_client()
+        if state_restored and await client.pong():
+            self.logger.info("已恢复保存的登录态，跳过登录")
+            return client
+        await self.login()
+        await self.update_cookies()
+        await self.save_storage_state()
+        # 登录后的 cookies 重新创建请求客户端
+        await client.close()
+        return self.create_client()
+
+    async def new_browser_context(self, storage_state) -> BrowserContext:
+        """
+        按爬虫的设置创建浏览器上下文：UA、代理、反检测脚本，开启 block_resources 时拦截图片、视频、字体和埋点等请求
+        :param storage_state: 要恢复的登录态（文件路径或 dict），None 表示全新的上下文
+        :return:
+        """
+        context = await self.browser.new_context(
+            viewport={"width": 1920, "height": 1080},
+            user_agent=self.user_agent,
+            proxy=self.proxy,
+            storage_state=storage_state
+        )
+        # 执行JS 绕过反自动化及爬虫检测
+        await context.add_init_script(path="libs/stealth.min.js")
+        if self.block_resources:
+            if self.resource_policy is None:
+                from browser.resource_policy import ResourcePolicy
+                self.resource_policy = ResourcePolicy(browser_blocked_resource_types, browser_blocked_url_keywords)
+            await self.resource_policy.install(context)
+        return context
+
+    async def save_storage_state(self):
+        """
+        保存登录后的 cookies 和 localStorage，供下次启动复用
+        :return:
+        """
+        if not self.storage_state_path:
+            return
+        state_dir = os.path.dirname(self.storage_state_path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        await self.browser_context.storage_state(path=self.storage_state_path)
+
+    @staticmethod
+    def save_qrcode(qrcode_img, path: str, show: bool = True):
+        """
+        二维码保存为 PNG，并尝试用系统图片查看器打开（非阻塞），无图形界面时直接打开保存的文件扫码即可
+        :param qrcode_img:
+        :param path:
+        :param show:
+        :return:
+        """
+        qrcode_dir = os.path.dirname(path)
+        if qrcode_dir:
+            os.makedirs(qrcode_dir, exist_ok=True)
+        qrcode_img.save(path)
+        if not show:
+            return
+        try:
+            qrcode_img.show()
+        except OSError:
+            pass
+
+    async def wait_for_login(self, check_login_state: Callable[[], Awaitable[bool]], timeout: float) -> bool:
+        """
+        等待登录完成。监听浏览器上下文的接口响应（包括登录接口和扫码状态轮询接口），
+        每次响应后检查登录态，登录成功即返回，不再固定等待或定时轮询
+        :param check_login_state: 检查是否已登录
+        :param timeout: 最长等待秒数
+        :return:
+        """
+        login_event = asyncio.Event()
+
+        async def on_response(response):
+            if login_event.is_set() or response.request.resource_type not in ("xhr", "fetch"):
+                return
+            if await check_login_state():
+                login_event.set()
+
+        # 先注册监听再检查一次，避免漏掉两者之间完成的登录
+        self.browser_context.on("response", on_response)
+        try:
+            if await check_login_state():
+                return True
+            await asyncio.wait_for(login_event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.browser_context.remove_listener("response", on_response)
@@ -0,0 +1,148 @@
+# Run-to-completion mode for the crawler (main.py --batch).
+#
+# Without it the spiders keep the browser open after the crawl (they are meant to be left
+# running). In batch mode the crawl runs as a task, and the process ends as soon as it
+#   finishes     the crawl returned or raised
+#   is stopped   SIGTERM or SIGINT: the API clients stop sending new requests, requests already
+#                sent get up to `drain_timeout` seconds to come back and be stored, then the
+#                crawl is cancelled. A second signal cancels right away.
+# The spider then closes everything (background tasks, media downloads, the HTTP pool, the
+# store, the browser) and the run summary is logged. The exit code tells a job
+# scheduler how the run went:
+#   0          finished, no request failed
+#   1          the crawl raised
+#   3          finished, but some requests failed after their retries
+#   128 + n    stopped by signal n (143 for SIGTERM, 130 for SIGINT)
+import asyncio
+import logging
+import signal
+import time
+from typing import Awaitable, Dict, Iterable, Optional
+
+from base_client import AbstractApiClient
+
+logger = logging.getLogger("batch")
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_PARTIAL = 3
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class BatchRun:
+    def __init__(self, drain_timeout: float = 30):
+        """
+        :param drain_timeout: seconds in-flight requests get to finish after a stop signal
+        """
+        self.drain_timeout = drain_timeout
+        self.signal: Optional[int] = None
+        self.error: Optional[BaseException] = None
+        self.drained = True
+        self._begin = time.perf_counter()
+        self._stop = asyncio.Event()
+        self._main_task: Optional[asyncio.Task] = None
+        self._crawl_task: Optional[asyncio.Future] = None
+
+    def install(self):
+        """
+        Handle SIGTERM/SIGINT from now on. Call it from the task that runs the spider: a signal that
+        arrives before the crawl started (browser launch, login) cancels that task.
+        """
+        loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        for signum in STOP_SIGNALS:
+            try:
+                loop.add_signal_handler(signum, self._on_signal, signum)
+            except (NotImplementedError, RuntimeError):
+                # no signal handlers in this event loop (Windows), Ctrl-C still stops the process
+                pass
+
+    def uninstall(self):
+        loop = asyncio.get_running_loop()
+        for signum in STOP_SIGNALS:
+            try:
+                loop.remove_signal_handler(signum)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    def _on_signal(self, signum: int):
+        if self.signal is not None or self._crawl_task is None:
+            # a second signal, or still starting up: nothing to drain
+            self.signal = self.signal or signum
+            self._main_task.cancel()
+            return
+        self.signal = signum
+        logger.warning(f"received {signal.Signals(signum).name}, draining in-flight requests",
+                       extra={"fields": {"drain_timeout": self.drain_timeout}})
+        self._stop.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self.signal is not None
+
+    async def run(self, crawl: Awaitable, clients: Iterable[AbstractApiClient]):
+        """
+        Run the crawl until it finishes or a stop signal arrives, then drain the clients.
+        The crawl's exception is kept in self.error, not raised.
+        """
+        clients = list(clients)
+        self._crawl_task = asyncio.ensure_future(crawl)
+        stop_wait = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait({self._crawl_task, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_wait.cancel()
+        if not self._crawl_task.done():
+            results = await asyncio.gather(*(client.drain(self.drain_timeout) for client in clients))
+            self.drained = all(results)
+            self._crawl_task.cancel()
+        try:
+            await self._crawl_task
+        except asyncio.CancelledError:
+            if not self.stopped:
+                raise
+        except Exception as ex:
+            self.error = ex
+            logger.error("crawl failed", exc_info=ex)
+
+    def exit_code(self, failed_requests: int) -> int:
+        if self.stopped:
+            return 128 + self.signal
+        if self.error is not None:
+            return EXIT_FAILED
+        return EXIT_PARTIAL if failed_requests else EXIT_OK
+
+    def summary(self, clients: Iterable[AbstractApiClient], store_stats: Optional[Dict[str, int]] = None) -> Dict:
+        """
+        Totals of the run. Call it after the spider closed everything, so the wall time covers the shutdown.
+        """
+        clients = list(clients)
+        store_stats = store_stats or {}
+        wall_time = time.perf_counter() - self._begin
+        requests = sum(client.stats["requests"] for client in clients)
+        failed = sum(client.stats["failed"] for client in clients)
+        if self.stopped:
+            outcome = signal.Signals(self.signal).name
+        else:
+            outcome = "failed" if self.error is not None else "finished"
+        # Douyin videos and their comments count as notes and comments
+        notes = store_stats.get("notes", 0) + store_stats.get("awemes", 0)
+        comments = store_stats.get("comments", 0) + store_stats.get("aweme_comments", 0)
+        return {
+            "outcome": outcome,
+            "notes": notes,
+            "comments": comments,
+            "items": notes + comments,
+            "requests": requests,
+            "retries": sum(client.stats["retries"] for client in clients),
+            "errors": failed + (self.error is not None),
+            "wall_time": round(wall_time, 3),
+            "requests_per_second": round(requests / wall_time, 3) if wall_time else 0.0,
+            "drained": self.drained,
+            "exit_code": self.exit_code(failed),
+        }
+
+    @staticmethod
+    def report(summary: Dict):
+        # one record: key=value pairs on the console, a single object with --json_log
+        logger.info("run summary", extra={"fields": summary})
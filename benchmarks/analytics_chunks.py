@@ -0,0 +1,112 @@
+# Time and memory of the engagement aggregates (analytics.engagement) on a synthetic crawl
+# database, against the row-by-row way: every row loaded as a dict (as m_xhs builds them), grouped
+# in Python dicts and lists, percentiles by sorting each group's list. Both read the same
+# database, and the totals they report must agree. Memory is the tracemalloc peak.
+#
+#   python -m benchmarks.analytics_chunks --notes 1000000 --by author
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from analytics.engagement import (COMMENT_SQL, COUNT_COLUMNS, GROUP_COLUMNS, NOTE_SQL, aggregate_db,
+                                  DAY_MS, DAY_OFFSET_MS)
+from store.sqlite_store import SqliteStore
+
+KEYWORDS = ("健身", "减脂", "露营", "穿搭", "咖啡", "面试", "citywalk", None)
+LOCATIONS = ("上海", "北京", "广东", "浙江", "四川", None)
+# 2023-06-01
+FIRST_TIME = 1685548800000
+
+
+def build(path: str, notes: int, comments: int, seed: int):
+    """
+    Rows are inserted directly, the FTS index is not needed here.
+    """
+    rng = random.Random(seed)
+    SqliteStore(path).close()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO xhs_note (note_id, type, time, user_id, ip_location, source_keyword, '
+        'liked_count, collected_count, comment_count, share_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((f"n{index}", rng.choice(("normal", "video")), FIRST_TIME + rng.randrange(60 * DAY_MS),
+          f"u{rng.randrange(notes // 20 + 1)}", rng.choice(LOCATIONS), rng.choice(KEYWORDS),
+          int(rng.paretovariate(0.8)), int(rng.paretovariate(1.0)), int(rng.paretovariate(1.2)),
+          int(rng.paretovariate(1.5))) for index in range(notes))
+    )
+    conn.executemany(
+        "INSERT INTO xhs_note_comment (comment_id, note_id, create_time) VALUES (?, ?, ?)",
+        ((f"c{index}", f"n{rng.randrange(notes)}", FIRST_TIME + rng.randrange(60 * DAY_MS))
+         for index in range(comments))
+    )
+    conn.commit()
+    conn.close()
+
+
+def row_by_row(conn: sqlite3.Connection, by: str):
+    key = GROUP_COLUMNS[by]
+    conn.row_factory = sqlite3.Row
+    notes = [dict(row) for row in conn.execute(NOTE_SQL)]
+    comments = [dict(row) for row in conn.execute(COMMENT_SQL)]
+    conn.row_factory = None
+    groups = defaultdict(list)
+    for item in notes:
+        item["day"] = (item["time"] + DAY_OFFSET_MS) // DAY_MS
+        groups[item[key]].append(sum(item[column] or 0 for column in COUNT_COLUMNS))
+    stored_comments = defaultdict(int)
+    for item in comments:
+        item["day"] = (item["time"] + DAY_OFFSET_MS) // DAY_MS
+        stored_comments[item[key]] += 1
+    result = {}
+    for group, values in groups.items():
+        values.sort()
+        result[group] = {
+            "notes": len(values), "engagement": sum(values), "stored_comments": stored_comments[group],
+            "p50": values[len(values) // 2], "p90": values[int(len(values) * 0.9)],
+        }
+    return result
+
+
+def measure(name: str, func):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    result = func()
+    cost = time.perf_counter() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {cost:7.2f}s  peak {peak / 1024 / 1024:8.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare chunked pandas aggregates with row-by-row dicts.")
+    parser.add_argument('--notes', type=int, default=300000)
+    parser.add_argument('--comments', type=int, default=600000)
+    parser.add_argument('--by', choices=list(GROUP_COLUMNS), default="author")
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "analytics.db")
+        begin = time.perf_counter()
+        build(path, args.notes, args.comments, args.seed)
+        print(f"built {args.notes} notes, {args.comments} comments in {time.perf_counter() - begin:.1f}s")
+        conn = sqlite3.connect(path)
+        rows = measure("row-by-row", lambda: row_by_row(conn, args.by))
+        aggregate = measure("chunked", lambda: aggregate_db(conn, args.by, args.chunksize))
+        result = aggregate.result()
+        print(f"{len(result)} groups")
+        if args.by != "day":
+            for column in ("notes", "engagement", "stored_comments"):
+                expected = sum(group[column] for group in rows.values())
+                assert result[column].sum() == expected, column
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
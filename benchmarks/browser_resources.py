@@ -0,0 +1,92 @@
+# Bytes transferred and page ready time of the xiaohongshu index page with resource blocking
+# (browser.resource_policy) off and on. Every run uses a fresh context set up like
+# XiaoHongShuSpider.start_spider (stealth script, the saved storage state when there is one)
+# and measures
+#   load      goto() until the load event
+#   ready     goto() until window._webmsxyw exists, what the crawler actually waits for
+#   sign      one signing call once ready, to show signing still works with blocking on
+#   bytes     response headers + bodies of every finished request
+# Needs the Playwright chromium browser and network access to xiaohongshu.com.
+#
+#   python -m benchmarks.browser_resources --repeat 5
+import argparse
+import asyncio
+import statistics
+import time
+
+from playwright.async_api import async_playwright
+
+import config
+from browser.resource_policy import ResourcePolicy
+from media_platform.xhs.client import SIGN_READY_CHECK
+from utils import get_user_agent, is_storage_state_valid
+
+SIGN_URI = "/api/sns/web/v1/search/notes"
+
+
+async def load_once(browser, block: bool, storage_state, timeout: float):
+    context = await browser.new_context(
+        viewport={"width": 1920, "height": 1080},
+        user_agent=get_user_agent(),
+        storage_state=storage_state,
+    )
+    await context.add_init_script(path="libs/stealth.min.js")
+    policy = None
+    if block:
+        policy = ResourcePolicy(config.browser_blocked_resource_types, config.browser_blocked_url_keywords)
+        await policy.install(context)
+    sizes = []
+    context.on("requestfinished", lambda request: sizes.append(asyncio.ensure_future(request.sizes())))
+    page = await context.new_page()
+
+    begin = time.perf_counter()
+    await page.goto(config.xhs_url[0], wait_until="domcontentloaded", timeout=timeout * 1000)
+    await page.wait_for_function(SIGN_READY_CHECK, timeout=timeout * 1000)
+    ready = time.perf_counter() - begin
+    await page.wait_for_load_state("load", timeout=timeout * 1000)
+    load = time.perf_counter() - begin
+
+    sign_begin = time.perf_counter()
+    await page.evaluate("([url, data]) => window._webmsxyw(url, data)", [SIGN_URI, {"keyword": "健身"}])
+    sign = time.perf_counter() - sign_begin
+    # requests still finishing after the load event are counted too
+    await page.wait_for_timeout(1000)
+    finished = await asyncio.gather(*sizes, return_exceptions=True)
+    transferred = sum(size["responseHeadersSize"] + max(size["responseBodySize"], 0)
+                      for size in finished if isinstance(size, dict))
+    await context.close()
+    return {"load": load, "ready": ready, "sign": sign, "bytes": transferred, "requests": len(finished),
+            "blocked": policy.stats["blocked"] if policy else 0}
+
+
+async def run(repeat: int, timeout: float):
+    storage_state = config.xhs_storage_state_path if is_storage_state_valid(config.xhs_storage_state_path) else None
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        results = {False: [], True: []}
+        # alternate the modes so network conditions affect both alike
+        for _ in range(repeat):
+            for block in (False, True):
+                results[block].append(await load_once(browser, block, storage_state, timeout))
+        await browser.close()
+
+    for block, runs in results.items():
+        print(f"blocking {'on ' if block else 'off'}  "
+              f"ready {statistics.median(run['ready'] for run in runs) * 1000:7.0f} ms  "
+              f"load {statistics.median(run['load'] for run in runs) * 1000:7.0f} ms  "
+              f"sign {statistics.median(run['sign'] for run in runs) * 1000:5.1f} ms  "
+              f"{statistics.median(run['bytes'] for run in runs) / 1024:8.0f} KiB  "
+              f"{statistics.median(run['requests'] for run in runs):5.0f} requests  "
+              f"{statistics.median(run['blocked'] for run in runs):4.0f} blocked")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measure the index page with and without resource blocking.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=60, help="seconds to wait for the page")
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat, args.timeout))
+
+
+if __name__ == '__main__':
+    main()
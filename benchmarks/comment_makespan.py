@@ -0,0 +1,96 @@
+# Makespan of batch comment crawls on a skewed workload, comparing how the notes are
+# scheduled on the same number of workers:
+#   list-order        one job per note in list order (what batch_get_note_comments used to do,
+#                     but bounded to the same number of workers)
+#   largest-first     one job per note, highest comment_count first
+#   largest-first+split  as above, and large sub-comment threads become their own jobs
+# Every page request is simulated by a fixed sleep, so only the scheduling differs.
+#
+#   python -m benchmarks.comment_makespan --notes 40 --workers 4
+import argparse
+import asyncio
+import math
+import random
+import time
+from typing import List, Tuple
+
+from scheduler.cost_pool import CostAwarePool
+
+ROOT_PAGE_SIZE = 20
+SUB_PAGE_SIZE = 30
+# sub comments that come embedded with their root comment
+INLINE_SUB_COMMENTS = 3
+
+
+def make_workload(notes: int, seed: int) -> List[Tuple[int, List[int]]]:
+    """
+    [(root comment count, [sub comment count per thread])], heavy tailed, with the biggest
+    note placed last in the list, the worst case for list-order scheduling.
+    """
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(notes):
+        total = int(rng.paretovariate(1.1) * 30)
+        workload.append(_split_note(total, rng))
+    workload.append(_split_note(20000, rng))
+    return workload
+
+
+def _split_note(total: int, rng: random.Random) -> Tuple[int, List[int]]:
+    roots = max(1, int(total * 0.3))
+    threads = [int(rng.paretovariate(1.2) * 2) for _ in range(roots)]
+    scale = (total - roots) / max(sum(threads), 1)
+    return roots, [int(size * scale) for size in threads]
+
+
+def sub_pages(size: int) -> int:
+    return math.ceil(max(size - INLINE_SUB_COMMENTS, 0) / SUB_PAGE_SIZE)
+
+
+async def run(workload, workers: int, page_latency: float, largest_first: bool, split: bool) -> float:
+    pool = CostAwarePool(concurrency=workers)
+
+    async def crawl_thread(size: int):
+        await asyncio.sleep(sub_pages(size) * page_latency)
+
+    async def crawl_note(roots: int, threads: List[int]):
+        await asyncio.sleep(math.ceil(roots / ROOT_PAGE_SIZE) * page_latency)
+        for size in threads:
+            if split and sub_pages(size):
+                pool.submit(size, crawl_thread, size)
+            else:
+                await crawl_thread(size)
+
+    for roots, threads in workload:
+        cost = roots + sum(threads) if largest_first else 0
+        pool.submit(cost, crawl_note, roots, threads)
+    begin = time.perf_counter()
+    await pool.join()
+    return time.perf_counter() - begin
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="compare comment crawl scheduling on a skewed workload.")
+    parser.add_argument('--notes', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--page_latency', type=float, default=0.005, help='seconds per simulated page request')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    workload = make_workload(args.notes, args.seed)
+    total_pages = sum(math.ceil(roots / ROOT_PAGE_SIZE) + sum(sub_pages(size) for size in threads)
+                      for roots, threads in workload)
+    # root comment pages of one note follow a cursor and can never be split between workers
+    longest_chain = max(math.ceil(roots / ROOT_PAGE_SIZE) for roots, _ in workload)
+    lower_bound = max(total_pages / args.workers, longest_chain) * args.page_latency
+    print(f"notes: {len(workload)}  pages: {total_pages}  longest root chain: {longest_chain} pages  "
+          f"workers: {args.workers}  ideal makespan: {lower_bound:.2f}s")
+    for name, largest_first, split in (("list-order", False, False),
+                                       ("largest-first", True, False),
+                                       ("largest-first+split", True, True)):
+        makespan = await run(workload, args.workers, args.page_latency, largest_first, split)
+        print(f"{name:<22}{makespan:>8.2f}s  ({makespan / lower_bound:.2f}x ideal)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+# Memory and time of thread reconstruction on synthetic comment threads, comparing
+#   dicts         what thread analytics did: a dict per comment plus a children list per parent
+#   tree index    store.comment_tree.CommentTreeIndex (interned ids + parallel integer arrays)
+# Both get the same (note_id, comment_id, parent_comment_id) rows and answer the same
+# "top N threads" query. Memory is the tracemalloc peak while building.
+#
+#   python -m benchmarks.comment_tree_memory --comments 1000000
+import argparse
+import heapq
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import List, Tuple
+
+from store.comment_tree import CommentTreeIndex
+
+
+def make_rows(notes: int, comments: int, seed: int) -> List[Tuple[str, str, str]]:
+    """
+    Heavy tailed threads: most root comments get no reply, a few get long reply chains.
+    """
+    rng = random.Random(seed)
+    rows = []
+    note_comments = defaultdict(list)
+    for index in range(comments):
+        note_id = f"n{int(rng.paretovariate(1.2)) % notes}"
+        comment_id = f"c{index}"
+        siblings = note_comments[note_id]
+        # a third of the comments are replies to an earlier comment of the same note
+        parent = rng.choice(siblings) if siblings and rng.random() < 0.34 else ""
+        siblings.append(comment_id)
+        rows.append((note_id, comment_id, parent))
+    return rows
+
+
+def dict_top_threads(rows, n: int):
+    comments = {}
+    children = defaultdict(list)
+    for note_id, comment_id, parent_comment_id in rows:
+        comments[comment_id] = {"note_id": note_id, "comment_id": comment_id, "parent_comment_id": parent_comment_id}
+        if parent_comment_id:
+            children[parent_comment_id].append(comment_id)
+
+    def size(comment_id):
+        total, stack = 0, [comment_id]
+        while stack:
+            node = stack.pop()
+            total += 1
+            stack.extend(children.get(node, ()))
+        return total
+
+    roots = [comment_id for comment_id, comment in comments.items() if not comment["parent_comment_id"]]
+    return [(root, size(root) - 1) for root in heapq.nlargest(n, roots, key=size)], (comments, children)
+
+
+def tree_top_threads(rows, n: int):
+    tree = CommentTreeIndex.build(lambda: rows)
+    return tree.top_threads(n), tree
+
+
+def measure(name: str, func, rows, n: int):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    top, keep = func(rows, n)
+    cost = time.perf_counter() - begin
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {cost:7.2f}s  retained {current / 1024 / 1024:8.1f} MiB  peak {peak / 1024 / 1024:8.1f} MiB")
+    del keep
+    return top
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare thread reconstruction with dicts and the tree index.")
+    parser.add_argument('--notes', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=500000)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rows = make_rows(args.notes, args.comments, args.seed)
+    print(f"{len(rows)} comments on up to {args.notes} notes")
+    dict_top = measure("dicts", dict_top_threads, rows, args.top)
+    tree_top = measure("tree index", tree_top_threads, rows, args.top)
+    # ties may come out in a different order, the reply counts must not
+    assert [replies for _, replies in dict_top] == [replies for _, replies in tree_top]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Size and speed of store.engagement_history on synthetic refreshes, comparing the bytes per
+# sample with
+#   full rows     what keeping every refresh of the note row would take (the row as JSON)
+#   fixed width   note index, minute and four counts as int64 / int32 without delta encoding
+# and timing the appends, one note's history query and a growth ranking over all notes.
+# Refreshes are spread like the recrawl scheduler's: fast growing notes are refreshed often.
+#
+#   python -m benchmarks.engagement_history --notes 1000000 --refreshes 10
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import json_codec
+from store.engagement_history import COLUMNS, EngagementHistory
+
+BASE_MS = 1685548800000
+
+
+def make_row(note_id: str, counts, time_ms: int):
+    return {
+        "note_id": note_id, "type": "normal", "title": "标题" * 8, "desc": "正文" * 60, "time": BASE_MS,
+        "last_update_time": BASE_MS, "user_id": "5f" * 12, "nickname": "用户", "avatar": "https://sns-avatar/" + "a" * 40,
+        "ip_location": "上海", "image_list": "https://sns-img/" + "b" * 60, "source_keyword": "健身",
+        "last_modify_ts": time_ms, **dict(zip(COLUMNS, counts)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engagement history size and query speed.")
+    parser.add_argument('--notes', type=int, default=200000)
+    parser.add_argument('--refreshes', type=int, default=10, help="mean refreshes per note")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    refreshes = np.minimum(rng.geometric(1 / args.refreshes, args.notes), args.refreshes * 20)
+    rate = rng.pareto(1.5, (args.notes, len(COLUMNS))) * np.array([20, 5, 2, 1])
+    order_rng = random.Random(args.seed)
+    # refresh rounds: every note with refreshes left is refreshed once per round, in random order
+    events = []
+    for round_index in range(int(refreshes.max())):
+        notes = np.nonzero(refreshes > round_index)[0].tolist()
+        order_rng.shuffle(notes)
+        events.append((round_index, notes))
+    samples = int(refreshes.sum())
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.ts")
+        history = EngagementHistory(path)
+        row_bytes = 0
+        begin = time.perf_counter()
+        for round_index, notes in events:
+            minutes = round_index * 37 + 1
+            for note in notes:
+                counts = (rate[note] * minutes / 60).astype(np.int64).tolist()
+                history.append(f"{note:024x}", BASE_MS + (minutes * 60 + note % 60) * 1000, counts)
+        cost = time.perf_counter() - begin
+        print(f"append    {samples:10d} samples  {cost:7.2f}s  {samples / cost:9.0f} samples/s")
+
+        # full rows are sampled, encoding every one would dominate the run
+        for note in range(0, args.notes, max(args.notes // 1000, 1)):
+            row_bytes += len(json_codec.dumps(make_row(f"{note:024x}", rate[note].astype(int).tolist(), BASE_MS)))
+        row_bytes = row_bytes / len(range(0, args.notes, max(args.notes // 1000, 1)))
+        size = history.file_size()
+        print(f"size      history {size / samples:6.1f} B/sample ({size / 1024 / 1024:.1f} MiB), "
+              f"fixed width {8 + 4 + 4 * len(COLUMNS)} B/sample, full rows {row_bytes:.0f} B/sample "
+              f"({row_bytes * samples / 1024 / 1024:.1f} MiB)")
+        history.close()
+
+        history = EngagementHistory(path, readonly=True)
+        query_rng = random.Random(args.seed)
+        picked = [f"{query_rng.randrange(args.notes):024x}" for _ in range(args.queries)]
+        begin = time.perf_counter()
+        returned = sum(len(history.history(note_id, BASE_MS, BASE_MS + 86400000 * 365)) for note_id in picked)
+        cost = time.perf_counter() - begin
+        print(f"history   {args.queries:10d} notes    {cost * 1000 / args.queries:7.3f} ms/query, "
+              f"{returned / args.queries:.1f} samples/query")
+
+        begin = time.perf_counter()
+        until = BASE_MS + int(refreshes.max()) * 37 * 60000
+        top = history.top_growth(BASE_MS, until, "liked_count", 10)
+        cost = time.perf_counter() - begin
+        print(f"growth    {len(history):10d} notes    {cost:7.2f}s  top note +{top[0]['liked_count_delta'] if top else 0} likes")
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Query latency of the local full-text index (store.fts) on synthetic notes and comments.
+# Builds a throwaway database with SqliteStore, the same write path the crawler uses, then
+# times a mix of bigram phrase, single character and multi term queries.
+#
+#   python -m benchmarks.fts_search --notes 200000 --comments 1000000
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from store.fts import search_comments, search_notes
+from store.sqlite_store import SqliteStore
+
+# a few recognisable words on top of a generated vocabulary with a Zipf-like frequency,
+# so common terms match many rows and rare ones few, as in real notes
+WORDS = ("健身", "减脂", "蛋白粉", "旗袍", "通勤", "露营", "攻略", "咖啡", "面试", "穿搭", "citywalk")
+QUERIES = ("健身", "蛋白粉", "健身 蛋白粉", "粉", "citywalk", "露营 咖啡", "面试 穿搭")
+
+
+def make_vocabulary(rng: random.Random, size: int):
+    words = list(WORDS)
+    while len(words) < size:
+        words.append("".join(chr(rng.randrange(0x4e00, 0x4e00 + 3000)) for _ in range(rng.choice((2, 2, 3)))))
+    rng.shuffle(words)
+    # cumulative, so random.choices does not rebuild them on every call
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    return words, cum_weights
+
+
+def sentence(rng: random.Random, vocabulary, words: int) -> str:
+    return "".join(rng.choices(vocabulary[0], cum_weights=vocabulary[1], k=words))
+
+
+def build(path: str, notes: int, comments: int, seed: int) -> float:
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, 20000)
+    store = SqliteStore(path, commit_every=10000)
+    begin = time.perf_counter()
+    for index in range(notes):
+        store.upsert_note({"note_id": f"n{index}", "title": sentence(rng, vocabulary, 3),
+                           "desc": sentence(rng, vocabulary, 20), "user_id": f"u{rng.randrange(notes // 10 + 1)}",
+                           "liked_count": rng.randrange(10000)})
+    for index in range(comments):
+        store.upsert_comment({"comment_id": f"c{index}", "note_id": f"n{rng.randrange(notes)}",
+                              "content": sentence(rng, vocabulary, 6)})
+    store.close()
+    return time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measure local full-text query latency.")
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=300000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "fts.db")
+        cost = build(path, args.notes, args.comments, args.seed)
+        rows = args.notes + args.comments
+        print(f"indexed {rows} rows in {cost:.1f}s ({rows / cost:.0f} rows/s), "
+              f"db size {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+        store = SqliteStore(path)
+        for name, search in (("notes", search_notes), ("comments", search_comments)):
+            for query in QUERIES:
+                latencies = []
+                for _ in range(args.repeat):
+                    begin = time.perf_counter()
+                    results = search(store.conn, query, args.limit)
+                    latencies.append((time.perf_counter() - begin) * 1000)
+                print(f"{name:<9}{query:<16}{len(results):>4} results  "
+                      f"p50 {statistics.median(latencies):7.2f} ms  max {max(latencies):7.2f} ms")
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Throughput of query_service.py on a synthetic database, with an in-process server:
+#   pages        walk /notes page by page with keyset pagination (after=<id>)
+#   revalidate   repeat a page request with If-None-Match, answered with 304 and no query
+#   export       stream every note as NDJSON
+#
+#   python -m benchmarks.query_service_load --notes 100000 --concurrency 20
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import tornado.httpserver
+import tornado.netutil
+from tornado.httpclient import AsyncHTTPClient
+
+from benchmarks.fts_search import build
+
+
+async def walk_pages(client: AsyncHTTPClient, base: str, limit: int, start_after: int) -> int:
+    requests, after = 0, start_after
+    while after is not None and requests < 50:
+        response = await client.fetch(f"{base}/notes?limit={limit}&after={after}")
+        after = json.loads(response.body)["next_after"]
+        requests += 1
+    return requests
+
+
+async def run(base: str, notes: int, concurrency: int, limit: int):
+    client = AsyncHTTPClient(max_clients=concurrency)
+
+    begin = time.perf_counter()
+    # every worker starts at a different offset, so the pages are spread over the table
+    counts = await asyncio.gather(*(walk_pages(client, base, limit, notes * index // concurrency)
+                                    for index in range(concurrency)))
+    elapsed = time.perf_counter() - begin
+    print(f"pages       {sum(counts) / elapsed:>10,.0f} req/s  ({sum(counts)} pages of {limit})")
+
+    response = await client.fetch(f"{base}/notes?limit={limit}")
+    etag = response.headers["Etag"]
+
+    async def revalidate():
+        for _ in range(100):
+            response = await client.fetch(f"{base}/notes?limit={limit}", headers={"If-None-Match": etag},
+                                          raise_error=False)
+            assert response.code == 304, response.code
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(revalidate() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - begin
+    print(f"revalidate  {100 * concurrency / elapsed:>10,.0f} req/s  (304 Not Modified)")
+
+    begin = time.perf_counter()
+    response = await client.fetch(f"{base}/notes?format=ndjson", request_timeout=600)
+    elapsed = time.perf_counter() - begin
+    rows = response.body.count(b"\n")
+    print(f"export      {rows / elapsed:>10,.0f} rows/s  ({rows} rows, {len(response.body) / 1024 / 1024:.1f} MiB)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="load test the read-only query service.")
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    import query_service
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "query.db")
+        build(path, args.notes, 0, seed=7)
+        sockets = tornado.netutil.bind_sockets(0, address="127.0.0.1")
+        server = tornado.httpserver.HTTPServer(query_service.Application(path, autoreload=False))
+        server.add_sockets(sockets)
+        await run(f"http://127.0.0.1:{sockets[0].getsockname()[1]}", args.notes, args.concurrency, args.limit)
+        server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
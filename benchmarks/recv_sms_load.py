@@ -0,0 +1,87 @@
+# Load generator for recv_sms_notification.py, reports req/s and latency percentiles.
+#
+# In-process (server and Redis stand-in started here):
+#   python -m benchmarks.recv_sms_load --requests 5000 --concurrency 100
+# Against a running server, e.g. the production mode with the in-process Redis stand-in:
+#   python recv_sms_notification.py --prod --processes 4 --redis memory://
+#   python -m benchmarks.recv_sms_load --url http://127.0.0.1:9435/
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List
+
+import tornado.netutil
+import tornado.httpserver
+from tornado.httpclient import AsyncHTTPClient
+
+
+def sms_body(phone_count: int) -> bytes:
+    return json.dumps({
+        "platform": "xhs",
+        "current_number": f"138{random.randrange(phone_count):08d}",
+        "from_number": "1069421xxx134",
+        "sms_content": f"【小红书】您的验证码是: {random.randrange(10 ** 6):06d}， 3分钟内有效。请勿向他人泄漏。",
+        "timestamp": str(int(time.time() * 1000)),
+    }, ensure_ascii=False).encode("utf-8")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_load(url: str, total: int, concurrency: int, phone_count: int):
+    client = AsyncHTTPClient(max_clients=concurrency)
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            begin = time.perf_counter()
+            response = await client.fetch(url, method="POST", body=sms_body(phone_count), raise_error=False)
+            latencies.append(time.perf_counter() - begin)
+            if response.code != 200:
+                errors += 1
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - begin
+    latencies.sort()
+    print(f"requests: {total}  concurrency: {concurrency}  errors: {errors}")
+    print(f"throughput: {total / elapsed:,.0f} req/s  ({elapsed:.2f}s)")
+    print("latency ms: " + "  ".join(
+        f"p{pct}={percentile(latencies, pct) * 1000:.2f}" for pct in (50, 90, 99, 100)
+    ))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="load test the SMS notification receiver.")
+    parser.add_argument('--url', type=str, help='target url, omit to start an in-process server')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--phones', type=int, default=50, help='distinct forwarding phones')
+    args = parser.parse_args()
+
+    url, server = args.url, None
+    if url is None:
+        import config
+        config.redis_db_host = "memory://"
+        import recv_sms_notification
+
+        sockets = tornado.netutil.bind_sockets(0, address="127.0.0.1")
+        server = tornado.httpserver.HTTPServer(recv_sms_notification.Application(autoreload=False))
+        server.add_sockets(sockets)
+        url = f"http://127.0.0.1:{sockets[0].getsockname()[1]}/"
+    await run_load(url, args.requests, args.concurrency, args.phones)
+    if server is not None:
+        server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
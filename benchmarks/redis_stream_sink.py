@@ -0,0 +1,122 @@
+# Throughput of publishing comments to a Redis stream (store.redis_stream), comparing
+#   per-item    one awaited XADD per comment, one round trip each
+#   sink        RedisStreamSink: bounded queue, pipelined XADD batches
+# against a real Redis (--url redis://...) or the in-process stand-in (memory://, the default),
+# which gets a simulated network round trip of --rtt milliseconds per command or pipeline.
+# The producer publishes as fast as the sink lets it; the sink's waits show the backpressure.
+#
+#   python -m benchmarks.redis_stream_sink --items 20000 --rtt 1
+#   python -m benchmarks.redis_stream_sink --url redis://127.0.0.1 --items 100000
+import argparse
+import asyncio
+import random
+import time
+
+import json_codec
+from memory_redis import MemoryRedis
+from redis_client import close_redis_clients, get_redis_client
+from store.redis_stream import COMMENTS, RedisStreamSink
+
+
+class SlowRedis:
+    """
+    MemoryRedis with a fixed delay per round trip: every command, or a whole pipeline.
+    """
+
+    def __init__(self, rtt: float):
+        self.redis = MemoryRedis()
+        self.rtt = rtt
+
+    async def xadd(self, *args, **kwargs):
+        await asyncio.sleep(self.rtt)
+        return await self.redis.xadd(*args, **kwargs)
+
+    async def xlen(self, name: str):
+        return await self.redis.xlen(name)
+
+    async def delete(self, *names: str):
+        return await self.redis.delete(*names)
+
+    def pipeline(self, transaction: bool = True):
+        pipe = self.redis.pipeline(transaction)
+        execute = pipe.execute
+
+        async def delayed_execute():
+            await asyncio.sleep(self.rtt)
+            return await execute()
+
+        pipe.execute = delayed_execute
+        return pipe
+
+    async def close(self):
+        pass
+
+
+def make_comments(count: int, seed: int):
+    rng = random.Random(seed)
+    return [{
+        "comment_id": f"{rng.getrandbits(96):024x}", "note_id": f"n{rng.randrange(1000)}",
+        "create_time": 1685548800000 + index, "ip_location": "上海", "content": "写得真好" * rng.randrange(1, 20),
+        "user_id": f"{rng.getrandbits(96):024x}", "nickname": "用户", "avatar": "", "sub_comment_count": "0",
+        "root_comment_id": "", "parent_comment_id": "", "last_modify_ts": 1685548800000,
+    } for index in range(count)]
+
+
+async def per_item(redis, stream: str, comments, maxlen: int):
+    for item in comments:
+        await redis.xadd(stream, {"id": item["comment_id"], "data": json_codec.dumps(item)},
+                         maxlen=maxlen, approximate=True)
+
+
+async def with_sink(redis, comments, args):
+    sink = RedisStreamSink(redis, prefix=args.prefix, maxlen=args.maxlen, batch_size=args.batch_size,
+                           flush_interval=args.flush_interval, max_pending=args.max_pending)
+    sink.start()
+    for item in comments:
+        await sink.publish(COMMENTS, item)
+    await sink.close()
+    return sink.report()
+
+
+async def run(args):
+    redis = SlowRedis(args.rtt / 1000) if args.url.startswith("memory://") else get_redis_client(args.url)
+    stream = f"{args.prefix}:{COMMENTS}"
+    comments = make_comments(args.items, args.seed)
+
+    await redis.delete(stream)
+    count = min(args.items, args.per_item_limit)
+    begin = time.perf_counter()
+    await per_item(redis, stream, comments[:count], args.maxlen)
+    cost = time.perf_counter() - begin
+    print(f"per-item  {count:8d} items  {cost:7.2f}s  {count / cost:9.0f} items/s")
+
+    await redis.delete(stream)
+    begin = time.perf_counter()
+    report = await with_sink(redis, comments, args)
+    cost = time.perf_counter() - begin
+    print(f"sink      {args.items:8d} items  {cost:7.2f}s  {args.items / cost:9.0f} items/s  "
+          f"{report['batches']} batches, mean {report['mean_batch_size']:.0f} rows "
+          f"{report['mean_batch_seconds'] * 1000:.1f} ms, max {report['max_batch_seconds'] * 1000:.1f} ms, "
+          f"producer waited {report['waits']} times {report['wait_seconds']:.2f}s")
+    assert await redis.xlen(stream) == min(args.items, args.maxlen)
+    await redis.delete(stream)
+    await close_redis_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare per-item XADD with the batched stream sink.")
+    parser.add_argument('--url', default="memory://", help="redis url, memory:// for the in-process stand-in")
+    parser.add_argument('--rtt', type=float, default=1.0, help="simulated round trip in ms (memory:// only)")
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--per_item_limit', type=int, default=2000, help="items for the slow per-item run")
+    parser.add_argument('--prefix', default="bench")
+    parser.add_argument('--maxlen', type=int, default=1000000)
+    parser.add_argument('--batch_size', type=int, default=500)
+    parser.add_argument('--flush_interval', type=float, default=0.2)
+    parser.add_argument('--max_pending', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Keeps an API client's cookies in step with the browser context.
+#
+# The client sends the cookies it was created with, but the site rotates some of them during a
+# long crawl (through Set-Cookie on the page's own requests, or script written cookies).
+# CookieSync copies browser_context.cookies() into the client (AbstractApiClient.update_cookies)
+#   - shortly after a response of the site's domain carries Set-Cookie, debounced so a burst of
+#     responses costs one read of the cookie jar
+#   - every `interval` seconds regardless, for cookies written by scripts
+# The client replaces its Cookie header and cookie_dict together and a signature reads both
+# once, so a request never goes out with half of the old and half of the new cookies.
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from playwright.async_api import BrowserContext, Response
+
+from base_client import AbstractApiClient
+
+logger = logging.getLogger("browser")
+
+
+class CookieSync:
+    def __init__(self, client: AbstractApiClient, domain: str, interval: float = 300, debounce: float = 1.0):
+        """
+        :param client: the client to keep up to date
+        :param domain: only Set-Cookie from responses of this domain trigger a sync
+        :param interval: seconds between unconditional syncs
+        :param debounce: seconds to wait after a Set-Cookie before reading the cookie jar
+        """
+        self.client = client
+        self.domain = domain
+        self.interval = interval
+        self.debounce = debounce
+        self.context: Optional[BrowserContext] = None
+        self._pending: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"syncs": 0, "updates": 0, "set_cookie_responses": 0, "failed": 0}
+
+    def attach(self, context: BrowserContext):
+        """
+        Follow this context from now on, e.g. after the old one was recycled.
+        """
+        if self.context is not None:
+            self.context.remove_listener("response", self._on_response)
+        self.context = context
+        context.on("response", self._on_response)
+
+    async def _on_response(self, response: Response):
+        if self.domain not in response.url:
+            return
+        try:
+            set_cookie = await response.header_value("set-cookie")
+        except Exception:
+            # the page or context is closing
+            return
+        if set_cookie:
+            self.stats["set_cookie_responses"] += 1
+            self.schedule()
+
+    def schedule(self):
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.create_task(self._sync_later())
+
+    async def _sync_later(self):
+        await asyncio.sleep(self.debounce)
+        await self.sync()
+
+    async def sync(self) -> bool:
+        """
+        Copy the context's cookies into the client. True when they had changed.
+        """
+        async with self._lock:
+            context = self.context
+            if context is None:
+                return False
+            self.stats["syncs"] += 1
+            try:
+                cookies = await context.cookies()
+            except Exception as ex:
+                self.stats["failed"] += 1
+                logger.warning("cookie sync failed", extra={"fields": {"error": repr(ex)}})
+                return False
+            if context is not self.context:
+                # recycled while reading, the next sync reads the new context
+                return False
+            changed = self.client.update_cookies(cookies)
+            if changed:
+                self.stats["updates"] += 1
+            return changed
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        for task in (self._task, self._pending):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._pending = None
+        if self.context is not None:
+            self.context.remove_listener("response", self._on_response)
+            self.context = None
@@ -0,0 +1,181 @@
+# Memory and signing-latency watchdog for the crawler's long-lived browser.
+#
+# Every `interval` seconds it samples
+#   page heap     JS heap of the signing page (CDP Performance.getMetrics, Chromium only)
+#   browser rss   resident memory of the Playwright driver and the browser processes it started,
+#                 from /proc (Linux); other children of the crawler, like ImageDedup's hashing
+#                 processes, are not counted
+#   sign latency  mean signing time of the client since the previous check (client.stats)
+# and recycles what grew too much, without stopping the crawl:
+#   recycle_page()      a fresh signing page in the same context, for a heap or latency overrun
+#   recycle_context()   a fresh context from the saved storage state, for an RSS overrun, or
+#                       when the page was just recycled and is still over its limit
+# Both callbacks come from the spider, which knows how its pages are set up; they warm the new
+# page up and swap it into the client (AbstractApiClient.swap_page) so in-flight signing
+# finishes on the old page before it is closed.
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from playwright.async_api import CDPSession, Page
+
+from base_client import AbstractApiClient
+
+logger = logging.getLogger("browser")
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _read_ppid(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # the command name may contain spaces and parentheses, the fields after it do not
+    return int(stat[stat.rindex(")") + 2:].split()[1])
+
+
+def _is_playwright_driver(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except OSError:
+        return False
+    return b"playwright" in cmdline and b"run-driver" in cmdline
+
+
+def process_tree_rss(root_pid: int) -> Optional[int]:
+    """
+    Resident bytes of the Playwright drivers started by root_pid and all their descendants (the
+    browser processes). Other children of root_pid, e.g. ProcessPoolExecutor workers, are left
+    out. None where /proc is not available.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    children: Dict[int, list] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            ppid = _read_ppid(int(entry))
+            if ppid is not None:
+                children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    stack = [pid for pid in children.get(root_pid, []) if _is_playwright_driver(pid)]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            # exited meanwhile
+            continue
+    return total
+
+
+class BrowserHealthMonitor:
+    def __init__(self, client: AbstractApiClient, recycle_page: Callable[[], Awaitable[None]],
+                 recycle_context: Callable[[], Awaitable[None]], interval: float = 60,
+                 page_heap_limit_mb: float = 512, rss_limit_mb: float = 2048, sign_latency_limit: float = 1.0):
+        """
+        :param client: the client whose playwright_page is watched and whose stats give the sign latency
+        :param recycle_page: replaces the signing page
+        :param recycle_context: replaces the browser context and its page
+        :param interval: seconds between checks
+        :param page_heap_limit_mb: JS heap of the signing page that triggers a page recycle
+        :param rss_limit_mb: RSS of all browser processes that triggers a context recycle
+        :param sign_latency_limit: mean seconds per signature that triggers a page recycle
+        """
+        self.client = client
+        self.recycle_page = recycle_page
+        self.recycle_context = recycle_context
+        self.interval = interval
+        self.page_heap_limit = page_heap_limit_mb * 1024 * 1024
+        self.rss_limit = rss_limit_mb * 1024 * 1024
+        self.sign_latency_limit = sign_latency_limit
+        self._cdp_page: Optional[Page] = None
+        self._cdp_session: Optional[CDPSession] = None
+        self._last_signs = (0, 0.0)
+        self._last_action: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self.metrics: Dict = {}
+        self.stats: Dict[str, int] = {"checks": 0, "page_recycles": 0, "context_recycles": 0, "failed_recycles": 0}
+
+    async def page_heap(self) -> Optional[float]:
+        page = self.client.playwright_page
+        try:
+            if page is not self._cdp_page:
+                # a new page needs its own CDP session
+                self._cdp_session = await page.context.new_cdp_session(page)
+                await self._cdp_session.send("Performance.enable")
+                self._cdp_page = page
+            result = await self._cdp_session.send("Performance.getMetrics")
+        except Exception:
+            self._cdp_page = self._cdp_session = None
+            return None
+        metrics = {metric["name"]: metric["value"] for metric in result.get("metrics", [])}
+        return metrics.get("JSHeapUsedSize")
+
+    def sign_latency(self) -> Optional[float]:
+        signs, sign_seconds = self.client.stats["signs"], self.client.stats["sign_seconds"]
+        last_signs, last_seconds = self._last_signs
+        self._last_signs = (signs, sign_seconds)
+        if signs == last_signs:
+            return None
+        return (sign_seconds - last_seconds) / (signs - last_signs)
+
+    async def check(self) -> Optional[str]:
+        """
+        Take one sample, return the recycle it calls for: "context", "page" or None.
+        """
+        self.stats["checks"] += 1
+        heap = await self.page_heap()
+        rss = process_tree_rss(os.getpid())
+        latency = self.sign_latency()
+        self.metrics = {"page_heap_mb": heap and heap / 1024 / 1024, "browser_rss_mb": rss and rss / 1024 / 1024,
+                        "sign_latency": latency, "at": time.time()}
+        page_over = (heap is not None and heap > self.page_heap_limit) or \
+                    (latency is not None and latency > self.sign_latency_limit)
+        if rss is not None and rss > self.rss_limit:
+            return "context"
+        if page_over:
+            # a page that is over its limit right after being recycled will not get better by another page
+            return "context" if self._last_action == "page" else "page"
+        return None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            action = await self.check()
+            self._last_action = action
+            if action is None:
+                continue
+            logger.warning(f"browser over its limits, recycling the {action}", extra={"fields": self.metrics})
+            try:
+                if action == "page":
+                    await self.recycle_page()
+                else:
+                    await self.recycle_context()
+            except Exception as ex:
+                # the old page keeps signing, try again at the next check
+                self.stats["failed_recycles"] += 1
+                logger.warning(f"{action} recycle failed", extra={"fields": {"error": repr(ex)}})
+                continue
+            self.stats[f"{action}_recycles"] += 1
+            # the sign latency of the old page says nothing about the new one
+            self._last_signs = (self.client.stats["signs"], self.client.stats["sign_seconds"])
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
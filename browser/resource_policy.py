@@ -0,0 +1,44 @@
+# Request interception for the crawler's browser context.
+#
+# The browser is only kept for logging in and for the page's signing functions
+# (window._webmsxyw, the douyin X-Bogus lib), so images, video, fonts and tracking requests
+# it would otherwise download are aborted before they leave the browser. Scripts, documents
+# and XHR/fetch always go through: signing and the login flow need them. Data URLs (the login
+# QR code) are never routed. install() registers one route for every url on the context, so
+# pages opened later are covered too.
+from typing import Dict, Iterable
+
+from playwright.async_api import BrowserContext, Route
+
+# Playwright request.resource_type values signing and login do not need
+DEFAULT_BLOCKED_TYPES = ("image", "media", "font", "texttrack", "manifest")
+
+
+class ResourcePolicy:
+    def __init__(self, blocked_types: Iterable[str] = DEFAULT_BLOCKED_TYPES, blocked_url_keywords: Iterable[str] = ()):
+        """
+        :param blocked_types: resource types that are aborted
+        :param blocked_url_keywords: requests whose url contains one of these are aborted whatever their type
+        """
+        self.blocked_types = frozenset(blocked_types)
+        self.blocked_url_keywords = tuple(blocked_url_keywords)
+        self.stats: Dict[str, int] = {"allowed": 0, "blocked": 0}
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        return resource_type in self.blocked_types or any(keyword in url for keyword in self.blocked_url_keywords)
+
+    async def _handle(self, route: Route):
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            self.stats["blocked"] += 1
+            self.stats[f"blocked_{request.resource_type}"] = self.stats.get(f"blocked_{request.resource_type}", 0) + 1
+            await route.abort("blockedbyclient")
+        else:
+            self.stats["allowed"] += 1
+            await route.continue_()
+
+    async def install(self, context: BrowserContext):
+        await context.route("**/*", self._handle)
+
+    async def uninstall(self, context: BrowserContext):
+        await context.unroute("**/*", self._handle)
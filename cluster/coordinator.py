@@ -0,0 +1,40 @@
+# Coordinator: seeds the keyword queue, returns expired leases to the queues and reports
+# progress until every queued item has been acknowledged (or dead-lettered) by the workers.
+import asyncio
+import logging
+from typing import List
+
+from cluster.worker import cluster_queues
+
+logger = logging.getLogger("cluster")
+
+
+async def run_coordinator(keywords: List[str], check_interval: float = 5):
+    keyword_queue, note_queue = cluster_queues()
+    queues = (keyword_queue, note_queue)
+    unfinished = [await queue.unfinished() for queue in queues]
+    if not any(unfinished):
+        # the previous run is finished: a new run crawls the notes it saw again
+        for queue in queues:
+            await queue.reset()
+    added = await keyword_queue.enqueue(*keywords)
+    logger.info(f"coordinator enqueued {added} keywords", extra={"fields": {"keywords": keywords}})
+    while True:
+        await asyncio.sleep(check_interval)
+        for queue in queues:
+            requeued = await queue.requeue_expired()
+            if requeued:
+                logger.warning(f"{queue.name}: requeued {len(requeued)} expired leases")
+        keyword_sizes = await keyword_queue.size()
+        note_sizes = await note_queue.size()
+        logger.info("queue sizes", extra={"fields": {
+            "keywords_pending_leased": keyword_sizes, "notes_pending_leased": note_sizes
+        }})
+        if sum(keyword_sizes) + sum(note_sizes) == 0:
+            for queue in queues:
+                dead = await queue.dead()
+                if dead:
+                    logger.warning(f"{queue.name}: {len(dead)} items failed too often",
+                                   extra={"fields": {"dead_key": queue.dead_key, "items": dead[:20]}})
+            logger.info("all work acknowledged, coordinator exit")
+            return
@@ -0,0 +1,29 @@
+# Request rate limit shared by every worker through Redis.
+# Fixed one-second windows: each request INCRs the counter of the current window, and a
+# caller that lands over the limit sleeps until the next window starts.
+import asyncio
+import time
+
+
+class RedisRateLimiter:
+    def __init__(self, redis, key: str, rate: int):
+        """
+        :param redis: client from redis_client.get_redis_client
+        :param key: counter prefix, all processes limited together must use the same key
+        :param rate: allowed requests per second across all processes
+        """
+        self.redis = redis
+        self.key = key
+        self.rate = rate
+
+    async def acquire(self):
+        while True:
+            now = time.time()
+            window = int(now)
+            window_key = f"{self.key}:{window}"
+            count = await self.redis.incr(window_key)
+            if count == 1:
+                await self.redis.expire(window_key, 2)
+            if count <= self.rate:
+                return
+            await asyncio.sleep(window + 1 - now)
@@ -0,0 +1,147 @@
+# Redis backed work queue with visibility timeouts, shared by the coordinator and the
+# crawl workers (python main.py --crawler_type coordinator|worker).
+#
+# Keys for a queue named `name`:
+#   <name>:pending   list, producers LPUSH, workers pop from the tail (FIFO)
+#   <name>:leased    list of items handed out to a worker and not yet acknowledged
+#   <name>:deadline  zset item -> unix time when the lease expires
+#   <name>:seen      set of the items enqueued with dedupe=True in this run, expires `seen_ttl`
+#                    seconds after the last enqueue; reset() clears it for a new run
+#   <name>:info      hash item -> info given at enqueue (e.g. the keyword that found a note)
+#   <name>:attempts  hash item -> leases of the item that ended without an ack
+#   <name>:dead      list of items that failed `max_attempts` times (dead letters)
+#
+# A lease is BRPOPLPUSH pending -> leased (atomic, so an item is never lost) followed by
+# ZADD of its deadline. Items whose deadline passed, or which never got one because the
+# worker died in between, are pushed back to pending by requeue_expired(). A worker that
+# fails an item hands it back with fail(). Either way the attempt is counted, and an item
+# that keeps failing goes to the dead-letter list instead of being leased forever.
+import time
+from typing import List, Optional
+
+
+class WorkQueue:
+    def __init__(self, redis, name: str, visibility_timeout: int = 300, max_attempts: int = 3,
+                 seen_ttl: int = 7 * 86400):
+        self.redis = redis
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.seen_ttl = seen_ttl
+        self.pending_key = f"{name}:pending"
+        self.leased_key = f"{name}:leased"
+        self.deadline_key = f"{name}:deadline"
+        self.seen_key = f"{name}:seen"
+        self.info_key = f"{name}:info"
+        self.attempts_key = f"{name}:attempts"
+        self.dead_key = f"{name}:dead"
+
+    async def enqueue(self, *items: str, dedupe: bool = False, info: Optional[str] = None) -> int:
+        """
+        Add items to the queue, with dedupe=True items enqueued before in this run are skipped.
+        info is kept for each item (the first one given wins) and read back with info().
+        Returns the number of items actually added.
+        """
+        added = 0
+        for item in items:
+            if dedupe and not await self.redis.sadd(self.seen_key, item):
+                continue
+            if info is not None:
+                await self.redis.hsetnx(self.info_key, item, info)
+            await self.redis.lpush(self.pending_key, item)
+            added += 1
+        if dedupe and items:
+            await self.redis.expire(self.seen_key, self.seen_ttl)
+        return added
+
+    async def info(self, item: str) -> Optional[str]:
+        return await self.redis.hget(self.info_key, item)
+
+    async def lease(self, timeout: Optional[int] = 5) -> Optional[str]:
+        """
+        Block up to `timeout` seconds for an item (timeout=None returns at once). The caller
+        owns it until the visibility timeout passes; call ack() when done or extend() to keep
+        working on it.
+        """
+        if timeout is None:
+            item = await self.redis.rpoplpush(self.pending_key, self.leased_key)
+        else:
+            item = await self.redis.brpoplpush(self.pending_key, self.leased_key, timeout=timeout)
+        if item is None:
+            return None
+        await self.redis.zadd(self.deadline_key, {item: time.time() + self.visibility_timeout})
+        return item
+
+    async def extend(self, item: str):
+        await self.redis.zadd(self.deadline_key, {item: time.time() + self.visibility_timeout})
+
+    async def ack(self, item: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await pipe.lrem(self.leased_key, 1, item).zrem(self.deadline_key, item) \
+                .hdel(self.attempts_key, item).hdel(self.info_key, item).execute()
+
+    async def _retry_or_bury(self, item: str, front: bool) -> bool:
+        # the caller already took the item off the leased list
+        await self.redis.zrem(self.deadline_key, item)
+        attempts = await self.redis.hincrby(self.attempts_key, item, 1)
+        if attempts >= self.max_attempts:
+            await self.redis.hdel(self.attempts_key, item)
+            await self.redis.lpush(self.dead_key, item)
+            return True
+        if front:
+            await self.redis.rpush(self.pending_key, item)
+        else:
+            await self.redis.lpush(self.pending_key, item)
+        return False
+
+    async def fail(self, item: str) -> bool:
+        """
+        Give back a leased item that failed: it is retried after the items already pending, or moved
+        to the dead-letter list once it failed max_attempts times. Returns True if it was dead-lettered.
+        """
+        if not await self.redis.lrem(self.leased_key, 1, item):
+            # the lease expired meanwhile and was requeued (and counted) by requeue_expired
+            return False
+        return await self._retry_or_bury(item, front=False)
+
+    async def requeue_expired(self) -> List[str]:
+        """
+        Return expired leases to the pending list. Safe to run from several processes:
+        LREM removes the item at most once, so only one of them requeues it.
+        """
+        now = time.time()
+        requeued = []
+        for item in await self.redis.lrange(self.leased_key, 0, -1):
+            deadline = await self.redis.zscore(self.deadline_key, item)
+            if deadline is None:
+                # leased but the worker died before recording a deadline, give it one full timeout
+                await self.redis.zadd(self.deadline_key, {item: now + self.visibility_timeout})
+                continue
+            if deadline > now:
+                continue
+            if await self.redis.lrem(self.leased_key, 1, item):
+                # a worker that died on the item counts as a failed attempt
+                if not await self._retry_or_bury(item, front=True):
+                    requeued.append(item)
+        return requeued
+
+    async def size(self):
+        """
+        (pending, leased) item counts.
+        """
+        return await self.redis.llen(self.pending_key), await self.redis.llen(self.leased_key)
+
+    async def unfinished(self) -> int:
+        """
+        Items not acknowledged yet, pending and leased together.
+        """
+        return sum(await self.size())
+
+    async def dead(self) -> List[str]:
+        return await self.redis.lrange(self.dead_key, 0, -1)
+
+    async def reset(self):
+        """
+        Forget the seen items, infos and attempt counts of the previous run. Dead letters are kept.
+        """
+        await self.redis.delete(self.seen_key, self.info_key, self.attempts_key)
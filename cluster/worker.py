@@ -0,0 +1,89 @@
+# Crawl worker: leases keywords and note ids from the shared queues, crawls them with its
+# own logged-in spider session and acknowledges each item once it is fully stored.
+import asyncio
+import contextlib
+import logging
+
+import config
+from cluster.rate_limiter import RedisRateLimiter
+from cluster.work_queue import WorkQueue
+from exception import DataFetchError
+from redis_client import get_redis_client
+
+logger = logging.getLogger("cluster")
+
+
+def cluster_queues(redis=None):
+    """
+    (keyword queue, note queue) shared by the coordinator and all workers.
+    """
+    redis = redis or get_redis_client()
+    prefix = config.cluster_queue_prefix
+    options = dict(visibility_timeout=config.cluster_visibility_timeout, max_attempts=config.cluster_max_attempts,
+                   seen_ttl=config.cluster_seen_ttl)
+    return WorkQueue(redis, f"{prefix}:keywords", **options), WorkQueue(redis, f"{prefix}:notes", **options)
+
+
+async def _keep_leased(queue: WorkQueue, item: str):
+    # renew the lease well before it expires while the item is still being crawled
+    while True:
+        await asyncio.sleep(queue.visibility_timeout / 3)
+        await queue.extend(item)
+
+
+async def _process(queue: WorkQueue, item: str, handler) -> bool:
+    heartbeat = asyncio.create_task(_keep_leased(queue, item))
+    try:
+        await handler(item)
+    except Exception as ex:
+        failed = ex
+    else:
+        failed = None
+    finally:
+        heartbeat.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await heartbeat
+    if failed is None:
+        await queue.ack(item)
+        return True
+    # back to the queue for another try, or to the dead-letter list after max_attempts failures
+    dead = await queue.fail(item)
+    logger.warning("worker item failed", extra={"fields": {
+        "queue": queue.name, "item": item, "error": repr(failed), "dead_lettered": dead
+    }})
+    return False
+
+
+async def run_worker(spider, lease_timeout: int = 5):
+    """
+    Worker loop for a logged-in spider. Note items are preferred over keywords so the
+    queue of discovered notes drains before more searches add to it.
+    """
+    redis = get_redis_client()
+    keyword_queue, note_queue = cluster_queues(redis)
+    spider.xhs_client.rate_limiter = RedisRateLimiter(
+        redis, f"{config.cluster_queue_prefix}:rate", config.cluster_rate_limit
+    )
+
+    async def crawl_keyword(keyword: str):
+        note_ids = await spider.search_note_ids(keyword, max_note_len=config.cluster_max_notes_per_keyword)
+        # the keyword travels with the note id, so the stored note keeps its source_keyword
+        added = await note_queue.enqueue(*note_ids, dedupe=True, info=keyword)
+        logger.info("keyword searched", extra={"fields": {"keyword": keyword, "notes": len(note_ids), "new": added}})
+
+    async def crawl_note(note_id: str):
+        source_keyword = await note_queue.info(note_id)
+        if await spider.get_note_detail(note_id, source_keyword=source_keyword) is None:
+            # the spider logs and swallows fetch errors; failing here retries the note or dead-letters it
+            raise DataFetchError(f"note detail {note_id} not fetched")
+        await spider.get_comments(note_id)
+
+    logger.info("worker started, waiting for work ...")
+    while True:
+        note_id = await note_queue.lease(timeout=None)
+        if note_id is not None:
+            await _process(note_queue, note_id, crawl_note)
+            continue
+        keyword = await keyword_queue.lease(timeout=lease_timeout)
+        if keyword is not None:
+            await _process(keyword_queue, keyword, crawl_keyword)
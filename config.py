@@ -8,5 +8,125 @@ xhs_url = (
     "https://edith.xiaohongshu.com",              # host
 )
 
+dy_url = (
+    "https://www.douyin.com",                     # 首页
+    "https://www.douyin.com",                     # host
+)
+dy_storage_state_path = "browser_data/dy_storage_state.json"
+dy_qrcode_path = "browser_data/dy_login_qrcode.png"
+# 每个关键词最多抓取的视频数
+dy_max_videos_per_keyword = 20
+# 抖音所有请求合计的预算，每秒最多请求数
+dy_request_rate = 1.0
+# 等待抖音扫码登录完成的最长秒数
+dy_login_timeout = 120
+# 抖音是否翻页抓取评论的回复（--sub_comments）
+dy_fetch_sub_comments = False
+
+# 登录成功后保存浏览器的 storage state（cookies + localStorage），下次启动直接复用，置空则不保存
+xhs_storage_state_path = "browser_data/xhs_storage_state.json"
+# 扫码登录的二维码图片保存位置
+xhs_qrcode_path = "browser_data/xhs_login_qrcode.png"
+# 等待扫码/短信登录完成的最长秒数
+xhs_login_timeout = 120
+
 redis_db_host = "redis://127.0.0.1"
-redis_db_pwd = "123456"
\ No newline at end of file
+redis_db_pwd = "123456"
+
+# 分布式爬取：协调者和 worker 通过 Redis 队列协作
+cluster_queue_prefix = "xhs"
+# worker 领取任务后多少秒内没有确认完成，任务会重新回到队列
+cluster_visibility_timeout = 300
+# 所有 worker 合计每秒最多请求数
+cluster_rate_limit = 2
+# 每个关键词最多抓取的笔记数
+cluster_max_notes_per_keyword = 20
+# 一个任务失败（或 worker 处理时退出）多少次后移入死信列表 <prefix>:<队列>:dead，不再重试
+cluster_max_attempts = 3
+# 已入队笔记的去重集合保留多少秒；协调者开始新一轮时会清空
+cluster_seen_ttl = 7 * 86400
+
+# 下载笔记的图片/视频（--download_media），按 file_id/trace_id 去重存放
+media_dir = "data/media"
+# 同时下载的文件数
+media_download_concurrency = 4
+# 对下载的图片计算感知哈希，标记不同 file_id 的重复图片（--dedup_images）
+# 汉明距离不超过该值视为重复
+image_dedup_max_distance = 6
+# 计算哈希的进程数，None 表示 CPU 核数
+image_dedup_processes = None
+
+# 持续监控模式（--crawler_type recrawl）：按笔记互动数的增长速度安排刷新时间
+# 单篇笔记最短、最长刷新间隔（秒）
+recrawl_min_interval = 600
+recrawl_max_interval = 86400
+# 期望每次刷新能观察到的加权互动增量，增长越快的笔记刷新越频繁
+recrawl_target_change = 50
+# 全局请求预算，每秒最多请求数
+recrawl_request_rate = 1.0
+# 同时刷新的笔记数
+recrawl_concurrency = 2
+# 监控状态保存位置，重启后继续
+recrawl_state_path = "data/recrawl_state.json"
+
+# 批量抓评论时同时工作的 worker 数，评论数多的笔记优先
+comment_crawl_concurrency = 4
+# 是否翻页抓取子评论（--sub_comments），子评论多的楼层会拆成单独任务并行抓取
+xhs_fetch_sub_comments = False
+
+# 首页频道模式（--crawler_type homefeed）：同时抓取的频道，取 FeedType 的成员名
+homefeed_channels = ("recommend", "food", "travel", "fitness")
+# 每个频道翻多少页
+homefeed_pages_per_channel = 5
+# 所有频道合计的请求预算，每秒最多请求数
+homefeed_request_rate = 2.0
+
+# 浏览器只用来登录和计算签名：开启后（--block_resources）拦截签名用不到的请求，省带宽和浏览器 CPU
+browser_block_resources = False
+# 拦截的资源类型（Playwright 的 request.resource_type），脚本、文档和接口请求始终放行
+browser_blocked_resource_types = ("image", "media", "font", "texttrack", "manifest")
+# url 包含这些关键字的请求（埋点、性能上报）不论类型都拦截
+browser_blocked_url_keywords = ("apm-fe.xiaohongshu.com", "t2.xiaohongshu.com", "mcs.snssdk.com", "mon.zijieapi.com")
+
+# 长时间运行时每隔多少秒检查一次浏览器内存和签名耗时，超限时不停止爬虫地重建签名页面或浏览器上下文，0 表示不检查
+browser_health_check_interval = 60
+# 签名页面的 JS 堆超过多少 MB 时重建页面
+browser_page_heap_limit_mb = 512
+# 浏览器所有进程合计的常驻内存超过多少 MB 时重建整个上下文（从保存的登录态恢复）
+browser_rss_limit_mb = 2048
+# 两次检查之间平均每次签名超过多少秒时重建页面
+browser_sign_latency_limit = 1.0
+
+# 网站在运行中会更新部分 cookies：页面响应带 Set-Cookie 时随即把浏览器的 cookies 同步给请求客户端，
+# 另外每隔多少秒无条件同步一次（0 表示不同步）
+cookie_sync_interval = 300
+
+# 批量模式（--batch）：抓取完成后退出，不再保持浏览器打开；收到 SIGTERM/SIGINT 时已经发出的请求最多再等多少秒
+batch_mode = False
+batch_drain_timeout = 30
+
+# 接口响应和保存数据用的 JSON 库：auto 按 orjson、msgspec、标准库 json 的顺序取第一个已安装的，也可以指定其中一个
+json_codec = "auto"
+
+# 爬虫日志：级别（--log_level），逐条笔记/评论的 debug 日志每多少条输出一条（--log_sample_every），1 表示全部输出
+log_level = "INFO"
+log_sample_every = 100
+
+# 抓取到的笔记和评论保存到本地 SQLite，并建立全文索引（python -m store.fts 关键词）
+sqlite_db_path = "data/crawler.db"
+# 每写入多少行提交一次事务
+sqlite_commit_every = 100
+# 同时把笔记和评论实时写入 Redis Streams（--stream_output），使用上面的 redis_db_host：
+# 流名为 <prefix>:notes 和 <prefix>:comments，每个流大约保留 maxlen 条
+redis_stream_output = False
+redis_stream_prefix = "xhs"
+redis_stream_maxlen = 1000000
+# 每批最多多少条、第一条最多等多少秒凑批，一批用一次管道往返写入
+redis_stream_batch_size = 500
+redis_stream_flush_interval = 0.2
+# 排队等待写入的条数上限，Redis 变慢时写满后爬虫等待
+redis_stream_max_pending = 5000
+# 每次刷新笔记时记录点赞、收藏、评论、分享数的历史（python -m store.engagement_history 查询），留空不记录
+engagement_history_path = "data/engagement_history.ts"
+# 只读查询服务（python query_service.py）的端口
+query_service_port = 9436
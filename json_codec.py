@@ -0,0 +1,121 @@
+# JSON encoding and decoding for the API clients and the stores, on the fastest library installed.
+#
+#   orjson    orjson.dumps/loads
+#   msgspec   msgspec.json Encoder/Decoder
+#   json      the standard library, always available
+# config.json_codec picks one by name, "auto" takes the first of these that imports.
+#
+#   loads(data)         decodes bytes (response.content) or str; the fast libraries parse the bytes
+#                       directly instead of decoding them to a str first as response.json() does
+#   dumps(obj)          compact UTF-8 bytes, non-ASCII kept, for storing and publishing items
+#   dumps_body(obj)     the POST body of a signed request, byte for byte what
+#                       json.dumps(obj, separators=(',', ':'), ensure_ascii=False) encodes to
+#
+# The fast libraries write floats differently (1e16 instead of 1e+16) and refuse some values the
+# standard library accepts (non-str keys, ints over 64 bits, lone surrogates). dumps_body therefore
+# hands bodies with floats to the standard library, and every function retries with the standard
+# library when the fast one raises, so errors and edge cases behave as they did with json alone.
+# orjson decodes ints over 64 bits to float; msgspec and json keep them exact.
+import json
+from typing import Any, Union
+
+import config
+
+DEFAULT_ORDER = ("orjson", "msgspec", "json")
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode("utf-8")
+
+
+def _has_float(obj: Any) -> bool:
+    if isinstance(obj, float):
+        return True
+    if isinstance(obj, dict):
+        return any(_has_float(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_float(value) for value in obj)
+    return False
+
+
+class JsonCodec:
+    """
+    The standard library json. The fast codecs override _loads/_dumps and fall back to this class.
+    """
+    name = "json"
+
+    def _loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def _dumps(self, obj: Any) -> bytes:
+        return _json_dumps(obj)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._loads(data)
+        except Exception:
+            # invalid JSON raises json.JSONDecodeError here, whatever the library
+            return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._dumps(obj)
+        except Exception:
+            return _json_dumps(obj)
+
+    def dumps_body(self, obj: Any) -> bytes:
+        if _has_float(obj):
+            return _json_dumps(obj)
+        return self.dumps(obj)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def _loads(self, data: Union[bytes, str]) -> Any:
+        return self._orjson.loads(data)
+
+    def _dumps(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def _loads(self, data: Union[bytes, str]) -> Any:
+        return self._decoder.decode(data)
+
+    def _dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+
+CODECS = {"orjson": OrjsonCodec, "msgspec": MsgspecCodec, "json": JsonCodec}
+
+
+def get_codec(name: str = "auto") -> JsonCodec:
+    """
+    The codec called name, or with "auto" the first of DEFAULT_ORDER that is installed.
+    """
+    if name != "auto":
+        return CODECS[name]()
+    for candidate in DEFAULT_ORDER:
+        try:
+            return CODECS[candidate]()
+        except ImportError:
+            continue
+    return JsonCodec()
+
+
+codec = get_codec(config.json_codec)
+loads = codec.loads
+dumps = codec.dumps
+dumps_body = codec.dumps_body
@@ -0,0 +1,109 @@
+# Logging setup shared by the crawler and the helper services.
+# Loggers only put records on a queue (QueueHandler); a QueueListener thread formats and
+# writes them, so slow or piped stdout/stderr never blocks the asyncio event loop.
+# Per-item messages (one per note, comment, download ...) are logged at debug level with
+# extra={"sample": True}; with sample_every=N only every Nth of each such message is queued,
+# so turning debug on does not make a crawl wait for its own log output.
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict, Optional, TextIO, Tuple
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line; structured values passed as extra={"fields": {...}} become keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Human readable line with structured values appended as key=value pairs.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes every `every`th record of each per-item message (extra={"sample": True}), counted per
+    logger and message template; other records always pass. Passed records get a sample_every field.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1 or not getattr(record, "sample", False):
+            return True
+        key = (record.name, str(record.msg))
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.every:
+            self.dropped += 1
+            return False
+        record.fields = {**(getattr(record, "fields", None) or {}), "sample_every": self.every}
+        return True
+
+
+def setup_logging(level: str = "INFO", json_format: bool = False, stream: Optional[TextIO] = None,
+                  sample_every: int = 1):
+    """
+    Route all logging through a queue drained by a background thread.
+    Calling it again replaces the previous setup.
+    """
+    global _listener
+    stop_logging()
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else KeyValueFormatter())
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # sampled out records are dropped before they are formatted and queued
+    queue_handler.addFilter(SamplingFilter(sample_every))
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+
+
+def stop_logging():
+    """
+    Flush queued records and stop the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
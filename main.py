@@ -1,18 +1,48 @@
 import asyncio
 import argparse
 import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import List, Tuple
 
 import config
-from media_platform.xhs.spider import XiaoHongShuSpider
+from logger import setup_logging
+
+
+class StartupProfiler:
+    """
+    记录启动各阶段耗时，通过 --startup-profile 开启
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.records: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def measure(self, stage: str):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append((stage, time.perf_counter() - begin))
+
+    def report(self):
+        print("startup profile:")
+        for stage, cost in self.records:
+            print(f"  {stage:<24}{cost * 1000:>10.1f} ms")
+        print(f"  {'total':<24}{(time.perf_counter() - self._origin) * 1000:>10.1f} ms")
 
 
 class CrawlerFactory:
     @staticmethod
     def get_crawler(platform: str):
+        # 平台模块在这里才导入，命令行参数错误时不必加载 playwright 等重依赖
         if platform == "xhs":
+            from media_platform.xhs.spider import XiaoHongShuSpider
             return XiaoHongShuSpider()
         elif platform == "dy":
-            pass
+            from media_platform.douyin.spider import DouYinSpider
+            return DouYinSpider()
         else:
             raise ValueError("invalid short video platform  currently only supported xhs or dy...")
 
@@ -25,19 +55,81 @@ async def main():
     parser.add_argument('--lt', type=str, help="login type qrcode or phone", default=config.login_type[0])
     parser.add_argument('--web_session', type=str, help='cookies to keep login', default=config.login_web_session)
     parser.add_argument('--phone', type=str, help='login phone', default=config.login_phone)
+    parser.add_argument('--crawler_type', type=str, default="search",
+                        choices=("search", "homefeed", "recrawl", "coordinator", "worker"),
+                        help="search: crawl in this process; homefeed: crawl feed channels; "
+                             "recrawl: keep refreshing known notes; coordinator/worker: distributed crawl over redis")
+    parser.add_argument('--feeds', type=str, default=",".join(config.homefeed_channels),
+                        help="homefeed channels, comma separated FeedType names (recommend,food,travel,...)")
+    parser.add_argument('--storage_state', type=str, default=None,
+                        help='file to save/restore the logged-in browser state, empty to disable '
+                             '(default: config.xhs_storage_state_path / config.dy_storage_state_path)')
+    parser.add_argument('--download_media', action='store_true',
+                        help='download note images and videos to config.media_dir')
+    parser.add_argument('--dedup_images', action='store_true',
+                        help='mark near-duplicate downloaded images by perceptual hash (with --download_media)')
+    parser.add_argument('--sub_comments', action='store_true', default=None,
+                        help='also page through sub comments '
+                             '(default: config.xhs_fetch_sub_comments / config.dy_fetch_sub_comments)')
+    parser.add_argument('--block_resources', action='store_true', default=config.browser_block_resources,
+                        help='abort browser requests signing does not need (images, media, fonts, trackers)')
+    parser.add_argument('--stream_output', action='store_true', default=config.redis_stream_output,
+                        help='also publish stored notes and comments to redis streams (config.redis_stream_*)')
+    parser.add_argument('--batch', action='store_true', default=config.batch_mode,
+                        help='exit when the crawl is done (or on SIGTERM after draining), print a run summary '
+                             'and exit with 0 ok / 1 failed / 3 some requests failed / 128+signal stopped')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='report import and browser launch timings')
+    parser.add_argument('--log_level', type=str.upper, default=config.log_level,
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"), help='DEBUG logs every stored note and comment')
+    parser.add_argument('--log_sample_every', type=int, default=config.log_sample_every,
+                        help='log one in this many per-item debug messages')
+    parser.add_argument('--json_log', action='store_true', help='write logs as JSON lines')
     args = parser.parse_args()
-    crawler = CrawlerFactory().get_crawler(args.platform)
+    setup_logging(level=args.log_level, json_format=args.json_log, sample_every=args.log_sample_every)
+    feeds = [feed.strip().upper() for feed in args.feeds.split(",") if feed.strip()]
+    if args.crawler_type == "homefeed" and args.platform == "xhs":
+        from media_platform.xhs.field import FeedType
+        unknown = [feed for feed in feeds if feed not in FeedType.__members__]
+        if unknown:
+            parser.error(f"unknown feeds {unknown}, choose from {[name.lower() for name in FeedType.__members__]}")
+    if args.platform == "dy" and args.crawler_type != "search":
+        parser.error("dy currently only supports --crawler_type search")
+    if args.storage_state is None:
+        args.storage_state = config.dy_storage_state_path if args.platform == "dy" else config.xhs_storage_state_path
+    if args.sub_comments is None:
+        args.sub_comments = config.dy_fetch_sub_comments if args.platform == "dy" else config.xhs_fetch_sub_comments
+    if args.crawler_type == "coordinator":
+        # 协调者只负责往 Redis 队列投放关键词，不需要浏览器
+        from cluster.coordinator import run_coordinator
+        await run_coordinator([keyword for keyword in (args.keywords or "").split(",") if keyword])
+        return
+    profiler = StartupProfiler() if args.startup_profile else None
+    with profiler.measure(f"import_{args.platform}") if profiler else nullcontext():
+        crawler = CrawlerFactory().get_crawler(args.platform)
     crawler.init_spider(
         keywords=args.keywords,
         login_phone=args.phone,
         login_type=args.lt,
         web_session=args.web_session,
+        storage_state_path=args.storage_state,
+        crawler_type=args.crawler_type,
+        download_media=args.download_media,
+        dedup_images=args.dedup_images,
+        fetch_sub_comments=args.sub_comments,
+        feeds=feeds,
+        block_resources=args.block_resources,
+        stream_output=args.stream_output,
+        batch=args.batch,
+        startup_profiler=profiler,
     )
-    await crawler.start_spider()
+    # 批量模式返回退出码，默认模式不会返回
+    return await crawler.start_spider()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        sys.exit(asyncio.run(main()))
     except KeyboardInterrupt:
-        sys.exit()
+        # 爬虫任务被取消时已经关闭了连接池、本地存储和浏览器
+        sys.exit(130)
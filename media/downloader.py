@@ -0,0 +1,269 @@
+# Streaming media downloader running next to the metadata pipeline.
+#
+# Producers call submit() which only puts a small job on a queue, so crawling notes never
+# waits for media bytes. A fixed number of worker tasks stream each file to disk in chunks
+# over a shared (pooled) httpx client. File system calls run in worker threads, so a slow
+# disk does not stall the event loop the crawl runs on.
+#
+# Files are content addressed by the platform's media key (file_id / trace_id for xhs):
+#   <media_dir>/<key[:2]>/<key><ext>      finished file
+#   <media_dir>/<key[:2]>/<key>.part      partial download, resumed with a Range request
+#   <media_dir>/<key[:2]>/<key>.part.type content type of the response the partial download came from
+#   <media_dir>/manifest.jsonl            one JSON line per finished file
+# A key found in the manifest or currently in flight is never downloaded again. With an
+# ImageDedup, an image that turns out to be a near-duplicate of an earlier one is not kept as
+# a copy: its file becomes a hard link to the earlier file.
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger("media")
+
+
+class MediaJob(NamedTuple):
+    key: str
+    url: str
+    note_id: str
+    kind: str
+
+
+class MediaDownloader:
+    def __init__(self, http_client: httpx.AsyncClient, media_dir: str, concurrency: int = 4,
+                 chunk_size: int = 64 * 1024, max_pending: int = 10000, image_dedup=None):
+        """
+        :param http_client: pooled client to download with, e.g. XHSClient.http_client
+        :param media_dir: root directory of the content addressed store
+        :param concurrency: number of files downloaded at the same time
+        :param chunk_size: bytes read from the response and written to disk per step
+        :param max_pending: jobs queued beyond this are dropped (and counted) instead of blocking the crawl
+        :param image_dedup: optional media.image_dedup.ImageDedup, adds phash/duplicate_of to image entries
+                            and links duplicates to the file they duplicate
+        """
+        self.image_dedup = image_dedup
+        self.http_client = http_client
+        self.media_dir = media_dir
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.manifest_path = os.path.join(media_dir, "manifest.jsonl")
+        self._queue: "asyncio.Queue[MediaJob]" = asyncio.Queue(maxsize=max_pending)
+        self._known: Set[str] = set()
+        self._workers = []
+        self._manifest = None
+        # workers append to the manifest from their threads
+        self._manifest_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"queued": 0, "skipped": 0, "dropped": 0,
+                                      "downloaded": 0, "resumed": 0, "failed": 0, "bytes": 0,
+                                      "duplicates": 0, "duplicate_bytes": 0}
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._known.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    # a line cut short by a crash, the file will be downloaded again
+                    continue
+
+    async def start(self):
+        os.makedirs(self.media_dir, exist_ok=True)
+        self._load_manifest()
+        self._manifest = open(self.manifest_path, "a", encoding="utf-8")
+        if self.image_dedup is not None:
+            self.image_dedup.start()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def submit(self, key: str, url: str, note_id: str = "", kind: str = "image") -> bool:
+        """
+        Queue a file without waiting. Returns False if it is known, in flight or the queue is full.
+        """
+        if not key or not url:
+            return False
+        if key in self._known or (self.image_dedup is not None and self.image_dedup.is_duplicate(key)):
+            self.stats["skipped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(MediaJob(key, url, note_id, kind))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        # marked right away so repeats submitted while it downloads are skipped too
+        self._known.add(key)
+        self.stats["queued"] += 1
+        return True
+
+    async def close(self):
+        """
+        Wait for queued downloads to finish, then stop the workers and close the manifest.
+        """
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+        if self.image_dedup is not None:
+            await self.image_dedup.close()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._download(job)
+            except Exception as ex:
+                # whatever failed (network, disk, an unexpected response), the worker keeps going and
+                # close() is not left waiting for a job that never finishes
+                self.stats["failed"] += 1
+                # forget the key so a later submit can retry it, the .part file is kept for resuming
+                self._known.discard(job.key)
+                logger.warning("download failed", extra={"fields": {"kind": job.kind, "key": job.key, "error": repr(ex)}})
+            finally:
+                self._queue.task_done()
+
+    def _key_dir(self, key: str) -> str:
+        return os.path.join(self.media_dir, key[:2])
+
+    async def _download(self, job: MediaJob):
+        key_dir = self._key_dir(job.key)
+        part_path = os.path.join(key_dir, f"{job.key}.part")
+        type_path = f"{part_path}.type"
+        offset = await asyncio.to_thread(self._prepare_part, key_dir, part_path)
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        async with self.http_client.stream("GET", job.url, headers=headers) as response:
+            if offset and response.status_code == 416:
+                # the partial file is already complete; the 416 response does not describe it, take
+                # the type recorded when the download started, or guess it from the url
+                response_type = await asyncio.to_thread(self._read_part_type, type_path)
+                if not response_type:
+                    response_type = mimetypes.guess_type(urlsplit(job.url).path)[0] or ""
+            else:
+                response.raise_for_status()
+                response_type = response.headers.get("content-type", "")
+                if offset and response.status_code == 206:
+                    self.stats["resumed"] += 1
+                    mode = "ab"
+                else:
+                    # server ignored the range, start over
+                    offset, mode = 0, "wb"
+                    await asyncio.to_thread(self._write_part_type, type_path, response_type)
+                f = await asyncio.to_thread(open, part_path, mode)
+                try:
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        await asyncio.to_thread(f.write, chunk)
+                        self.stats["bytes"] += len(chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+
+        sha256 = await asyncio.to_thread(self._file_sha256, part_path)
+        extension = mimetypes.guess_extension(response_type.split(";")[0].strip()) or ""
+        final_path = os.path.join(key_dir, f"{job.key}{extension}")
+        size = await asyncio.to_thread(self._finish_part, part_path, type_path, final_path)
+        self.stats["downloaded"] += 1
+        entry = {
+            "key": job.key,
+            "kind": job.kind,
+            "note_id": job.note_id,
+            "url": job.url,
+            "path": os.path.relpath(final_path, self.media_dir),
+            "size": size,
+            "sha256": sha256,
+            "content_type": response_type,
+            "ts": int(time.time()),
+        }
+        if self.image_dedup is not None and job.kind == "image":
+            try:
+                entry.update(await self.image_dedup.check(job.key, final_path))
+            except Exception as ex:
+                # not a decodable image (or the hashing processes died), keep the file and record it without a hash
+                logger.warning("phash failed", extra={"fields": {"key": job.key, "error": repr(ex)}})
+            if entry.get("duplicate_of"):
+                self.stats["duplicates"] += 1
+                original_path = await asyncio.to_thread(self.find, entry["duplicate_of"])
+                if original_path is not None and await asyncio.to_thread(self._link_duplicate, original_path, final_path):
+                    # size and sha256 still describe the downloaded copy, the file now holds the original
+                    entry["linked"] = True
+                    self.stats["duplicate_bytes"] += size
+        await asyncio.to_thread(self._write_manifest, entry)
+
+    @staticmethod
+    def _prepare_part(key_dir: str, part_path: str) -> int:
+        """
+        Create the key directory, return the size of a partial download to resume from (0 if none).
+        """
+        os.makedirs(key_dir, exist_ok=True)
+        return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    @staticmethod
+    def _read_part_type(type_path: str) -> str:
+        try:
+            with open(type_path, encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    @staticmethod
+    def _write_part_type(type_path: str, content_type: str):
+        with open(type_path, "w", encoding="utf-8") as f:
+            f.write(content_type)
+
+    @staticmethod
+    def _finish_part(part_path: str, type_path: str, final_path: str) -> int:
+        os.replace(part_path, final_path)
+        try:
+            os.remove(type_path)
+        except FileNotFoundError:
+            pass
+        return os.path.getsize(final_path)
+
+    @staticmethod
+    def _link_duplicate(original_path: str, path: str) -> bool:
+        """
+        Replace the file at path by a hard link to original_path, so a duplicate takes no space.
+        Returns False (the copy is kept) where hard links are not possible.
+        """
+        link_path = f"{path}.link"
+        try:
+            os.link(original_path, link_path)
+        except OSError:
+            return False
+        os.replace(link_path, path)
+        return True
+
+    def _file_sha256(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _write_manifest(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._manifest_lock:
+            self._manifest.write(line)
+            self._manifest.flush()
+
+    def find(self, key: str) -> Optional[str]:
+        """
+        Path of a finished file, or None.
+        """
+        key_dir = self._key_dir(key)
+        if not os.path.isdir(key_dir):
+            return None
+        for name in os.listdir(key_dir):
+            stem, extension = os.path.splitext(name)
+            if stem == key and extension != ".part":
+                return os.path.join(key_dir, name)
+        return None
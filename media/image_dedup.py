@@ -0,0 +1,149 @@
+# Near-duplicate image detection for downloaded media.
+#
+# Perceptual hashes are computed on a ProcessPoolExecutor so decoding and resizing images
+# never runs on the asyncio loop and uses every core. Hashes are kept in a BK-tree, which
+# answers "any hash within Hamming distance d?" by only visiting subtrees whose edge
+# distance can still match (triangle inequality), instead of comparing against every image.
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def image_phash(path: str, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """
+    64 bit DCT perceptual hash: the sign of the low frequency DCT coefficients of a
+    32x32 grayscale thumbnail compared to their median. Robust to rescaling, recompression
+    and small color changes, which is what reposts usually do.
+    Runs in the worker processes, so imports stay local.
+    """
+    import numpy as np
+    from PIL import Image
+
+    size = hash_size * highfreq_factor
+    with Image.open(path) as image:
+        pixels = np.asarray(image.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    # 2D DCT-II as two matrix products with the DCT basis
+    index = np.arange(size)
+    basis = np.cos(np.pi * (2 * index[None, :] + 1) * index[:, None] / (2 * size))
+    dct = basis @ pixels @ basis.T
+    low = dct[:hash_size, :hash_size]
+    bits = (low > np.median(low)).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+    Nodes are [hash, key, {distance: child}] lists to keep millions of entries small.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, key: str):
+        node = [value, key, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """
+        All (distance, key) within max_distance of value, nearest first.
+        """
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class ImageDedup:
+    """
+    Pipeline stage used by MediaDownloader: hash each downloaded image off the loop and
+    report whether a near-duplicate was seen before. Hashes are appended to
+    <media_dir>/phash.jsonl and reloaded on start, so duplicates are found across runs.
+    """
+
+    def __init__(self, media_dir: str, max_distance: int = 6, processes: Optional[int] = None):
+        self.max_distance = max_distance
+        self.processes = processes
+        self.index_path = os.path.join(media_dir, "phash.jsonl")
+        self.tree = BKTree()
+        self.duplicate_of: Dict[str, str] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._index_file = None
+
+    def start(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("duplicate_of"):
+                        self.duplicate_of[entry["key"]] = entry["duplicate_of"]
+                    else:
+                        self.tree.add(int(entry["phash"], 16), entry["key"])
+        self._index_file = open(self.index_path, "a", encoding="utf-8")
+        self._pool = ProcessPoolExecutor(max_workers=self.processes)
+
+    async def close(self):
+        """
+        Stop the hashing processes without blocking the event loop while running jobs finish.
+        """
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def is_duplicate(self, key: str) -> bool:
+        return key in self.duplicate_of
+
+    async def check(self, key: str, path: str) -> Dict:
+        """
+        Hash the image at path and return {"phash": hex, "duplicate_of": key or None}.
+        Only originals are added to the tree, so chains of reposts all point at the first copy.
+        """
+        loop = asyncio.get_running_loop()
+        value = await loop.run_in_executor(self._pool, image_phash, path)
+        matches = self.tree.search(value, self.max_distance)
+        duplicate_of = matches[0][1] if matches else None
+        if duplicate_of:
+            self.duplicate_of[key] = duplicate_of
+        else:
+            self.tree.add(value, key)
+        result = {"phash": f"{value:016x}", "duplicate_of": duplicate_of}
+        self._index_file.write(json.dumps({"key": key, **result}) + "\n")
+        self._index_file.flush()
+        return result
@@ -1,42 +1,191 @@
-import httpx
-
+import asyncio
+import urllib.parse
 from typing import Optional, Dict
+
+import httpx
 from playwright.async_api import Page
 
+import json_codec
+from base_client import AbstractApiClient, SignedRequest
+from config import dy_url
+from exception import DataFetchError
+from media_platform.douyin.field import SearchSortType, PublishTimeType
+
+# 浏览器里执行签名的脚本，按 CommonJS 模块包装后挂到 globalThis.__douyinSign 上。
+# 脚本开头的 `var window = null` 在包装函数里只遮蔽局部的 window，不影响页面
+SIGN_LIB_PATH = "libs/douyin.js"
+SIGN_CALL = "([func, args]) => globalThis.__douyinSign ? {value: globalThis.__douyinSign[func](...args)} : null"
+
+
+class DOUYINClient(AbstractApiClient):
+    def __init__(self, timeout=10, proxies=None, headers: Optional[Dict] = None, playwright_page: Page = None,
+                 cookie_dict: Dict = None):
+        super().__init__(dy_url[1], timeout=timeout, proxies=proxies, headers=headers,
+                         playwright_page=playwright_page, cookie_dict=cookie_dict)
+        self._sign_lib: Optional[str] = None
+        self._web_id: Optional[str] = None
+
+    def _load_sign_lib(self) -> str:
+        if self._sign_lib is None:
+            with open(SIGN_LIB_PATH, encoding="utf-8") as f:
+                source = f.read()
+            self._sign_lib = ("(() => { const module = {exports: {}};\n" + source +
+                              "\nglobalThis.__douyinSign = module.exports; })()")
+        return self._sign_lib
+
+    async def call_sign_lib(self, func: str, *args):
+        """
+        调用 libs/douyin.js 导出的函数，页面里还没有注入（或页面刷新过）时先注入
+        :param func: sign / get_web_id
+        :param args:
+        :return:
+        """
+        result = await self.playwright_page.evaluate(SIGN_CALL, [func, list(args)])
+        if result is None:
+            await self.playwright_page.evaluate(self._load_sign_lib())
+            result = await self.playwright_page.evaluate(SIGN_CALL, [func, list(args)])
+        return result["value"]
 
-class DOUYINClient:
-    def __init__(
-            self,
-            timeout=10,
-            proxies=None,
-            headers: Optional[Dict] = None,
-            playwright_page: Page = None,
-            cookie_dict: Dict = None
+    async def get_web_id(self) -> str:
+        if self._web_id is None:
+            self._web_id = await self.call_sign_lib("get_web_id")
+        return self._web_id
+
+    async def _common_params(self, cookie_dict: Dict) -> Dict:
+        ms_token = cookie_dict.get("msToken") or await self.playwright_page.evaluate(
+            "() => window.localStorage.getItem('xmst')"
+        )
+        return {
+            "device_platform": "webapp",
+            "aid": "6383",
+            "channel": "channel_pc_web",
+            "cookie_enabled": "true",
+            "browser_language": "zh-CN",
+            "browser_platform": "Win32",
+            "browser_online": "true",
+            "platform": "PC",
+            "screen_width": "1920",
+            "screen_height": "1080",
+            "webid": await self.get_web_id(),
+            "msToken": ms_token or "",
+        }
+
+    async def sign(self, method: str, uri: str, params: Optional[Dict] = None,
+                   data: Optional[Dict] = None) -> SignedRequest:
+        """
+        公共参数拼进 query，再用页面里的 douyin.js 对 query 和 User-Agent 计算 X-Bogus
+        """
+        # 先取一次引用，签名途中 cookies 被同步更新也不会新旧混用
+        headers, cookie_dict = self.headers, self.cookie_dict
+        query = urllib.parse.urlencode({**await self._common_params(cookie_dict), **(params or {})})
+        x_bogus = await self.call_sign_lib("sign", query, headers.get("User-Agent", ""))
+        content = None
+        if data is not None:
+            content = json_codec.dumps_body(data)
+        return SignedRequest(f"{self._host}{uri}?{query}&X-Bogus={x_bogus}", dict(headers), content)
+
+    def parse_response(self, response: httpx.Response):
+        # 签名或 cookie 失效时抖音返回 200 和空的响应体
+        if not response.content:
+            raise DataFetchError("empty response, the sign or cookies may be invalid")
+        data = json_codec.loads(response.content)
+        status_code = data.get("status_code", 0)
+        if status_code != 0:
+            raise DataFetchError(data.get("status_msg") or f"status_code {status_code}")
+        return data
+
+    async def pong(self) -> bool:
+        """
+        检查当前 cookie 的登录态是否有效：登录后页面会写入 LOGIN_STATUS cookie 和 HasUserLogin
+        :return:
+        """
+        if self.cookie_dict.get("LOGIN_STATUS") == "1":
+            return True
+        has_user_login = await self.playwright_page.evaluate("() => window.localStorage.getItem('HasUserLogin')")
+        return has_user_login == "1"
+
+    async def search_info_by_keyword(
+            self, keyword: str, offset: int = 0, search_id: str = "",
+            sort_type: SearchSortType = SearchSortType.GENERAL,
+            publish_time: PublishTimeType = PublishTimeType.UNLIMITED
     ):
-        self.proxies = proxies
-        self.timeout = timeout
-        self.headers = headers
-        self._host = "https://www.douyin.com"
-        self.playwright_page = playwright_page
-        self.cookie_dict = cookie_dict
-
-    async def _pre_params(self, url: str, data=None):
-        pass
-
-    async def request(self, method, url, **kwargs):
-        async with httpx.AsyncClient(proxies=self.proxies) as client:
-            response = await client.request(
-                method, url, timeout=self.timeout,
-                **kwargs
-            )
-        data = response.json()
-        if data["success"]:
-            return data.get("data", data.get("success"))
-        else:
-            pass
-
-    async def get(self, uri: str, params=None):
-        pass
-
-    async def post(self, uri: str, data: dict):
-        pass
+        """按关键字搜索视频
+        :param keyword: 关键词
+        :param offset: 已经获取的条数，上一页返回的 cursor
+        :param search_id: 第一页为 ""，之后用上一页返回的 extra.logid
+        :param sort_type: 排序
+        :param publish_time: 发布时间范围
+        :return: {"data": [{"type": 1, "aweme_info": {}}], "has_more": 1, "cursor": 15, "extra": {"logid": ""}}
+        """
+        uri = "/aweme/v1/web/general/search/single/"
+        params = {
+            "keyword": keyword,
+            "search_channel": "aweme_general",
+            "sort_type": sort_type.value,
+            "publish_time": publish_time.value,
+            "search_source": "normal_search",
+            "query_correct_type": "1",
+            "is_filter_search": "0",
+            "offset": offset,
+            "count": 15,
+            "search_id": search_id,
+        }
+        return await self.get(uri, params)
+
+    async def get_video_by_id(self, aweme_id: str) -> Dict:
+        """
+        :param aweme_id: 视频 id
+        :return: {"aweme_id": "", "desc": "", "create_time": 0, "author": {}, "statistics": {"digg_count": 0, "comment_count": 0, ...}}
+        """
+        uri = "/aweme/v1/web/aweme/detail/"
+        res = await self.get(uri, {"aweme_id": aweme_id})
+        aweme_detail = res.get("aweme_detail")
+        if not aweme_detail:
+            raise DataFetchError(f"aweme {aweme_id} not found")
+        return aweme_detail
+
+    async def get_aweme_comments(self, aweme_id: str, cursor: int = 0, count: int = 20):
+        """获取视频一级评论
+        :return: {"comments": [], "cursor": 20, "has_more": 1, "total": 100}
+        """
+        uri = "/aweme/v1/web/comment/list/"
+        params = {
+            "aweme_id": aweme_id,
+            "cursor": cursor,
+            "count": count,
+            "item_type": 0,
+        }
+        return await self.get(uri, params)
+
+    async def get_sub_comments(self, aweme_id: str, comment_id: str, cursor: int = 0, count: int = 20):
+        """获取一级评论下的回复
+        :return: {"comments": [], "cursor": 20, "has_more": 1}
+        """
+        uri = "/aweme/v1/web/comment/list/reply/"
+        params = {
+            "item_id": aweme_id,
+            "comment_id": comment_id,
+            "cursor": cursor,
+            "count": count,
+            "item_type": 0,
+        }
+        return await self.get(uri, params)
+
+    async def get_remaining_sub_comments(self, aweme_id: str, comment: Dict, crawl_interval: float = 1.0):
+        """
+        翻页获取一级评论下的全部回复
+        :param aweme_id:
+        :param comment: 一级评论
+        :param crawl_interval:
+        :return:
+        """
+        result = []
+        has_more = True
+        cursor = 0
+        while has_more:
+            res = await self.get_sub_comments(aweme_id, comment["cid"], cursor=cursor)
+            result.extend(res.get("comments") or [])
+            has_more = bool(res.get("has_more")) and bool(res.get("comments"))
+            cursor = res.get("cursor", 0)
+            await asyncio.sleep(crawl_interval)
+        return result
@@ -0,0 +1,19 @@
+from enum import Enum
+
+
+class SearchSortType(Enum):
+    """search sort type"""
+    # default
+    GENERAL = 0
+    # most liked
+    MOST_LIKE = 1
+    # Latest
+    LATEST = 2
+
+
+class PublishTimeType(Enum):
+    """search publish time range"""
+    UNLIMITED = 0
+    ONE_DAY = 1
+    ONE_WEEK = 7
+    SIX_MONTH = 180
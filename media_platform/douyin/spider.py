@@ -1,61 +1,262 @@
 import sys
+import logging
+import random
 import asyncio
-from typing import Optional, List, Dict
+from typing import TYPE_CHECKING, Optional, List, Dict
 
 from playwright.async_api import async_playwright
-from playwright.async_api import Page
-from playwright.async_api import Cookie
-from playwright.async_api import BrowserContext
+from playwright.async_api import Playwright
 
 import utils
-from client import DOUYINClient
-from base_spider import Spider
+from base_spider import BrowserSpider
+from config import dy_url, dy_storage_state_path, dy_qrcode_path, dy_max_videos_per_keyword, dy_request_rate, \
+    dy_login_timeout, dy_fetch_sub_comments, comment_crawl_concurrency, cookie_sync_interval, batch_mode, \
+    batch_drain_timeout
+from exception import DataFetchError
+from media_platform.douyin.client import DOUYINClient
+from models.douyin.m_douyin import update_douyin_aweme, update_dy_aweme_comment
+from scheduler.cost_pool import CostAwarePool
+from scheduler.token_bucket import TokenBucket
+from store.sqlite_store import close_store
 
+if TYPE_CHECKING:
+    from browser.cookie_sync import CookieSync
+
+logger = logging.getLogger("douyin")
+
+
+class DouYinSpider(BrowserSpider):
+    logger = logger
+    session_cookie = "sessionid"
 
-class DouYinSpider(Spider):
     def __init__(self):
+        super().__init__(dy_url[0], dy_storage_state_path)
         self.keywords: Optional[str] = None
-        self.scan_qrcode_time: Optional[int] = None
-        self.cookies: Optional[List[Cookie]] = None
-        self.browser_context: Optional[BrowserContext] = None
-        self.context_page: Optional[Page] = None
-        self.proxy: Optional[Dict] = None
-        self.user_agent = utils.get_user_agent()
         self.dy_client: Optional[DOUYINClient] = None
+        self.fetch_sub_comments = dy_fetch_sub_comments
+        self.cookie_sync: Optional["CookieSync"] = None
+        self.batch = batch_mode
+
+    async def start_spider(self) -> Optional[int]:
+        """
+        和小红书一样：默认抓取完成后保持浏览器打开，批量模式（--batch）收尾退出并返回进程退出码
+        :return:
+        """
+        batch_run = None
+        if self.batch:
+            from batch_run import BatchRun
+            batch_run = BatchRun(batch_drain_timeout)
+            batch_run.install()
+        store_stats: Dict[str, int] = {}
+        try:
+            async with async_playwright() as playwright:
+                try:
+                    await self.prepare(playwright)
+                    if batch_run is None:
+                        # 搜索视频并抓取它们的评论
+                        await self.search_posts()
+                        # block main crawler coroutine
+                        await asyncio.Event().wait()
+                    else:
+                        await batch_run.run(self.search_posts(), [self.dy_client])
+                finally:
+                    store_stats = await self.close()
+        except asyncio.CancelledError:
+            if batch_run is None or not batch_run.stopped:
+                raise
+        finally:
+            if batch_run is not None:
+                batch_run.uninstall()
+        if batch_run is None:
+            return None
+        summary = batch_run.summary([self.dy_client] if self.dy_client else [], store_stats)
+        batch_run.report(summary)
+        return summary["exit_code"]
+
+    async def prepare(self, playwright: Playwright):
+        """
+        启动浏览器，恢复登录态或重新登录，创建请求客户端并启动 cookies 同步
+        :param playwright:
+        :return:
+        """
+        self.dy_client = await self.open_session(playwright)
+
+        if cookie_sync_interval > 0:
+            # 和小红书一样，网站轮换 cookies 后请求客户端跟着更新
+            from browser.cookie_sync import CookieSync
+            self.cookie_sync = CookieSync(self.dy_client, domain="douyin.com", interval=cookie_sync_interval)
+            self.cookie_sync.attach(self.browser_context)
+            self.cookie_sync.start()
+
+    async def close(self) -> Dict[str, int]:
+        """
+        停止 cookies 同步，关闭连接池、本地存储和浏览器
+        :return: 本地存储的统计
+        """
+        if self.cookie_sync is not None:
+            await self.cookie_sync.stop()
+        if self.dy_client is not None:
+            await self.dy_client.close()
+        store_stats = close_store()
+        if self.browser is not None:
+            await self.browser.close()
+        return store_stats
 
-    def init_spider(self, **kwargs):
-        self.keywords = kwargs.get("keywords")
-        self.scan_qrcode_time = kwargs.get("scan_qrcode_time")
-
-    async def start_spider(self):
-        async with async_playwright() as playwright:
-            chromium = playwright.chromium
-            browser = await chromium.launch(headless=False)
-            self.browser_context = await browser.new_context(
-                viewport={"width": 1920, "height": 1080},
-                user_agent=self.user_agent,
-                proxy=self.proxy
-            )
-            # execute JS to bypass anti automation/crawler detection
-            await self.browser_context.add_init_script(path="libs/stealth.min.js")
-            self.context_page = await self.browser_context.new_page()
-            await self.context_page.goto("https://www.douyin.com")
-
-            # scan qrcode login
-            await self.login()
-            await self.update_cookies()
-
-            # block main crawler coroutine
-            await asyncio.Event().wait()
-
-    async def update_cookies(self):
-        self.cookies = await self.browser_context.cookies()
+    def create_client(self) -> DOUYINClient:
+        """
+        用当前的 cookies 创建请求客户端，所有请求共用一个请求预算
+        :return:
+        """
+        cookie_str, cookie_dict = utils.convert_cookies(self.cookies)
+        dy_client = DOUYINClient(
+            proxies=self.proxy,
+            headers={
+                "User-Agent": self.user_agent,
+                "Cookie": cookie_str,
+                "Host": "www.douyin.com",
+                "Origin": self.index_url,
+                "Referer": f"{self.index_url}/",
+                "Content-Type": "application/json;charset=UTF-8"
+            },
+            playwright_page=self.context_page,
+            cookie_dict=cookie_dict,
+        )
+        dy_client.rate_limiter = TokenBucket(dy_request_rate)
+        return dy_client
 
     async def login(self):
-        pass
+        if self.login_type == "qrcode":
+            await self.login_by_qrcode()
+        elif self.login_type == "handby":
+            # 使用预设置的 sessionid 登录
+            await self.browser_context.add_cookies([{
+                'name': 'sessionid',
+                'value': self.web_session,
+                'domain': ".douyin.com",
+                'path': "/"
+            }])
+        else:
+            logger.error(f"抖音暂不支持 {self.login_type} 登录，请使用 qrcode 或 handby")
+            sys.exit()
+
+    async def login_by_qrcode(self):
+        logger.info("开始扫描二维码，登录抖音")
+        qrcode_selector = "xpath=//article[@class='web-login']//img"
+        base64_qrcode_img = await utils.get_login_qrcode(self.context_page, selector=qrcode_selector)
+        if not base64_qrcode_img:
+            # 登录框没有自动弹出时手动点击登录按钮
+            await self.context_page.locator("xpath=//p[text() = '登录']").click()
+            base64_qrcode_img = await utils.get_login_qrcode(self.context_page, selector=qrcode_selector)
+        if not base64_qrcode_img:
+            logger.error("登录失败，没有找到qrcode，请检查。")
+            sys.exit()
+        self.save_qrcode(utils.show_qrcode(base64_qrcode_img), dy_qrcode_path)
+        logger.info(f"请在 {dy_login_timeout} 秒内使用抖音 APP 扫描二维码：{dy_qrcode_path}")
+        if not await self.wait_for_login(self.check_login_state, timeout=dy_login_timeout):
+            logger.error("登录失败  ，请重试")
+            sys.exit()
+        logger.info("登录成功，等待重定向完成 ...")
+        await self.context_page.wait_for_load_state()
+
+    async def check_login_state(self) -> bool:
+        current_cookie = await self.browser_context.cookies()
+        _, cookie_dict = utils.convert_cookies(current_cookie)
+        return cookie_dict.get("LOGIN_STATUS") == "1"
+
+    async def search_posts(self):
+        logger.info("开始搜索抖音关键词")
+        for keyword in (self.keywords or "").split(","):
+            if not keyword:
+                continue
+            aweme_list: List[str] = []
+            aweme_costs: Dict[str, int] = {}
+            for aweme_id in await self.search_aweme_ids(keyword, max_count=dy_max_videos_per_keyword):
+                aweme_detail = await self.get_aweme_detail(aweme_id)
+                if aweme_detail is None:
+                    continue
+                aweme_list.append(aweme_id)
+                aweme_costs[aweme_id] = int((aweme_detail.get("statistics") or {}).get("comment_count") or 0)
+            logger.info("keyword searched", extra={"fields": {"keyword": keyword, "aweme_list": aweme_list}})
+            # 获取视频的评论，评论多的视频先开始
+            await self.batch_get_aweme_comments(aweme_list, aweme_costs)
+        logger.info("抖音抓取完成", extra={"fields": self.dy_client.stats})
+
+    async def search_aweme_ids(self, keyword: str, max_count: int) -> List[str]:
+        """
+        按关键字分页搜索视频 id，凑够 max_count 条后不再翻页
+        :param keyword:
+        :param max_count:
+        :return:
+        """
+        aweme_ids: List[str] = []
+        offset, search_id = 0, ""
+        while len(aweme_ids) < max_count:
+            try:
+                search_res = await self.dy_client.search_info_by_keyword(keyword, offset=offset, search_id=search_id)
+            except DataFetchError as ex:
+                logger.warning("search failed", extra={"fields": {"keyword": keyword, "error": str(ex)}})
+                break
+            for item in search_res.get("data") or []:
+                aweme_info = item.get("aweme_info") or (item.get("aweme_mix_info") or {}).get("mix_items", [{}])[0]
+                if aweme_info.get("aweme_id"):
+                    aweme_ids.append(aweme_info["aweme_id"])
+            if not search_res.get("has_more"):
+                break
+            offset = search_res.get("cursor", offset + 15)
+            search_id = (search_res.get("extra") or {}).get("logid", "")
+        return aweme_ids[:max_count]
+
+    async def get_aweme_detail(self, aweme_id: str) -> Optional[Dict]:
+        """
+        获取视频详情并保存，获取失败返回 None
+        :param aweme_id:
+        :return:
+        """
+        try:
+            aweme_detail = await self.dy_client.get_video_by_id(aweme_id)
+        except DataFetchError as ex:
+            logger.warning("get aweme detail failed", extra={"fields": {"aweme_id": aweme_id, "error": str(ex)}})
+            return None
+        await update_douyin_aweme(aweme_detail)
+        return aweme_detail
+
+    async def batch_get_aweme_comments(self, aweme_list: List[str], aweme_costs: Optional[Dict[str, int]] = None):
+        """
+        批量获取视频评论，和小红书一样按预计评论数从大到小调度，回复多的评论拆成单独任务
+        :param aweme_list:
+        :param aweme_costs: aweme_id -> 预计评论数
+        :return:
+        """
+        aweme_costs = aweme_costs or {}
+        pool = CostAwarePool(concurrency=comment_crawl_concurrency)
+        for aweme_id in aweme_list:
+            pool.submit(aweme_costs.get(aweme_id, 0), self.crawl_aweme_comments, aweme_id, pool)
+        await pool.join()
+
+    async def crawl_aweme_comments(self, aweme_id: str, pool: CostAwarePool):
+        logger.debug("crawl aweme comments", extra={"sample": True, "fields": {"aweme_id": aweme_id}})
+        has_more = True
+        cursor = 0
+        while has_more:
+            comments_res = await self.dy_client.get_aweme_comments(aweme_id, cursor)
+            comments = comments_res.get("comments") or []
+            has_more = bool(comments_res.get("has_more")) and bool(comments)
+            cursor = comments_res.get("cursor", 0)
+            for comment in comments:
+                await update_dy_aweme_comment(aweme_id=aweme_id, comment_item=comment)
+                reply_total = int(comment.get("reply_comment_total") or 0)
+                if self.fetch_sub_comments and reply_total:
+                    pool.submit(reply_total, self.crawl_sub_comments, aweme_id, comment)
+            await asyncio.sleep(random.random())
 
-    def search_posts(self):
-        pass
+    async def crawl_sub_comments(self, aweme_id: str, comment: Dict):
+        sub_comments = await self.dy_client.get_remaining_sub_comments(
+            aweme_id, comment, crawl_interval=random.random()
+        )
+        for sub_comment in sub_comments:
+            await update_dy_aweme_comment(aweme_id=aweme_id, comment_item=sub_comment)
 
-    def get_comments(self, item_id: str):
-        pass
+    async def get_comments(self, item_id: str):
+        pool = CostAwarePool(concurrency=comment_crawl_concurrency)
+        pool.submit(0, self.crawl_aweme_comments, item_id, pool)
+        await pool.join()
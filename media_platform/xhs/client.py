@@ -1,36 +1,37 @@
 import asyncio
-import time
 
 import httpx
-import json
 
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from playwright.async_api import Page
+import json_codec
+from base_client import AbstractApiClient, SignedRequest
 from config import xhs_url
-from media_platform.xhs.field import SearchNoteType, SearchSortType
+from media_platform.xhs.field import SearchNoteType, SearchSortType, FeedType
 from media_platform.xhs.xhs_utils import sign, get_search_id
 from exception import DataFetchError, IPBlockError
 
+# 页面上的签名函数加载完成，新打开的页面可以用来签名了
+SIGN_READY_CHECK = "() => typeof window._webmsxyw === 'function'"
 
-class XHSClient:
+
+class XHSClient(AbstractApiClient):
     def __init__(self, timeout=10, proxies=None, headers: Optional[Dict] = None, playwright_page: Page = None,
                  cookie_dict: Dict = None):
-        self.proxies = proxies
-        self.timeout = timeout
-        self.headers = headers
-        self._host = xhs_url[1]
+        super().__init__(xhs_url[1], timeout=timeout, proxies=proxies, headers=headers,
+                         playwright_page=playwright_page, cookie_dict=cookie_dict)
         self.IP_ERROR_STR = "网络连接异常，请检查网络设置或重启试试"
         self.IP_ERROR_CODE = 300012
         self.NOTE_ABNORMAL_STR = "笔记状态异常，请稍后查看"
         self.NOTE_ABNORMAL_CODE = -510001
-        self.playwright_page = playwright_page
-        self.cookie_dict = cookie_dict
 
     async def _pre_headers(self, url: str, data=None):
+        # 先取一次引用，签名途中 cookies 被同步更新也不会新旧混用
+        base_headers, cookie_dict = self.headers, self.cookie_dict
         encrypt_params = await self.playwright_page.evaluate("([url, data]) => window._webmsxyw(url,data)", [url, data])
         local_storage = await self.playwright_page.evaluate("() => window.localStorage")
         signs = sign(
-            a1=self.cookie_dict.get("a1", ""),
+            a1=cookie_dict.get("a1", ""),
             b1=local_storage.get("b1", ""),
             x_s=encrypt_params.get("X-s", ""),
             x_t=str(encrypt_params.get("X-t", ""))
@@ -42,16 +43,27 @@ class XHSClient:
             "x-S-Common": signs["x-s-common"],
             "X-B3-Traceid": signs["x-b3-traceid"]
         }
-        self.headers.update(headers)
-        return self.headers
-
-    async def request(self, method, url, **kwargs):
-        async with httpx.AsyncClient(proxies=self.proxies) as client:
-            response = await client.request(
-                method, url, timeout=self.timeout,
-                **kwargs
-            )
-        data = response.json()
+        # 每次返回新的 dict，并发请求之间不会互相覆盖签名
+        return {**base_headers, **headers}
+
+    async def sign(self, method: str, uri: str, params: Optional[Dict] = None,
+                   data: Optional[Dict] = None) -> SignedRequest:
+        """
+        GET 对带 query 的完整 uri 签名，POST 对 uri 和 json 数据签名
+        """
+        final_uri = uri
+        if isinstance(params, dict):
+            final_uri = (f"{uri}?"
+                         f"{'&'.join([f'{k}={v}' for k, v in params.items()])}")
+        headers = await self._pre_headers(final_uri, data)
+        content = None
+        if data is not None:
+            # 和页面签名时的 JSON.stringify(data) 一致：紧凑格式，不转义中文
+            content = json_codec.dumps_body(data)
+        return SignedRequest(f"{self._host}{final_uri}", headers, content)
+
+    def parse_response(self, response: httpx.Response):
+        data = json_codec.loads(response.content)
         if data["success"]:
             return data.get("data", data.get("success"))
         elif data["code"] == self.IP_ERROR_CODE:
@@ -59,19 +71,24 @@ class XHSClient:
         else:
             raise DataFetchError(data.get("msg", None))
 
-    async def get(self, uri: str, params=None):
-        final_uri = uri
-        if isinstance(params, dict):
-            final_uri = (f"{uri}?"
-                         f"{'&'.join([f'{k}={v}' for k, v in params.items()])}")
-        headers = await self._pre_headers(final_uri)
-        return await self.request(method="GET", url=f"{self._host}{final_uri}", headers=headers)
+    async def get_self_info(self):
+        """
+        获取当前登录用户信息，未登录时 guest 为 true
+        :return: {"guest": false, "user_id": "...", "nickname": "..."}
+        """
+        uri = "/api/sns/web/v2/user/me"
+        return await self.get(uri)
 
-    async def post(self, uri: str, data: dict):
-        headers = await self._pre_headers(uri, data)
-        json_str = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
-        return await self.request(method="POST", url=f"{self._host}{uri}",
-                                  data=json_str, headers=headers)
+    async def pong(self) -> bool:
+        """
+        检查当前 cookie 的登录态是否有效
+        :return:
+        """
+        try:
+            self_info = await self.get_self_info()
+        except (httpx.HTTPError, ValueError, KeyError):
+            return False
+        return bool(self_info) and not self_info.get("guest", True)
 
     async def get_note_by_keyword(
             self, keyword: str,
@@ -104,6 +121,33 @@ class XHSClient:
         }
         return await self.post(uri, data)
 
+    async def get_homefeed_notes(self, feed_type: FeedType = FeedType.RECOMMEND,
+                                 cursor_score: str = "", note_index: int = 0, num: int = 40):
+        """获取首页推荐流（按频道）
+        :param feed_type: 频道，默认推荐
+        :type feed_type: FeedType, optional
+        :param cursor_score: 上一页返回的 cursor_score，第一页为 ""
+        :type cursor_score: str, optional
+        :param note_index: 已经获取的笔记数
+        :type note_index: int, optional
+        :param num: 每页多少条
+        :type num: int, optional
+        :return: {"cursor_score": "1.686...", "items": [{"id": "...", "model_type": "note", "note_card": {}}]}
+        :rtype: dict
+        """
+        uri = "/api/sns/web/v1/homefeed"
+        data = {
+            "cursor_score": cursor_score,
+            "num": num,
+            "refresh_type": 1,
+            "note_index": note_index,
+            "unread_begin_note_id": "",
+            "unread_end_note_id": "",
+            "unread_note_count": 0,
+            "category": feed_type.value
+        }
+        return await self.post(uri, data)
+
     async def get_note_by_id(self, note_id: str):
         """
         :param note_id: 要获取的笔记 id
@@ -180,21 +224,53 @@ class XHSClient:
             # handle get sub comments
             for comment in comments:
                 result.append(comment)
-                cur_sub_comment_count = int(comment["sub_comment_count"])
-                cur_sub_comments = comment["sub_comments"]
-                result.extend(cur_sub_comments)
-                sub_comments_has_more = comment["sub_comment_has_more"] and len(
-                    cur_sub_comments) < cur_sub_comment_count
-                sub_comment_cursor = comment["sub_comment_cursor"]
-                while sub_comments_has_more:
-                    page_num = 30
-                    sub_comments_res = await self.get_note_sub_comments(note_id, comment["id"], num=page_num,
-                                                                        cursor=sub_comment_cursor)
-                    sub_comments = sub_comments_res["comments"]
-                    sub_comments_has_more = sub_comments_res["has_more"] and len(sub_comments) == page_num
-                    sub_comment_cursor = sub_comments_res["cursor"]
-                    result.extend(sub_comments)
-                    await asyncio.sleep(crawl_interval)
+                result.extend(self.attach_root_comment_id(comment))
+                if self.has_more_sub_comments(comment):
+                    result.extend(await self.get_remaining_sub_comments(note_id, comment, crawl_interval))
+            await asyncio.sleep(crawl_interval)
+        return result
+
+    @staticmethod
+    def has_more_sub_comments(comment: Dict) -> bool:
+        """
+        一级评论自带的子评论之外是否还有子评论需要翻页获取
+        :param comment:
+        :return:
+        """
+        return comment["sub_comment_has_more"] and len(comment["sub_comments"]) < int(comment["sub_comment_count"])
+
+    @staticmethod
+    def attach_root_comment_id(comment: Dict) -> List[Dict]:
+        """
+        给一级评论自带的子评论记上 root_comment_id，拆成扁平列表后仍能还原评论树
+        :param comment: 一级评论
+        :return: 子评论列表
+        """
+        for sub_comment in comment["sub_comments"]:
+            sub_comment["root_comment_id"] = comment["id"]
+        return comment["sub_comments"]
+
+    async def get_remaining_sub_comments(self, note_id: str, comment: Dict, crawl_interval: float = 1.0):
+        """
+        从一级评论自带的子评论之后继续翻页，获取剩下的子评论
+        :param note_id:
+        :param comment: 一级评论
+        :param crawl_interval:
+        :return:
+        """
+        result = []
+        sub_comments_has_more = True
+        sub_comment_cursor = comment["sub_comment_cursor"]
+        while sub_comments_has_more:
+            page_num = 30
+            sub_comments_res = await self.get_note_sub_comments(note_id, comment["id"], num=page_num,
+                                                                cursor=sub_comment_cursor)
+            sub_comments = sub_comments_res["comments"]
+            for sub_comment in sub_comments:
+                sub_comment["root_comment_id"] = comment["id"]
+            sub_comments_has_more = sub_comments_res["has_more"] and len(sub_comments) == page_num
+            sub_comment_cursor = sub_comments_res["cursor"]
+            result.extend(sub_comments)
             await asyncio.sleep(crawl_interval)
         return result
 
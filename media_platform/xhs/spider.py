@@ -1,23 +1,34 @@
 import asyncio
+import logging
 import sys
-import aioredis
 import random
-from asyncio import Task
-import matplotlib.pyplot as plt
-from typing import Optional, List, Dict
+from typing import TYPE_CHECKING, Optional, List, Dict
 
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_result
 from playwright.async_api import Page
-from playwright.async_api import Cookie
 from playwright.async_api import BrowserContext
+from playwright.async_api import Playwright
 from playwright.async_api import async_playwright
 
-from base_spider import Spider
-from media_platform.xhs.client import XHSClient
-from config import xhs_url, redis_db_host, redis_db_pwd
+from base_spider import BrowserSpider
+from media_platform.xhs.client import XHSClient, SIGN_READY_CHECK
+from media_platform.xhs.field import FeedType
+from config import xhs_url, xhs_storage_state_path, xhs_qrcode_path, xhs_login_timeout, media_dir, \
+    media_download_concurrency, image_dedup_max_distance, image_dedup_processes, recrawl_min_interval, \
+    recrawl_max_interval, recrawl_target_change, recrawl_request_rate, recrawl_concurrency, recrawl_state_path, \
+    comment_crawl_concurrency, xhs_fetch_sub_comments, homefeed_channels, homefeed_pages_per_channel, \
+    homefeed_request_rate, browser_health_check_interval, browser_page_heap_limit_mb, browser_rss_limit_mb, \
+    browser_sign_latency_limit, cookie_sync_interval, batch_mode, batch_drain_timeout, redis_stream_output, engagement_history_path
 from exception import DataFetchError
+from scheduler.cost_pool import CostAwarePool
+from scheduler.token_bucket import TokenBucket
 from models.xhs.m_xhs import update_xhs_note_comment, update_xhs_note
-from utils import get_user_agent, get_login_qrcode, convert_cookies, show_qrcode
+from store.sqlite_store import close_store
+from utils import get_login_qrcode, convert_cookies, show_qrcode, match_interact_info_count
+
+if TYPE_CHECKING:
+    from browser.cookie_sync import CookieSync
+    from browser.health import BrowserHealthMonitor
+    from media.downloader import MediaDownloader
 
 """
 Playwright是微软开源的一个UI自动化测试工具。添加了默认等待时间增加脚本稳定性，并提供视频录制、网络请求支持、自定义的定位器、自带调试器等新特性
@@ -32,76 +43,218 @@ Playwright的一个主要特点是它能够在所有主要的操作系统（包
 需要  python 3.7版本以上
 """
 
+logger = logging.getLogger("xhs")
+
+
+class XiaoHongShuSpider(BrowserSpider):
+    logger = logger
 
-class XiaoHongShuSpider(Spider):
     def __init__(self):
+        super().__init__(xhs_url[0], xhs_storage_state_path)
         self.login_phone = None
-        self.login_type = None
         self.keywords = None
-        self.web_session = None
-        self.cookies: Optional[List[Cookie]] = None
-        self.browser_context: Optional[BrowserContext] = None
-        self.context_page: Optional[Page] = None
-        self.proxy: Optional[Dict] = None
-        self.user_agent = get_user_agent()
         self.xhs_client: Optional[XHSClient] = None
-        self.index_url = xhs_url[0]
+        self.crawler_type = "search"
+        self.download_media = False
+        self.dedup_images = False
+        self.fetch_sub_comments = xhs_fetch_sub_comments
+        self.feeds: List[str] = list(homefeed_channels)
+        # 后台任务、媒体下载、分布式、Redis 等子系统在开启时才导入，不拖慢启动
+        self.media_downloader: Optional["MediaDownloader"] = None
+        self.health_monitor: Optional["BrowserHealthMonitor"] = None
+        self.cookie_sync: Optional["CookieSync"] = None
+        self.batch = batch_mode
+        self.stream_output = redis_stream_output
 
-    def init_spider(self, **kwargs):
-        for key in kwargs.keys():
-            setattr(self, key, kwargs[key])
+    async def start_spider(self) -> Optional[int]:
+        """
+        启动浏览器、登录，然后按 crawler_type 抓取。默认抓取完成后保持浏览器打开；
+        批量模式（--batch）抓取完成或收到 SIGTERM 后收尾退出，返回进程退出码
+        :return:
+        """
+        batch_run = None
+        if self.batch:
+            from batch_run import BatchRun
+            batch_run = BatchRun(batch_drain_timeout)
+            batch_run.install()
+        store_stats: Dict[str, int] = {}
+        try:
+            async with async_playwright() as playwright:
+                try:
+                    await self.prepare(playwright)
+                    if batch_run is None:
+                        await self.crawl()
+                        # 阻塞主爬虫协同程序
+                        await asyncio.Event().wait()
+                    else:
+                        await batch_run.run(self.crawl(), [self.xhs_client])
+                finally:
+                    store_stats = await self.close()
+        except asyncio.CancelledError:
+            # 批量模式下还在启动（登录）时就收到了停止信号
+            if batch_run is None or not batch_run.stopped:
+                raise
+        finally:
+            if batch_run is not None:
+                batch_run.uninstall()
+        if batch_run is None:
+            return None
+        summary = batch_run.summary([self.xhs_client] if self.xhs_client else [], store_stats)
+        batch_run.report(summary)
+        return summary["exit_code"]
 
-    async def update_cookies(self):
+    async def prepare(self, playwright: Playwright):
         """
-        设置cookies  保持登录
+        启动浏览器，恢复登录态或重新登录，创建请求客户端并启动后台任务
+        :param playwright:
         :return:
         """
-        self.cookies = await self.browser_context.cookies()
-
-    async def start_spider(self):
-        async with async_playwright() as playwright:
-            # 启动浏览器 并创建单个浏览器上下文
-            chromium = playwright.chromium
-            # 创建谷歌浏览器 ，开启启动无头模式
-            browser = await chromium.launch(headless=True)
-            # new_content 方法其实是为了创建一个独立的全新上下文环境，它的目的是为了防止多个测试用例并行时各个用例间不受干扰
-            self.browser_context = await browser.new_context(
-                viewport={"width": 1920, "height": 1080},
-                user_agent=self.user_agent,
-                proxy=self.proxy
+        # 启动浏览器、恢复登录态或扫码登录，创建请求客户端
+        self.xhs_client = await self.open_session(playwright)
+
+        if cookie_sync_interval > 0:
+            # 网站轮换 cookies 后请求客户端跟着更新，不用重启重新登录
+            from browser.cookie_sync import CookieSync
+            self.cookie_sync = CookieSync(self.xhs_client, domain="xiaohongshu.com", interval=cookie_sync_interval)
+            self.cookie_sync.attach(self.browser_context)
+            self.cookie_sync.start()
+
+        if browser_health_check_interval > 0:
+            # 长时间运行时浏览器内存会一直增长，超限后在后台换掉签名页面或整个上下文
+            from browser.health import BrowserHealthMonitor
+            self.health_monitor = BrowserHealthMonitor(
+                self.xhs_client, self.recycle_page, self.recycle_context,
+                interval=browser_health_check_interval, page_heap_limit_mb=browser_page_heap_limit_mb,
+                rss_limit_mb=browser_rss_limit_mb, sign_latency_limit=browser_sign_latency_limit
             )
-            # 执行JS 绕过反自动化及爬虫检测
-            await self.browser_context.add_init_script(path="libs/stealth.min.js")
-            # 新建选项卡
-            self.context_page = await self.browser_context.new_page()
-            # 进行url请求
-            await self.context_page.goto(self.index_url)
-
-            # 扫描二维码登录
-            await self.login()
-            await self.update_cookies()
-
-            # # 初始化请求客户端
-            cookie_str, cookie_dict = convert_cookies(self.cookies)
-            self.xhs_client = XHSClient(
-                proxies=self.proxy,
-                headers={
-                    "User-Agent": self.user_agent,
-                    "Cookie": cookie_str,
-                    "Origin": self.index_url,
-                    "Referer": self.index_url,
-                    "Content-Type": "application/json;charset=UTF-8"
-                },
-                playwright_page=self.context_page,
-                cookie_dict=cookie_dict,
+            self.health_monitor.start()
 
+        if self.download_media:
+            # 媒体文件在后台下载，和请求接口共用一个连接池
+            from media.downloader import MediaDownloader
+            from media.image_dedup import ImageDedup
+            image_dedup = ImageDedup(
+                media_dir, max_distance=image_dedup_max_distance, processes=image_dedup_processes
+            ) if self.dedup_images else None
+            self.media_downloader = MediaDownloader(
+                self.xhs_client.http_client, media_dir, concurrency=media_download_concurrency,
+                image_dedup=image_dedup
             )
+            await self.media_downloader.start()
+
+        if self.stream_output:
+            # 保存的笔记和评论同时分批写入 Redis Streams
+            from store.redis_stream import open_stream_sink
+            open_stream_sink()
 
+    async def crawl(self):
+        """
+        按 crawler_type 抓取
+        :return:
+        """
+        if self.crawler_type == "worker":
+            # 作为分布式爬虫的 worker，从 Redis 队列领取关键词和笔记
+            from cluster.worker import run_worker
+            await run_worker(self)
+        elif self.crawler_type == "homefeed":
+            # 同时抓取多个首页频道
+            await self.crawl_homefeed()
+        elif self.crawler_type == "recrawl":
+            # 持续刷新已知笔记
+            await self.recrawl_notes()
+        else:
             # 搜索笔记并检索它们的评论信息。
             await self.search_posts()
 
-            # 阻塞主爬虫协同程序
-            await asyncio.Event().wait()
+    async def close(self) -> Dict[str, int]:
+        """
+        收尾：停止后台任务，等排队的媒体下载和 Redis Streams 写入完成，关闭连接池、本地存储、互动历史和浏览器
+        :return: 本地存储的统计
+        """
+        for background in (self.cookie_sync, self.health_monitor):
+            if background is not None:
+                await background.stop()
+        if self.media_downloader is not None:
+            await self.media_downloader.close()
+        if self.xhs_client is not None:
+            await self.xhs_client.close()
+        if self.stream_output:
+            from store.redis_stream import close_stream_sink
+            stream_stats = await close_stream_sink()
+            if stream_stats:
+                logger.info("stream output", extra={"fields": stream_stats})
+        store_stats = close_store()
+        if engagement_history_path:
+            from store.engagement_history import close_history
+            close_history()
+        if self.browser is not None:
+            await self.browser.close()
+        return store_stats
+
+    async def open_signing_page(self, context: BrowserContext) -> Page:
+        """
+        新建页面打开首页，等签名函数加载完成后返回
+        :param context:
+        :return:
+        """
+        page = await context.new_page()
+        try:
+            await page.goto(self.index_url)
+            await page.wait_for_function(SIGN_READY_CHECK)
+        except Exception:
+            await page.close()
+            raise
+        return page
+
+    async def recycle_page(self):
+        """
+        在同一个上下文里换一个新的签名页面，旧页面上进行中的签名完成后关闭旧页面
+        :return:
+        """
+        page = await self.open_signing_page(self.browser_context)
+        old_page = await self.xhs_client.swap_page(page)
+        self.context_page = page
+        await old_page.close()
+
+    async def recycle_context(self):
+        """
+        保存当前登录态，用它新建浏览器上下文和签名页面，换下旧的上下文并关闭
+        :return:
+        """
+        old_context = self.browser_context
+        await self.save_storage_state()
+        storage_state = self.storage_state_path or await old_context.storage_state()
+        context = await self.new_browser_context(storage_state)
+        try:
+            page = await self.open_signing_page(context)
+        except Exception:
+            await context.close()
+            raise
+        await self.xhs_client.swap_page(page)
+        self.browser_context, self.context_page = context, page
+        if self.cookie_sync is not None:
+            self.cookie_sync.attach(context)
+            await self.cookie_sync.sync()
+        await old_context.close()
+
+    def create_client(self) -> XHSClient:
+        """
+        用当前的 cookies 创建请求客户端
+        :return:
+        """
+        cookie_str, cookie_dict = convert_cookies(self.cookies)
+        return XHSClient(
+            proxies=self.proxy,
+            headers={
+                "User-Agent": self.user_agent,
+                "Cookie": cookie_str,
+                "Origin": self.index_url,
+                "Referer": self.index_url,
+                "Content-Type": "application/json;charset=UTF-8"
+            },
+            playwright_page=self.context_page,
+            cookie_dict=cookie_dict,
+        )
 
     async def login(self):
         """
@@ -130,7 +283,7 @@ class XiaoHongShuSpider(Spider):
         二维码登录
         :return:
         """
-        print("开始扫描二维码，登录小红书")
+        logger.info("开始扫描二维码，登录小红书")
 
         # 1、找到登录的二维码
         base64_qrcode_img = await get_login_qrcode(
@@ -138,32 +291,25 @@ class XiaoHongShuSpider(Spider):
         )
         if not base64_qrcode_img:
             # TODO 如果本网站没有自动弹出登录对话框，我们将手动点击登录按钮
-            print("登录失败，没有找到qrcode，请检查。")
+            logger.error("登录失败，没有找到qrcode，请检查。")
             sys.exit()
         # 获取未登录会话
         current_cookie = await self.browser_context.cookies()
         _, cookie_dict = convert_cookies(current_cookie)
         no_logged_in_session = cookie_dict.get("web_session")
-        # 显示登录二维码
-        new_img = show_qrcode(base64_qrcode_img)
-
-        plt.figure(figsize=(8, 8))
-        plt.ion()  # 打开交互模式
-        plt.axis('off')  # 不需要坐标轴
-        plt.imshow(new_img)
-        plt.pause(30)  # 该句显示图片30秒
-        plt.ioff()  # 显示完后一定要配合使用plt.ioff()关闭交互模式，否则可能出奇怪的问题
-        plt.clf()  # 清空图片
-        plt.close()  # 清空窗口
-        login_flag: bool = await self.check_login_state(no_logged_in_session)
+        # 保存并打开登录二维码，不阻塞事件循环，扫码成功后立即继续
+        qrcode_img = show_qrcode(base64_qrcode_img)
+        self.save_qrcode(qrcode_img, xhs_qrcode_path)
+        logger.info(f"请在 {xhs_login_timeout} 秒内使用小红书 APP 扫描二维码：{xhs_qrcode_path}")
+        login_flag: bool = await self.wait_for_login(
+            lambda: self.check_login_state(no_logged_in_session), timeout=xhs_login_timeout
+        )
         if not login_flag:
-            print("登录失败  ，请重试")
+            logger.error("登录失败  ，请重试")
             sys.exit()
-        wait_redirect_seconds = 5
-        print(f"登录成功，等待 {wait_redirect_seconds} 秒后，进行重定向 ...")
-        await asyncio.sleep(wait_redirect_seconds)
+        logger.info("登录成功，等待重定向完成 ...")
+        await self.context_page.wait_for_load_state()
 
-    @retry(stop=stop_after_attempt(30), wait=wait_fixed(1), retry=retry_if_result(lambda value: value is False))
     async def check_login_state(self, no_logged_in_session: str) -> bool:
         """
         检查当前登录状态是否成功，返回True，否则返回False
@@ -171,7 +317,6 @@ class XiaoHongShuSpider(Spider):
         :param no_logged_in_session:
         :return:
         """
-        # 如果登录不成功，将抛出重试异常
         current_cookie = await self.browser_context.cookies()
         _, cookie_dict = convert_cookies(current_cookie)
         current_web_session = cookie_dict.get("web_session")
@@ -180,93 +325,261 @@ class XiaoHongShuSpider(Spider):
         return False
 
     async def login_by_mobile(self):
-        print("开始在小红书上执行手机号+验证码登录")
+        logger.info("开始在小红书上执行手机号+验证码登录")
         login_container_ele = await self.context_page.wait_for_selector("div.login-container")
         # 填写登录电话
         input_ele = await login_container_ele.query_selector("label.phone > input")
         await input_ele.fill(self.login_phone)
         await asyncio.sleep(0.5)
 
-        # 点击发送验证码，从redis服务器填写验证码。
+        # 点击发送验证码前清掉上次残留的验证码，然后阻塞等待短信转发服务推送过来的验证码
+        from redis_client import get_redis_client
+        from sms_code import clear_sms_code, wait_sms_code
+        redis_obj = get_redis_client()
+        await clear_sms_code(redis_obj, "xhs", self.login_phone)
         send_btn_ele = await login_container_ele.query_selector("label.auth-code > span")
         await send_btn_ele.click()
         sms_code_input_ele = await login_container_ele.query_selector("label.auth-code > input")
         submit_btn_ele = await login_container_ele.query_selector("div.input-container > button")
-        redis_obj = aioredis.from_url(url=redis_db_host, password=redis_db_pwd, decode_responses=True)
-        max_get_sms_code_time = 60 * 2
         current_cookie = await self.browser_context.cookies()
         _, cookie_dict = convert_cookies(current_cookie)
         no_logged_in_session = cookie_dict.get("web_session")
-        while max_get_sms_code_time > 0:
-            print(f"从redis剩余时间获取短信代码{max_get_sms_code_time}s ...")
-            await asyncio.sleep(1)
-            sms_code_key = f"xhs_{self.login_phone}"
-            sms_code_value = await redis_obj.get(sms_code_key)
-            if not sms_code_value:
-                max_get_sms_code_time -= 1
-                continue
+        max_get_sms_code_time = 60 * 2
+        logger.info(f"等待短信验证码推送，最多 {max_get_sms_code_time}s ...")
+        sms_code_value = await wait_sms_code(redis_obj, "xhs", self.login_phone, timeout=max_get_sms_code_time)
+        if not sms_code_value:
+            logger.error("登录失败，没有收到短信验证码")
+            sys.exit()
 
-            await sms_code_input_ele.fill(value=sms_code_value)  # 输入短信验证码
-
-            await asyncio.sleep(0.5)
-            agree_privacy_ele = self.context_page.locator("xpath=//div[@class='agreements']//*[local-name()='svg']")
-            await agree_privacy_ele.click()  # 点击“同意”隐私政策
-            await asyncio.sleep(0.5)
-            await submit_btn_ele.click()  # 点击登录按钮
-            # TODO
-            # 有必要检查验证码的正确性，因为可能输入的验证码不正确。
-            break
-        login_flag: bool = await self.check_login_state(no_logged_in_session)
+        await sms_code_input_ele.fill(value=sms_code_value)  # 输入短信验证码
+        await asyncio.sleep(0.5)
+        agree_privacy_ele = self.context_page.locator("xpath=//div[@class='agreements']//*[local-name()='svg']")
+        await agree_privacy_ele.click()  # 点击“同意”隐私政策
+        await asyncio.sleep(0.5)
+        await submit_btn_ele.click()  # 点击登录按钮
+        # TODO
+        # 有必要检查验证码的正确性，因为可能输入的验证码不正确。
+        login_flag: bool = await self.wait_for_login(
+            lambda: self.check_login_state(no_logged_in_session), timeout=xhs_login_timeout
+        )
         if not login_flag:
-            print("登录失败，请确认短信码")
+            logger.error("登录失败，请确认短信码")
             sys.exit()
-        wait_redirect_seconds = 5
-        print(f"登录成功后等待{wait_redirect_seconds} 秒后  重定向 ...")
-        await asyncio.sleep(wait_redirect_seconds)
+        logger.info("登录成功，等待重定向完成 ...")
+        await self.context_page.wait_for_load_state()
 
     async def search_posts(self):
-        print("开始搜索小红书关键词")
+        logger.info("开始搜索小红书关键词")
         # 可以修改源代码以允许传递一批关键字
         for keyword in [self.keywords]:
             note_list: List[str] = []
-            max_note_len = 2
-            page = 1
-            while max_note_len > 0:
-                # 根据关键字获取多个笔记
-                posts_res = await self.xhs_client.get_note_by_keyword(
-                    keyword=keyword,
-                    page=page,
+            note_costs: Dict[str, int] = {}
+            for note_id in await self.search_note_ids(keyword, max_note_len=2):
+                # 根据笔记id 获取笔记详情
+                note_detail = await self.get_note_detail(note_id, source_keyword=keyword)
+                if note_detail is None:
+                    continue
+                await asyncio.sleep(1)
+                note_list.append(note_id)
+                note_costs[note_id] = match_interact_info_count(
+                    (note_detail.get("interact_info") or {}).get("comment_count")
                 )
-                page += 1
-                for post_item in posts_res.get("items"):
-                    max_note_len -= 1
-                    # 获取每一个笔记的  id
-                    note_id = post_item.get("id")
-                    try:
-                        # 根据笔记id 获取笔记详情
-                        note_detail = await self.xhs_client.get_note_by_id(note_id)
-                    except DataFetchError as ex:
-                        print(ex)
-                        continue
-                    await update_xhs_note(note_detail)
-                    await asyncio.sleep(1)
-                    note_list.append(note_id)
-            print(f"keyword:{keyword}, note_list:{note_list}")
+            logger.info("keyword searched", extra={"fields": {"keyword": keyword, "note_list": note_list}})
             # 开始发送评论
             await self.send_comment(note_list)
-            # 获取笔记的评论
-            await self.batch_get_note_comments(note_list)
+            # 获取笔记的评论，评论多的笔记先开始
+            await self.batch_get_note_comments(note_list, note_costs)
 
-    async def batch_get_note_comments(self, note_list: List[str]):
-        task_list: List[Task] = []
+    async def search_note_ids(self, keyword: str, max_note_len: int) -> List[str]:
+        """
+        按关键字分页搜索，按页返回笔记 id，凑够 max_note_len 条后不再翻页
+        :param keyword:
+        :param max_note_len:
+        :return:
+        """
+        note_ids: List[str] = []
+        page = 1
+        while len(note_ids) < max_note_len:
+            # 根据关键字获取多个笔记
+            posts_res = await self.xhs_client.get_note_by_keyword(
+                keyword=keyword,
+                page=page,
+            )
+            page += 1
+            # 获取每一个笔记的  id
+            note_ids.extend(post_item.get("id") for post_item in posts_res.get("items", []))
+            if not posts_res.get("has_more", False):
+                break
+        return note_ids
+
+    async def get_note_detail(self, note_id: str, source_keyword: Optional[str] = None) -> Optional[Dict]:
+        """
+        获取笔记详情并保存，获取失败返回 None
+        :param note_id:
+        :param source_keyword: 搜到这篇笔记的关键词或频道，用于按关键词统计
+        :return:
+        """
+        try:
+            note_detail = await self.xhs_client.get_note_by_id(note_id)
+        except DataFetchError as ex:
+            logger.warning("get note detail failed", extra={"fields": {"note_id": note_id, "error": str(ex)}})
+            return None
+        await update_xhs_note(note_detail, source_keyword)
+        if self.media_downloader is not None:
+            self.submit_note_media(note_detail)
+        return note_detail
+
+    def submit_note_media(self, note_detail: Dict):
+        """
+        把笔记的图片和视频交给后台下载，不等待下载完成
+        :param note_detail:
+        :return:
+        """
+        note_id = note_detail.get("note_id", "")
+        for image in note_detail.get("image_list") or []:
+            key = image.get("file_id") or image.get("trace_id")
+            self.media_downloader.submit(key, image.get("url"), note_id=note_id, kind="image")
+        video = note_detail.get("video") or {}
+        video_key = video.get("consumer", {}).get("origin_video_key")
+        streams = video.get("media", {}).get("stream", {}).get("h264") or []
+        if video_key and streams:
+            self.media_downloader.submit(video_key.replace("/", "_"), streams[0].get("master_url"),
+                                         note_id=note_id, kind="video")
+
+    async def crawl_homefeed(self):
+        """
+        首页频道模式：多个频道同时翻页，共用一个请求预算，跨频道重复的笔记只抓一次，
+        详情和评论走和搜索模式一样的抓取、存储流程
+        :return:
+        """
+        feed_types = [FeedType[feed.upper()] for feed in self.feeds]
+        self.xhs_client.rate_limiter = TokenBucket(homefeed_request_rate)
+        pool = CostAwarePool(concurrency=comment_crawl_concurrency)
+        seen_note_ids = set()
+
+        async def crawl_feed_note(note_id: str, feed_type: FeedType):
+            note_detail = await self.get_note_detail(note_id, source_keyword=f"homefeed:{feed_type.name.lower()}")
+            if note_detail is None:
+                return
+            comment_count = match_interact_info_count(
+                (note_detail.get("interact_info") or {}).get("comment_count")
+            )
+            pool.submit(comment_count, self.crawl_note_comments, note_id, pool)
+
+        async def stream_channel(feed_type: FeedType):
+            try:
+                await page_channel(feed_type)
+            except Exception as ex:
+                # 一个频道出错只停掉这个频道，其他频道和已经排队的笔记照常抓取
+                logger.warning("feed channel failed", extra={"fields": {"feed": feed_type.name, "error": repr(ex)}})
+
+        async def page_channel(feed_type: FeedType):
+            cursor_score, note_index = "", 0
+            for _ in range(homefeed_pages_per_channel):
+                feed_res = await self.xhs_client.get_homefeed_notes(feed_type, cursor_score, note_index)
+                items = feed_res.get("items") or []
+                if not items:
+                    break
+                cursor_score = feed_res.get("cursor_score", "")
+                note_index += len(items)
+                new_notes = 0
+                for item in items:
+                    note_id = item.get("id")
+                    if item.get("model_type", "note") != "note" or not note_id or note_id in seen_note_ids:
+                        continue
+                    seen_note_ids.add(note_id)
+                    new_notes += 1
+                    # 详情优先于评论，尽快发现新笔记
+                    pool.submit(float("inf"), crawl_feed_note, note_id, feed_type)
+                logger.debug("feed page", extra={"sample": True, "fields": {
+                    "feed": feed_type.name, "notes": len(items), "new": new_notes
+                }})
+
+        logger.info("开始抓取首页频道", extra={"fields": {"feeds": [feed_type.name for feed_type in feed_types]}})
+        pool.start()
+        try:
+            await asyncio.gather(*(stream_channel(feed_type) for feed_type in feed_types))
+            await pool.join()
+        finally:
+            # 被取消（批量模式停止）时不留下还在运行的 worker
+            await pool.cancel()
+        logger.info(f"首页频道抓取完成，共 {len(seen_note_ids)} 篇笔记")
+
+    async def recrawl_notes(self):
+        """
+        监控模式：关键词搜到的笔记加上次保存的笔记，按增长速度排优先级反复刷新详情和评论
+        :return:
+        """
+        from scheduler.recrawl import RecrawlScheduler
+        scheduler = RecrawlScheduler(
+            min_interval=recrawl_min_interval,
+            max_interval=recrawl_max_interval,
+            target_change=recrawl_target_change,
+        )
+        scheduler.load(recrawl_state_path)
+        for keyword in (self.keywords or "").split(","):
+            if not keyword:
+                continue
+            for note_id in await self.search_note_ids(keyword, max_note_len=20):
+                scheduler.add(note_id)
+        # 详情和评论的所有请求共用一个请求预算
+        self.xhs_client.rate_limiter = TokenBucket(recrawl_request_rate)
+        logger.info(f"开始监控 {len(scheduler)} 篇笔记")
+        await scheduler.run(
+            self.get_note_detail, self.get_comments,
+            concurrency=recrawl_concurrency, state_path=recrawl_state_path
+        )
+
+    async def batch_get_note_comments(self, note_list: List[str], note_costs: Optional[Dict[str, int]] = None):
+        """
+        批量获取笔记评论：固定数量的 worker，按预计评论数（详情里的 comment_count）从大到小调度，
+        评论特别多的楼层的子评论拆成单独的任务，由多个 worker 分担
+        :param note_list:
+        :param note_costs: note_id -> 预计评论数
+        :return:
+        """
+        note_costs = note_costs or {}
+        pool = CostAwarePool(concurrency=comment_crawl_concurrency)
         for note_id in note_list:
-            task = asyncio.create_task(self.get_comments(note_id), name=note_id)
-            task_list.append(task)
-        await asyncio.wait(task_list)
+            pool.submit(note_costs.get(note_id, 0), self.crawl_note_comments, note_id, pool)
+        await pool.join()
+
+    async def crawl_note_comments(self, note_id: str, pool: CostAwarePool):
+        """
+        翻页获取一级评论，需要翻页的子评论作为新任务放回调度池
+        :param note_id:
+        :param pool:
+        :return:
+        """
+        logger.debug("crawl note comments", extra={"sample": True, "fields": {"note_id": note_id}})
+        comments_has_more = True
+        comments_cursor = ""
+        while comments_has_more:
+            comments_res = await self.xhs_client.get_note_comments(note_id, comments_cursor)
+            comments_has_more = comments_res.get("has_more", False)
+            comments_cursor = comments_res.get("cursor", "")
+            for comment in comments_res["comments"]:
+                await update_xhs_note_comment(note_id=note_id, comment_item=comment)
+                if not self.fetch_sub_comments:
+                    continue
+                for sub_comment in XHSClient.attach_root_comment_id(comment):
+                    await update_xhs_note_comment(note_id=note_id, comment_item=sub_comment)
+                if XHSClient.has_more_sub_comments(comment):
+                    pool.submit(int(comment["sub_comment_count"]), self.crawl_sub_comments, note_id, comment)
+            await asyncio.sleep(random.random())
+
+    async def crawl_sub_comments(self, note_id: str, comment: Dict):
+        sub_comments = await self.xhs_client.get_remaining_sub_comments(
+            note_id, comment, crawl_interval=random.random()
+        )
+        for sub_comment in sub_comments:
+            await update_xhs_note_comment(note_id=note_id, comment_item=sub_comment)
 
     async def get_comments(self, note_id: str):
-        print(f"开始获取{note_id} 内容 ")
-        all_comments = await self.xhs_client.get_note_all_comments(note_id=note_id, crawl_interval=random.random())
+        logger.debug("crawl note comments", extra={"sample": True, "fields": {"note_id": note_id}})
+        all_comments = await self.xhs_client.get_note_all_comments(
+            note_id=note_id, crawl_interval=random.random(), is_fetch_sub_comments=self.fetch_sub_comments
+        )
         for comment in all_comments:
             await update_xhs_note_comment(note_id=note_id, comment_item=comment)
 
@@ -277,7 +590,7 @@ class XiaoHongShuSpider(Spider):
         :return:
         """
         for note_id in note_list:
-            print(f"开始发送{note_id} 评论内容 ")
+            logger.info(f"开始发送{note_id} 评论内容 ")
             res_comment = await self.xhs_client.send_comment(note_id=note_id, content="真不错!!")
-            print(f"评论成功------{res_comment}")
+            logger.info(f"评论成功------{res_comment}")
             await asyncio.sleep(3)
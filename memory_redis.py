@@ -0,0 +1,310 @@
+# An in-process stand-in for the subset of Redis commands this project uses.
+# Select it with `redis_db_host = "memory://"` to run the SMS login flow (or anything
+# else built on redis_client.get_redis_client) inside one process without a Redis server.
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+
+class MemoryRedis:
+    """
+    Mimics the async aioredis client API (decode_responses=True) on top of plain dicts.
+    Blocking pops wake up as soon as another coroutine pushes, just like BLPOP does.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expire_at: Dict[str, float] = {}
+        self._changed: Optional[asyncio.Condition] = None
+
+    @property
+    def changed(self) -> asyncio.Condition:
+        # created lazily so the condition is bound to the running loop
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    async def _notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def _alive(self, name: str) -> bool:
+        expire_at = self._expire_at.get(name)
+        if expire_at is not None and expire_at <= time.time():
+            self._data.pop(name, None)
+            self._expire_at.pop(name, None)
+        return name in self._data
+
+    def _list(self, name: str) -> List[str]:
+        if not self._alive(name):
+            self._data[name] = []
+        return self._data[name]
+
+    # strings
+    async def get(self, name: str) -> Optional[str]:
+        return self._data.get(name) if self._alive(name) else None
+
+    async def set(self, name: str, value: Any, ex: Optional[int] = None) -> bool:
+        self._data[name] = str(value)
+        self._expire_at.pop(name, None)
+        if ex:
+            self._expire_at[name] = time.time() + ex
+        return True
+
+    # keys
+    async def delete(self, *names: str) -> int:
+        deleted = 0
+        for name in names:
+            if self._alive(name):
+                deleted += 1
+            self._data.pop(name, None)
+            self._expire_at.pop(name, None)
+        return deleted
+
+    async def expire(self, name: str, time_seconds: int) -> bool:
+        if not self._alive(name):
+            return False
+        self._expire_at[name] = time.time() + time_seconds
+        return True
+
+    # lists
+    async def lpush(self, name: str, *values: Any) -> int:
+        items = self._list(name)
+        for value in values:
+            items.insert(0, str(value))
+        await self._notify()
+        return len(items)
+
+    async def rpush(self, name: str, *values: Any) -> int:
+        items = self._list(name)
+        items.extend(str(value) for value in values)
+        await self._notify()
+        return len(items)
+
+    async def llen(self, name: str) -> int:
+        return len(self._data[name]) if self._alive(name) else 0
+
+    def _pop_first(self, keys: Sequence[str], left: bool) -> Optional[Tuple[str, str]]:
+        for key in keys:
+            if self._alive(key) and self._data[key]:
+                value = self._data[key].pop(0 if left else -1)
+                return key, value
+        return None
+
+    async def _blocking_pop(self, keys: Union[str, Sequence[str]], timeout: float, left: bool):
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        async with self.changed:
+            while True:
+                popped = self._pop_first(keys, left)
+                if popped is not None:
+                    return popped
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return None
+
+    async def blpop(self, keys: Union[str, Sequence[str]], timeout: float = 0):
+        return await self._blocking_pop(keys, timeout, left=True)
+
+    async def brpop(self, keys: Union[str, Sequence[str]], timeout: float = 0):
+        return await self._blocking_pop(keys, timeout, left=False)
+
+    async def lrange(self, name: str, start: int, end: int) -> List[str]:
+        if not self._alive(name):
+            return []
+        items = self._data[name]
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def lrem(self, name: str, count: int, value: Any) -> int:
+        if not self._alive(name):
+            return 0
+        items, value = self._data[name], str(value)
+        removed, kept = 0, []
+        for item in items:
+            if item == value and (count == 0 or removed < abs(count)):
+                removed += 1
+                continue
+            kept.append(item)
+        self._data[name] = kept
+        return removed
+
+    async def rpoplpush(self, src: str, dst: str) -> Optional[str]:
+        popped = self._pop_first([src], left=False)
+        if popped is None:
+            return None
+        self._list(dst).insert(0, popped[1])
+        return popped[1]
+
+    async def brpoplpush(self, src: str, dst: str, timeout: float = 0) -> Optional[str]:
+        popped = await self._blocking_pop(src, timeout, left=False)
+        if popped is None:
+            return None
+        self._list(dst).insert(0, popped[1])
+        return popped[1]
+
+    # counters
+    async def incr(self, name: str, amount: int = 1) -> int:
+        value = int(self._data[name]) + amount if self._alive(name) else amount
+        self._data[name] = str(value)
+        return value
+
+    # sets
+    def _set(self, name: str) -> set:
+        if not self._alive(name):
+            self._data[name] = set()
+        return self._data[name]
+
+    async def sadd(self, name: str, *values: Any) -> int:
+        members = self._set(name)
+        added = {str(value) for value in values} - members
+        members.update(added)
+        return len(added)
+
+    async def sismember(self, name: str, value: Any) -> bool:
+        return self._alive(name) and str(value) in self._data[name]
+
+    async def scard(self, name: str) -> int:
+        return len(self._data[name]) if self._alive(name) else 0
+
+    # hashes
+    def _hash(self, name: str) -> Dict[str, str]:
+        if not self._alive(name):
+            self._data[name] = {}
+        return self._data[name]
+
+    async def hget(self, name: str, key: Any) -> Optional[str]:
+        return self._data[name].get(str(key)) if self._alive(name) else None
+
+    async def hsetnx(self, name: str, key: Any, value: Any) -> bool:
+        fields = self._hash(name)
+        if str(key) in fields:
+            return False
+        fields[str(key)] = str(value)
+        return True
+
+    async def hincrby(self, name: str, key: Any, amount: int = 1) -> int:
+        fields = self._hash(name)
+        value = int(fields.get(str(key), 0)) + amount
+        fields[str(key)] = str(value)
+        return value
+
+    async def hdel(self, name: str, *keys: Any) -> int:
+        if not self._alive(name):
+            return 0
+        fields = self._data[name]
+        return sum(1 for key in keys if fields.pop(str(key), None) is not None)
+
+    # sorted sets
+    def _zset(self, name: str) -> Dict[str, float]:
+        if not self._alive(name):
+            self._data[name] = {}
+        return self._data[name]
+
+    async def zadd(self, name: str, mapping: Dict[Any, float]) -> int:
+        members = self._zset(name)
+        added = sum(1 for member in mapping if str(member) not in members)
+        members.update({str(member): float(score) for member, score in mapping.items()})
+        return added
+
+    async def zscore(self, name: str, value: Any) -> Optional[float]:
+        return self._data[name].get(str(value)) if self._alive(name) else None
+
+    async def zrem(self, name: str, *values: Any) -> int:
+        if not self._alive(name):
+            return 0
+        members = self._data[name]
+        return sum(1 for value in values if members.pop(str(value), None) is not None)
+
+    async def zcard(self, name: str) -> int:
+        return len(self._data[name]) if self._alive(name) else 0
+
+    async def zrangebyscore(self, name: str, min: Union[float, str], max: Union[float, str],
+                            start: Optional[int] = None, num: Optional[int] = None, withscores: bool = False):
+        if not self._alive(name):
+            return []
+        low, high = float(min), float(max)
+        ranked = sorted((score, member) for member, score in self._data[name].items() if low <= score <= high)
+        if start is not None and num is not None:
+            ranked = ranked[start:start + num]
+        return [(member, score) for score, member in ranked] if withscores else [member for _, member in ranked]
+
+    # streams
+    def _stream(self, name: str) -> List[Tuple[str, Dict[str, str]]]:
+        if not self._alive(name):
+            self._data[name] = []
+        return self._data[name]
+
+    async def xadd(self, name: str, fields: Dict[Any, Any], id: str = "*", maxlen: Optional[int] = None,
+                   approximate: bool = True) -> str:
+        entries = self._stream(name)
+        if id == "*":
+            now_ms = int(time.time() * 1000)
+            last_ms, last_seq = map(int, entries[-1][0].split("-")) if entries else (0, -1)
+            # ids only grow, even when the clock goes back
+            id = f"{now_ms}-0" if now_ms > last_ms else f"{last_ms}-{last_seq + 1}"
+        entries.append((id, {
+            str(key): value.decode() if isinstance(value, bytes) else str(value) for key, value in fields.items()
+        }))
+        if maxlen is not None and len(entries) > maxlen:
+            # MAXLEN ~ may keep a few more entries than asked for, trimming exactly is allowed too
+            del entries[:len(entries) - maxlen]
+        await self._notify()
+        return id
+
+    async def xlen(self, name: str) -> int:
+        return len(self._data[name]) if self._alive(name) else 0
+
+    async def xrange(self, name: str, min: str = "-", max: str = "+",
+                     count: Optional[int] = None) -> List[Tuple[str, Dict[str, str]]]:
+        if not self._alive(name):
+            return []
+
+        def key(entry_id: str, default_seq: float) -> Tuple[int, float]:
+            ms, _, seq = entry_id.partition("-")
+            return int(ms), int(seq) if seq else default_seq
+
+        low = (0, 0) if min == "-" else key(min, 0)
+        high = (float("inf"), 0) if max == "+" else key(max, float("inf"))
+        entries = [entry for entry in self._data[name] if low <= key(entry[0], 0) <= high]
+        return entries[:count] if count is not None else entries
+
+    def pipeline(self, transaction: bool = True) -> "MemoryPipeline":
+        return MemoryPipeline(self)
+
+    async def close(self):
+        pass
+
+
+class MemoryPipeline:
+    """
+    Buffers commands and runs them in order on execute(), like an aioredis pipeline.
+    """
+
+    def __init__(self, redis: MemoryRedis):
+        self._redis = redis
+        self._commands: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, command: str):
+        if not hasattr(self._redis, command):
+            raise AttributeError(command)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> List[Any]:
+        commands, self._commands = self._commands, []
+        return [await getattr(self._redis, command)(*args, **kwargs) for command, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._commands = []
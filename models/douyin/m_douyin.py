@@ -0,0 +1,53 @@
+import logging
+from typing import Dict
+
+import utils
+from store.sqlite_store import get_store
+
+logger = logging.getLogger("douyin")
+
+
+async def update_douyin_aweme(aweme_item: Dict):
+    aweme_id = aweme_item.get("aweme_id")
+    user_info = aweme_item.get("author", {})
+    interact_info = aweme_item.get("statistics", {})
+    local_db_item = {
+        "aweme_id": aweme_id,
+        "aweme_type": aweme_item.get("aweme_type"),
+        "title": aweme_item.get("desc", ""),
+        "desc": aweme_item.get("desc", ""),
+        "create_time": aweme_item.get("create_time"),
+        "user_id": user_info.get("uid"),
+        "sec_uid": user_info.get("sec_uid"),
+        "nickname": user_info.get("nickname"),
+        "avatar": ((user_info.get("avatar_thumb") or {}).get("url_list") or [""])[0],
+        "liked_count": interact_info.get("digg_count"),
+        "collected_count": interact_info.get("collect_count"),
+        "comment_count": interact_info.get("comment_count"),
+        "share_count": interact_info.get("share_count"),
+        "ip_location": aweme_item.get("ip_label", ""),
+        "last_modify_ts": utils.get_current_timestamp(),
+    }
+    get_store().upsert_aweme(local_db_item)
+    logger.debug("update aweme", extra={"sample": True, "fields": {
+        key: local_db_item[key] for key in ("aweme_id", "title", "nickname", "user_id")
+    }})
+
+
+async def update_dy_aweme_comment(aweme_id: str, comment_item: Dict):
+    user_info = comment_item.get("user", {})
+    comment_id = comment_item.get("cid")
+    local_db_item = {
+        "comment_id": comment_id,
+        "create_time": comment_item.get("create_time"),
+        "ip_location": comment_item.get("ip_label", ""),
+        "aweme_id": aweme_id,
+        "content": comment_item.get("text"),
+        "user_id": user_info.get("uid"),
+        "nickname": user_info.get("nickname"),
+        "avatar": ((user_info.get("avatar_thumb") or {}).get("url_list") or [""])[0],
+        "sub_comment_count": comment_item.get("reply_comment_total", 0),
+        "last_modify_ts": utils.get_current_timestamp(),
+    }
+    get_store().upsert_aweme_comment(local_db_item)
+    logger.debug("update comment", extra={"sample": True, "fields": local_db_item})
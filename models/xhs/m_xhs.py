@@ -1,13 +1,19 @@
-from typing import Dict
+import logging
+from typing import Dict, Optional
 
+import config
 import utils
+from store.redis_stream import COMMENTS, NOTES, get_stream_sink
+from store.sqlite_store import get_store
 
+logger = logging.getLogger("xhs")
 
-async def update_xhs_note(note_item: Dict):
+
+async def update_xhs_note(note_item: Dict, source_keyword: Optional[str] = None):
     note_id = note_item.get("note_id")
     user_info = note_item.get("user", {})
-    interact_info = note_item.get("interact_info")
-    image_list = note_item.get("image_list")
+    interact_info = note_item.get("interact_info") or {}
+    image_list = note_item.get("image_list") or []
 
     local_db_item = {
         "note_id": note_item.get("note_id"),
@@ -21,11 +27,28 @@ async def update_xhs_note(note_item: Dict):
         "avatar": user_info.get("avatar"),
         "ip_location": note_item.get("ip_location", ""),
         "image_list": ','.join([img.get('url') for img in image_list]),
+        "liked_count": utils.match_interact_info_count(interact_info.get("liked_count")),
+        "collected_count": utils.match_interact_info_count(interact_info.get("collected_count")),
+        "comment_count": utils.match_interact_info_count(interact_info.get("comment_count")),
+        "share_count": utils.match_interact_info_count(interact_info.get("share_count")),
+        # 搜到这篇笔记的关键词（首页频道模式是 homefeed:频道），不知道时保留上次保存的
+        "source_keyword": source_keyword or None,
         "last_modify_ts": utils.get_current_timestamp(),
     }
-    # do something ...
-    # print("update note:", local_db_item)
-    print((local_db_item["note_id"], local_db_item["title"], local_db_item["nickname"],  local_db_item["user_id"]))
+    get_store().upsert_note(local_db_item)
+    if config.engagement_history_path:
+        # 笔记行只保留最新的互动数，每次刷新的数值另存一份时间序列；用到时才导入（会加载 numpy）
+        from store.engagement_history import COLUMNS, get_history
+        history = get_history()
+        if history is not None:
+            history.append(note_id, local_db_item["last_modify_ts"], [local_db_item[column] for column in COLUMNS])
+    sink = get_stream_sink()
+    if sink is not None:
+        # Redis 跟不上时在这里等待，爬虫随之放慢
+        await sink.publish(NOTES, local_db_item)
+    logger.debug("update note", extra={"sample": True, "fields": {
+        key: local_db_item[key] for key in ("note_id", "title", "nickname", "user_id")
+    }})
 
 
 async def update_xhs_note_comment(note_id: str, comment_item: Dict):
@@ -41,7 +64,14 @@ async def update_xhs_note_comment(note_id: str, comment_item: Dict):
         "nickname": user_info.get("nickname"),
         "avatar": user_info.get("image"),
         "sub_comment_count": comment_item.get("sub_comment_count"),
+        # 子评论属于哪条一级评论、回复的是哪条评论（回复一级评论时就是一级评论本身）
+        "root_comment_id": comment_item.get("root_comment_id", ""),
+        "parent_comment_id": (comment_item.get("target_comment") or {}).get("id")
+        or comment_item.get("root_comment_id", ""),
         "last_modify_ts": utils.get_current_timestamp(),
     }
-    # do something ...
-    print("update comment:", local_db_item)
+    get_store().upsert_comment(local_db_item)
+    sink = get_stream_sink()
+    if sink is not None:
+        await sink.publish(COMMENTS, local_db_item)
+    logger.debug("update comment", extra={"sample": True, "fields": local_db_item})
@@ -0,0 +1,353 @@
+# Read-only HTTP API over the crawl database (store.sqlite_store).
+#
+#   GET /notes                       ?user_id= &since= &until= &q= &after= &limit= &format=ndjson
+#   GET /notes/<note_id>
+#   GET /notes/<note_id>/comments    ?after= &limit= &format=ndjson
+#   GET /notes/<note_id>/threads     ?limit=     thread statistics and the most replied root comments
+#   GET /comments                    ?user_id= &since= &until= &q= &after= &limit= &format=ndjson
+#   GET /comments/<comment_id>/thread               the comment and its replies, with their depth
+#
+# since/until are millisecond timestamps (note time / comment create_time), q is a full-text
+# query (store.fts). Pages use keyset pagination on the row id: a page returns
+# {"items": [...], "next_after": id} and the next page is requested with ?after=id, so deep
+# pages cost the same as the first one. format=ndjson (or Accept: application/x-ndjson)
+# streams every matching row as JSON lines, fetched and flushed in keyset batches, so a full
+# export never sits in memory and never holds a read transaction open for long.
+#
+# The database is opened read-only (WAL readers never block the crawler's writer). ETags
+# come from the database files' modification times plus the request uri, so a client
+# revalidating with If-None-Match gets a 304 without a query being run. The comment tree
+# index of a note is built once per data version and kept for the most recently used
+# notes; thread requests fetch only the comment rows they return.
+#
+#   python query_service.py --db data/crawler.db
+#   python query_service.py --prod --processes 0
+import os
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import argparse
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import tornado.web
+import tornado.netutil
+import tornado.process
+import tornado.httpserver
+
+import config
+import json_codec
+from logger import setup_logging
+from store.comment_tree import CommentTreeIndex
+from store.fts import build_match_query
+from store.sqlite_store import COMMENT_COLUMNS, NOTE_COLUMNS
+
+logger = logging.getLogger("query_service")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# rows fetched and flushed per step of an NDJSON export
+STREAM_BATCH_SIZE = 1000
+# comment ids bound per IN (...) query, below SQLite's variable limit
+ID_BATCH_SIZE = 500
+# notes whose comment tree index is kept between requests
+TREE_CACHE_SIZE = 256
+
+
+def open_read_only(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = 1")
+    # the first read opens the -wal/-shm files, do it now so data_version() is stable from the first request
+    conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+    return conn
+
+
+class Table:
+    """
+    How to filter one stored table: its time column and its FTS5 table.
+    """
+
+    def __init__(self, name: str, columns, time_column: str, fts_table: str):
+        self.name = name
+        self.time_column = time_column
+        self.fts_table = fts_table
+        self.select = "SELECT id, " + ", ".join(f'"{column}"' for column in columns) + f" FROM {name}"
+
+
+NOTES = Table("xhs_note", NOTE_COLUMNS, "time", "xhs_note_fts")
+COMMENTS = Table("xhs_note_comment", COMMENT_COLUMNS, "create_time", "xhs_note_comment_fts")
+
+
+def build_where(table: Table, filters: Dict) -> Tuple[str, List]:
+    clauses, params = [], []
+    for column in ("user_id", "note_id"):
+        if filters.get(column):
+            clauses.append(f"{column} = ?")
+            params.append(filters[column])
+    if filters.get("since") is not None:
+        clauses.append(f"{table.time_column} >= ?")
+        params.append(filters["since"])
+    if filters.get("until") is not None:
+        clauses.append(f"{table.time_column} < ?")
+        params.append(filters["until"])
+    if filters.get("match"):
+        clauses.append(f"id IN (SELECT rowid FROM {table.fts_table} WHERE {table.fts_table} MATCH ?)")
+        params.append(filters["match"])
+    return " AND ".join(clauses), params
+
+
+def fetch_page(conn: sqlite3.Connection, table: Table, filters: Dict, after: int, limit: int) -> List[Dict]:
+    where, params = build_where(table, filters)
+    sql = f"{table.select} WHERE id > ?" + (f" AND {where}" if where else "") + " ORDER BY id LIMIT ?"
+    return [dict(row) for row in conn.execute(sql, [after, *params, limit])]
+
+
+def fetch_comments(conn: sqlite3.Connection, comment_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Comment rows by comment id, queried in batches of ID_BATCH_SIZE ids.
+    """
+    rows = {}
+    for begin in range(0, len(comment_ids), ID_BATCH_SIZE):
+        batch = comment_ids[begin:begin + ID_BATCH_SIZE]
+        sql = f"{COMMENTS.select} WHERE comment_id IN ({', '.join('?' for _ in batch)})"
+        rows.update((row["comment_id"], dict(row)) for row in conn.execute(sql, batch))
+    return rows
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    table: Table = NOTES
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        return self.application.db
+
+    def compute_etag(self) -> Optional[str]:
+        # ETags are set up front in not_modified(), never by hashing the response body
+        return None
+
+    def not_modified(self) -> bool:
+        """
+        Set the ETag for the current data version and uri; True (and a 304) when the client has it.
+        """
+        version = "-".join(str(mtime) for mtime in self.application.data_version())
+        etag = '"%s"' % hashlib.sha1(f"{version}|{self.request.uri}".encode("utf-8")).hexdigest()
+        self.set_header("Etag", etag)
+        if etag in self.request.headers.get("If-None-Match", ""):
+            self.set_status(304)
+            self.finish()
+            return True
+        return False
+
+    def int_argument(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        value = self.get_argument(name, None)
+        if value is None or value == "":
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, f"{name} must be an integer")
+
+    def filters(self) -> Dict:
+        filters = {
+            "user_id": self.get_argument("user_id", None),
+            "since": self.int_argument("since"),
+            "until": self.int_argument("until"),
+        }
+        query = self.get_argument("q", "")
+        if query:
+            filters["match"] = build_match_query(query)
+            if not filters["match"]:
+                raise tornado.web.HTTPError(400, "q has nothing searchable")
+        return filters
+
+    def wants_ndjson(self) -> bool:
+        return (self.get_argument("format", "") == "ndjson"
+                or "application/x-ndjson" in self.request.headers.get("Accept", ""))
+
+    def write_json(self, data):
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(json_codec.dumps(data))
+
+    async def respond(self, filters: Dict):
+        if self.not_modified():
+            return
+        after = self.int_argument("after", 0)
+        if self.wants_ndjson():
+            await self.stream(filters, after)
+            return
+        limit = min(max(self.int_argument("limit", DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        items = fetch_page(self.db, self.table, filters, after, limit)
+        next_after = items[-1]["id"] if len(items) == limit else None
+        self.write_json({"items": items, "next_after": next_after})
+
+    async def stream(self, filters: Dict, after: int):
+        self.set_header("Content-Type", "application/x-ndjson; charset=UTF-8")
+        while True:
+            rows = fetch_page(self.db, self.table, filters, after, STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            self.write(b"".join(json_codec.dumps(row) + b"\n" for row in rows))
+            # hands the batch to the socket and lets other requests run
+            await self.flush()
+            if len(rows) < STREAM_BATCH_SIZE:
+                break
+            after = rows[-1]["id"]
+
+
+class NotesHandler(BaseHandler):
+    table = NOTES
+
+    async def get(self):
+        await self.respond(self.filters())
+
+
+class NoteHandler(BaseHandler):
+    table = NOTES
+
+    async def get(self, note_id: str):
+        if self.not_modified():
+            return
+        row = self.db.execute(f"{NOTES.select} WHERE note_id = ?", (note_id,)).fetchone()
+        if row is None:
+            raise tornado.web.HTTPError(404)
+        self.write_json(dict(row))
+
+
+class NoteCommentsHandler(BaseHandler):
+    table = COMMENTS
+
+    async def get(self, note_id: str):
+        await self.respond({"note_id": note_id})
+
+
+class CommentsHandler(BaseHandler):
+    table = COMMENTS
+
+    async def get(self):
+        await self.respond(self.filters())
+
+
+class NoteThreadsHandler(BaseHandler):
+    table = COMMENTS
+
+    async def get(self, note_id: str):
+        """
+        Thread statistics of a note and its root comments with the most replies.
+        """
+        if self.not_modified():
+            return
+        limit = min(max(self.int_argument("limit", 10), 1), MAX_PAGE_SIZE)
+        tree = self.application.comment_tree(note_id)
+        top = tree.top_threads(limit, note_id)
+        rows = fetch_comments(self.db, [comment_id for comment_id, _ in top])
+        self.write_json({
+            "stats": tree.stats(note_id),
+            "threads": [{"replies": replies, "comment": rows.get(comment_id)} for comment_id, replies in top],
+        })
+
+
+class CommentThreadHandler(BaseHandler):
+    table = COMMENTS
+
+    async def get(self, comment_id: str):
+        """
+        The comment and every reply below it in thread order, each with its depth below the comment.
+        """
+        if self.not_modified():
+            return
+        row = self.db.execute("SELECT note_id FROM xhs_note_comment WHERE comment_id = ?", (comment_id,)).fetchone()
+        if row is None:
+            raise tornado.web.HTTPError(404)
+        subtree = self.application.comment_tree(row["note_id"]).subtree(comment_id)
+        rows = fetch_comments(self.db, [node_id for node_id, _ in subtree])
+        self.write_json({"items": [{**rows[node_id], "depth": depth} for node_id, depth in subtree if node_id in rows]})
+
+
+class Application(tornado.web.Application):
+    def __init__(self, db_path: str, autoreload: bool = True):
+        handlers = [
+            (r'/notes', NotesHandler),
+            (r'/notes/([^/]+)', NoteHandler),
+            (r'/notes/([^/]+)/comments', NoteCommentsHandler),
+            (r'/notes/([^/]+)/threads', NoteThreadsHandler),
+            (r'/comments', CommentsHandler),
+            (r'/comments/([^/]+)/thread', CommentThreadHandler),
+        ]
+        settings = dict(
+            gzip=True,
+            autoescape=None,
+            autoreload=autoreload
+        )
+        super(Application, self).__init__(handlers, **settings)
+        self.db_path = db_path
+        self.db = open_read_only(db_path)
+        # note_id -> (data version, comment tree index of the note), least recently used first
+        self.trees: "OrderedDict[str, Tuple[Tuple[int, ...], CommentTreeIndex]]" = OrderedDict()
+
+    def data_version(self) -> Tuple[int, ...]:
+        """
+        Changes whenever the crawler commits: every commit appends to the -wal file,
+        checkpoints rewrite the main file.
+        """
+        versions = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            try:
+                versions.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                versions.append(0)
+        return tuple(versions)
+
+    def comment_tree(self, note_id: str) -> CommentTreeIndex:
+        """
+        The comment tree index of a note, rebuilt only when the crawler committed since it was built.
+        """
+        version = self.data_version()
+        cached = self.trees.pop(note_id, None)
+        if cached is not None and cached[0] == version:
+            tree = cached[1]
+        else:
+            tree = CommentTreeIndex.from_db(self.db, note_id)
+        self.trees[note_id] = (version, tree)
+        if len(self.trees) > TREE_CACHE_SIZE:
+            self.trees.popitem(last=False)
+        return tree
+
+
+async def serve(sockets, db_path: str, autoreload: bool):
+    app = Application(db_path, autoreload=autoreload)
+    server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    server.add_sockets(sockets)
+    logger.info("Query service running ...", extra={"fields": {"pid": os.getpid(), "db": db_path}})
+    shutdown_event = tornado.locks.Event()
+    await shutdown_event.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="read-only API over the crawl database.")
+    parser.add_argument('--port', type=int, default=config.query_service_port)
+    parser.add_argument('--db', type=str, default=config.sqlite_db_path)
+    parser.add_argument('--prod', action='store_true',
+                        help='production mode: no autoreload, multi-process, info level logging')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='worker processes in production mode, 0 means one per CPU')
+    parser.add_argument('--json_log', action='store_true', help='write logs as JSON lines')
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"database {args.db} does not exist, run the crawler first")
+
+    sockets = tornado.netutil.bind_sockets(args.port)
+    if args.prod:
+        tornado.process.fork_processes(args.processes)
+    setup_logging(level="INFO" if args.prod else "DEBUG", json_format=args.json_log)
+    if args.prod:
+        logging.getLogger("tornado.access").setLevel(logging.WARNING)
+    asyncio.run(serve(sockets, db_path=args.db, autoreload=not args.prod))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -1,20 +1,38 @@
 # Start an HTTP server to receive SMS forwarding notifications and store them in Redis.
+#
+# Development: python recv_sms_notification.py
+# Production:  python recv_sms_notification.py --prod --processes 0
+#   no autoreload, one forked worker per CPU sharing the listening socket, request size
+#   limits and queued (non-blocking) logging.
+import os
 import re
 import json
 import asyncio
+import logging
+import argparse
 
-import aioredis
 import tornado.web
+import tornado.netutil
+import tornado.process
+import tornado.httpserver
 
 import config
+from logger import setup_logging
+from redis_client import get_redis_client
+from sms_code import push_sms_code
+
+logger = logging.getLogger("recv_sms")
+
+VERIFICATION_CODE_PATTERN = re.compile(r'\b[0-9]{6}\b')
+# an SMS notification is a few hundred bytes, anything near this is not from the forwarder
+DEFAULT_MAX_BODY_SIZE = 16 * 1024
 
 
 def extract_verification_code(message) -> str:
     """
     Extract verification code of 6 digits from the SMS.
     """
-    pattern = re.compile(r'\b[0-9]{6}\b')
-    codes = pattern.findall(message)
+    codes = VERIFICATION_CODE_PATTERN.findall(message or "")
     return codes[0] if codes and len(codes) > 0 else ""
 
 
@@ -43,43 +61,90 @@ class RecvSmsNotificationHandler(tornado.web.RequestHandler):
         #    'sms_content': '【小红书】您的验证码是: 171959， 3分钟内有效。请勿向他人泄漏。如非本人操作，可忽略本消息。',
         #    'timestamp': '1686720601614'
         # }
-        request_body = self.request.body.decode("utf-8")
-        req_body_dict = json.loads(request_body)
-        print("recv sms notification and body content: ", req_body_dict)
-        redis_obj = aioredis.from_url(url=config.redis_db_host, password=config.redis_db_pwd, decode_responses=True)
+        try:
+            # json.loads accepts the raw bytes, no need to decode the body first
+            req_body_dict = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            self.write("invalid json")
+            return
+        if not isinstance(req_body_dict, dict):
+            self.set_status(400)
+            self.write("invalid body")
+            return
+        logger.debug("recv sms notification", extra={"fields": req_body_dict})
         sms_content = req_body_dict.get("sms_content")
         sms_code = extract_verification_code(sms_content)
         if sms_code:
-            # Save the verification code in Redis and set the expiration time to 3 minutes.
-            # Use Redis string data structure, in the following format:
-            # xhs_138xxxxxxxx -> 171959
-            key = f"{req_body_dict.get('platform')}_{req_body_dict.get('current_number')}"
-            await redis_obj.set(name=key, value=sms_code, ex=60 * 3)
+            # Push the verification code onto a Redis list that expires after 3 minutes,
+            # the waiting spider is blocked on BLPOP and wakes up immediately:
+            # xhs_138xxxxxxxx -> [171959]
+            await push_sms_code(
+                self.application.redis,
+                platform=req_body_dict.get("platform"),
+                phone=req_body_dict.get("current_number"),
+                code=sms_code,
+            )
+            logger.info("sms code pushed", extra={"fields": {
+                "platform": req_body_dict.get("platform"),
+                "phone": req_body_dict.get("current_number"),
+            }})
         self.set_status(200)
         self.write("ok")
 
 
 class Application(tornado.web.Application):
-    def __init__(self):
+    def __init__(self, autoreload: bool = True):
         handlers = [(r'/', RecvSmsNotificationHandler)]
         settings = dict(
             gzip=True,
             autoescape=None,
-            autoreload=True
+            autoreload=autoreload
         )
         super(Application, self).__init__(handlers, **settings)
+        # one client (and connection pool) shared by all requests
+        self.redis = get_redis_client()
 
 
-async def main():
-    app = Application()
-    app.listen(port=9435)
-    print("Recv sms notification app running ...")
+async def serve(sockets, max_body_size: int, autoreload: bool):
+    app = Application(autoreload=autoreload)
+    server = tornado.httpserver.HTTPServer(
+        app, max_body_size=max_body_size, max_header_size=max_body_size, xheaders=True
+    )
+    server.add_sockets(sockets)
+    logger.info("Recv sms notification app running ...", extra={"fields": {"pid": os.getpid()}})
     shutdown_event = tornado.locks.Event()
     await shutdown_event.wait()
 
 
+def main():
+    parser = argparse.ArgumentParser(description="receive SMS forwarding notifications.")
+    parser.add_argument('--port', type=int, default=9435)
+    parser.add_argument('--prod', action='store_true',
+                        help='production mode: no autoreload, multi-process, info level logging')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='worker processes in production mode, 0 means one per CPU')
+    parser.add_argument('--max_body_size', type=int, default=DEFAULT_MAX_BODY_SIZE,
+                        help='reject requests with a larger body (bytes)')
+    parser.add_argument('--redis', type=str, default=config.redis_db_host,
+                        help='redis url, memory:// for the in-process stand-in')
+    parser.add_argument('--json_log', action='store_true', help='write logs as JSON lines')
+    args = parser.parse_args()
+    config.redis_db_host = args.redis
+
+    # sockets are bound before forking, so every worker accepts on the same listening socket
+    sockets = tornado.netutil.bind_sockets(args.port)
+    if args.prod:
+        tornado.process.fork_processes(args.processes)
+    setup_logging(level="INFO" if args.prod else "DEBUG", json_format=args.json_log)
+    if args.prod:
+        # one access log line per webhook is pure overhead under bursts
+        logging.getLogger("tornado.access").setLevel(logging.WARNING)
+    asyncio.run(serve(sockets, max_body_size=args.max_body_size, autoreload=not args.prod))
+
+
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
         pass
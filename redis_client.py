@@ -0,0 +1,36 @@
+# Shared Redis clients. Every caller for the same url gets the same client, so all
+# commands go through one connection pool instead of opening a connection per call.
+from typing import Dict, Optional
+
+import config
+
+_clients: Dict[str, object] = {}
+
+
+def get_redis_client(url: Optional[str] = None, password: Optional[str] = None):
+    """
+    Return the process-wide client for `url` (config.redis_db_host by default).
+    A url starting with memory:// returns the in-process MemoryRedis stand-in.
+    """
+    url = url or config.redis_db_host
+    client = _clients.get(url)
+    if client is not None:
+        return client
+    if url.startswith("memory://"):
+        from memory_redis import MemoryRedis
+        client = MemoryRedis()
+    else:
+        # aioredis is only needed by the features that talk to Redis
+        import aioredis
+        pool = aioredis.ConnectionPool.from_url(
+            url, password=password or config.redis_db_pwd, decode_responses=True
+        )
+        client = aioredis.Redis(connection_pool=pool)
+    _clients[url] = client
+    return client
+
+
+async def close_redis_clients():
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
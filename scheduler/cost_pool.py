@@ -0,0 +1,70 @@
+# Bounded worker pool that runs the most expensive work first.
+#
+# Running jobs in list order lets one huge job that happens to start late finish long after
+# everything else. Longest-processing-time-first (LPT) scheduling starts the big jobs while
+# the small ones fill the gaps, which keeps the makespan close to the lower bound. Jobs can
+# submit follow-up jobs (e.g. one per large comment thread), so a single huge item is split
+# across several workers instead of being crawled by one.
+import asyncio
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict
+
+logger = logging.getLogger("scheduler")
+
+
+class CostAwarePool:
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self._queue: "asyncio.PriorityQueue" = asyncio.PriorityQueue()
+        # tie breaker so equal costs keep submission order and callables are never compared
+        self._seq = itertools.count()
+        self.stats: Dict[str, int] = {"done": 0, "failed": 0}
+        self._workers = []
+
+    def submit(self, cost: float, job: Callable[..., Awaitable], *args):
+        """
+        Queue job(*args); higher cost runs earlier. Can be called from inside a running job.
+        """
+        self._queue.put_nowait((-cost, next(self._seq), job, args))
+
+    async def _worker(self):
+        while True:
+            _, _, job, args = await self._queue.get()
+            try:
+                await job(*args)
+                self.stats["done"] += 1
+            except Exception as ex:
+                self.stats["failed"] += 1
+                logger.warning("job failed", extra={"fields": {
+                    "job": getattr(job, "__name__", str(job)), "args": args, "error": repr(ex)
+                }})
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        """
+        Start the workers early, for producers that keep submitting while jobs run.
+        join() starts them otherwise.
+        """
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def join(self):
+        """
+        Run until every submitted job, including follow-ups, has finished.
+        """
+        self.start()
+        try:
+            await self._queue.join()
+        finally:
+            await self.cancel()
+
+    async def cancel(self):
+        """
+        Stop the workers without waiting for the queued jobs, e.g. when the producer failed or was cancelled.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
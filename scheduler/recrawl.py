@@ -0,0 +1,259 @@
+# Long-running recrawl scheduler for monitoring known notes.
+#
+# Every note has a next refresh time kept in a min-heap. After each refresh the scheduler
+# measures how fast the note is changing: the weighted growth of its interact_info counts
+# per second, plus a bump when last_update_time moved (the author edited it). The velocity
+# is smoothed (EWMA) and the next interval is the time the note needs to gather about
+# `target_change` engagement, clamped to [min_interval, max_interval]. Fast-growing notes
+# are refreshed every few minutes, static ones about once a day. Comments are only
+# re-fetched when comment_count grew (or the last fetch failed). The requests themselves
+# are paced by the client's rate limiter (the global request budget), so the heap
+# decides *what* to spend it on.
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils import match_interact_info_count
+
+logger = logging.getLogger("scheduler")
+
+COUNT_FIELDS = ("liked_count", "collected_count", "comment_count", "share_count")
+# a collect or a comment says more about a note taking off than a like
+COUNT_WEIGHTS = (1.0, 2.0, 3.0, 2.0)
+
+
+def interact_counts(note_detail: Dict) -> Tuple[int, ...]:
+    interact_info = note_detail.get("interact_info") or {}
+    return tuple(match_interact_info_count(interact_info.get(field)) for field in COUNT_FIELDS)
+
+
+class NoteTrack:
+    __slots__ = ("note_id", "counts", "last_update_time", "observed_at", "velocity", "interval", "due",
+                 "comments_stale")
+
+    def __init__(self, note_id: str, due: float):
+        self.note_id = note_id
+        self.counts: Optional[Tuple[int, ...]] = None
+        self.last_update_time = 0
+        self.observed_at = 0.0
+        self.velocity: Optional[float] = None
+        self.interval = 0.0
+        self.due = due
+        # the last comment fetch failed, fetch again on the next refresh
+        self.comments_stale = False
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "NoteTrack":
+        track = cls(data["note_id"], data["due"])
+        for slot in cls.__slots__:
+            setattr(track, slot, data.get(slot))
+        track.counts = tuple(track.counts) if track.counts is not None else None
+        track.comments_stale = bool(track.comments_stale)
+        return track
+
+
+class RecrawlScheduler:
+    def __init__(self, min_interval: float = 600, max_interval: float = 86400,
+                 target_change: float = 50, smoothing: float = 0.5):
+        """
+        :param min_interval: never refresh a note more often than this (seconds)
+        :param max_interval: refresh even a static note at least this often (seconds)
+        :param target_change: weighted engagement growth one refresh should capture
+        :param smoothing: EWMA weight of the newest velocity sample
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_change = target_change
+        self.smoothing = smoothing
+        self.tracks: Dict[str, NoteTrack] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {"refreshed": 0, "comment_refreshes": 0, "failed": 0, "comment_failures": 0}
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def _push(self, track: NoteTrack):
+        # stale heap entries are skipped on pop by comparing with track.due
+        heapq.heappush(self._heap, (track.due, track.note_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def add(self, note_id: str, due: Optional[float] = None):
+        """
+        Start tracking a note, due immediately by default. Known notes are left alone.
+        """
+        if note_id in self.tracks:
+            return
+        track = NoteTrack(note_id, time.time() if due is None else due)
+        self.tracks[note_id] = track
+        self._push(track)
+
+    def _clamp(self, interval: float) -> float:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def observe(self, note_id: str, note_detail: Dict, now: Optional[float] = None) -> bool:
+        """
+        Record a refreshed note and schedule its next refresh.
+        Returns True when its comments changed and should be fetched again.
+        """
+        now = time.time() if now is None else now
+        track = self.tracks.get(note_id) or NoteTrack(note_id, now)
+        self.tracks[note_id] = track
+        counts = interact_counts(note_detail)
+        last_update_time = note_detail.get("last_update_time") or 0
+        first_seen = track.counts is None
+        comments_changed = first_seen or track.comments_stale or counts[2] != track.counts[2]
+        track.comments_stale = False
+
+        if first_seen:
+            # nothing to compare with yet, look again soon to learn the velocity
+            track.interval = self.min_interval
+        else:
+            elapsed = max(now - track.observed_at, 1.0)
+            change = sum(weight * max(new - old, 0)
+                         for weight, new, old in zip(COUNT_WEIGHTS, counts, track.counts))
+            if last_update_time != track.last_update_time:
+                change += self.target_change
+            sample = change / elapsed
+            track.velocity = sample if track.velocity is None else (
+                self.smoothing * sample + (1 - self.smoothing) * track.velocity
+            )
+            if track.velocity > 0:
+                track.interval = self._clamp(self.target_change / track.velocity)
+            else:
+                # no growth at all: back off geometrically towards max_interval
+                track.interval = self._clamp(track.interval * 2)
+
+        track.counts = counts
+        track.last_update_time = last_update_time
+        track.observed_at = now
+        track.due = now + track.interval
+        self._push(track)
+        return comments_changed
+
+    def failed(self, note_id: str, now: Optional[float] = None):
+        """
+        The refresh failed, retry after a backoff instead of hammering the note.
+        """
+        now = time.time() if now is None else now
+        track = self.tracks[note_id]
+        track.interval = self._clamp(max(track.interval, self.min_interval) * 2)
+        track.due = now + track.interval
+        self._push(track)
+
+    def comments_failed(self, note_id: str, now: Optional[float] = None):
+        """
+        Fetching the comments failed: retry after a backoff, and fetch them again then even if
+        comment_count did not move.
+        """
+        self.tracks[note_id].comments_stale = True
+        self.failed(note_id, now)
+
+    def pop_due(self, now: Optional[float] = None) -> Optional[str]:
+        now = time.time() if now is None else now
+        while self._heap:
+            due, note_id = self._heap[0]
+            track = self.tracks.get(note_id)
+            if track is None or track.due != due:
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                return None
+            heapq.heappop(self._heap)
+            # pushed far out while in flight, observe()/failed() set the real due time
+            track.due = float("inf")
+            return note_id
+        return None
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            due, note_id = self._heap[0]
+            track = self.tracks.get(note_id)
+            if track is not None and track.due == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    async def _wait_due(self) -> str:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            note_id = self.pop_due()
+            if note_id is not None:
+                return note_id
+            due = self.next_due()
+            self._wakeup.clear()
+            timeout = None if due is None else max(due - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, refresh_detail: Callable[[str], Awaitable[Optional[Dict]]],
+                  refresh_comments: Callable[[str], Awaitable[None]],
+                  concurrency: int = 2, state_path: Optional[str] = None, save_every: int = 50):
+        """
+        Refresh due notes forever with `concurrency` workers.
+        refresh_detail returns the note detail or None on failure.
+        """
+
+        async def worker():
+            while True:
+                note_id = await self._wait_due()
+                try:
+                    note_detail = await refresh_detail(note_id)
+                except Exception as ex:
+                    logger.warning("recrawl failed", extra={"fields": {"note_id": note_id, "error": repr(ex)}})
+                    note_detail = None
+                if note_detail is None:
+                    self.stats["failed"] += 1
+                    self.failed(note_id)
+                    continue
+                self.stats["refreshed"] += 1
+                if self.observe(note_id, note_detail):
+                    self.stats["comment_refreshes"] += 1
+                    try:
+                        await refresh_comments(note_id)
+                    except Exception as ex:
+                        # one note's comments failing (DataFetchError, IPBlockError) must not stop the others
+                        logger.warning("recrawl comments failed",
+                                       extra={"fields": {"note_id": note_id, "error": repr(ex)}})
+                        self.stats["comment_failures"] += 1
+                        self.comments_failed(note_id)
+                if state_path and self.stats["refreshed"] % save_every == 0:
+                    self.save(state_path)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            if state_path:
+                self.save(state_path)
+
+    def save(self, path: str):
+        state_dir = os.path.dirname(path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([track.to_dict() for track in self.tracks.values()], f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for data in json.load(f):
+                track = NoteTrack.from_dict(data)
+                if track.due == float("inf") or track.due is None:
+                    # was in flight when the state was saved
+                    track.due = time.time()
+                self.tracks[track.note_id] = track
+                self._push(track)
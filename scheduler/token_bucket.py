@@ -0,0 +1,34 @@
+# In-process request budget: a token bucket refilled at `rate` tokens per second.
+# Has the same async acquire() as cluster.rate_limiter.RedisRateLimiter, so either can be
+# plugged into XHSClient.rate_limiter.
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: tokens added per second
+        :param burst: bucket capacity, how many requests may go out back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # the lock keeps waiters in FIFO order so nobody starves
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+            self.acquired += 1
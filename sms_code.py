@@ -0,0 +1,40 @@
+# Hand-off of SMS verification codes from recv_sms_notification.py (producer) to the
+# phone login of the spiders (consumer). Codes are pushed onto a Redis list, and the
+# consumer blocks on BLPOP so it wakes up the moment a code arrives instead of polling.
+#
+# Key format: <platform>_<phone>, e.g. xhs_138xxxxxxxx -> [171959, ...] (newest first)
+
+SMS_CODE_EXPIRE_SECONDS = 60 * 3
+
+
+def sms_code_key(platform: str, phone: str) -> str:
+    return f"{platform}_{phone}"
+
+
+async def push_sms_code(redis, platform: str, phone: str, code: str):
+    """
+    Publish a code and (re)set the expiration of the list in one round trip.
+    """
+    key = sms_code_key(platform, phone)
+    async with redis.pipeline(transaction=True) as pipe:
+        await pipe.lpush(key, code).expire(key, SMS_CODE_EXPIRE_SECONDS).execute()
+
+
+async def clear_sms_code(redis, platform: str, phone: str):
+    """
+    Drop codes left over from an earlier login attempt before requesting a new one.
+    """
+    await redis.delete(sms_code_key(platform, phone))
+
+
+async def wait_sms_code(redis, platform: str, phone: str, timeout: int) -> str:
+    """
+    Block until a code is pushed for the phone, return "" on timeout.
+    """
+    key = sms_code_key(platform, phone)
+    popped = await redis.blpop(key, timeout=timeout)
+    if not popped:
+        return ""
+    # the newest code wins, older ones are useless now
+    await redis.delete(key)
+    return popped[1]
@@ -0,0 +1,223 @@
+# Compact comment tree index over stored comments (store.sqlite_store).
+#
+# Rebuilding threads from comment dicts costs hundreds of bytes per comment. Here every
+# comment id is interned to a small integer once, and the tree is kept in parallel integer
+# arrays indexed by that integer:
+#   parent[i]        index of the comment i replies to, -1 for a root comment
+#   first_child[i]   first reply of i, -1 when it has none
+#   next_sibling[i]  next reply of the same parent (or next root of the same note), -1 at the end
+# plus the head of each note's root chain. Subtree sizes and depths are computed once with an
+# iterative traversal, so thread sizes, statistics and "top N threads" never touch a dict or
+# recurse, and a subtree is extracted by walking first_child/next_sibling.
+#
+#   python -m store.comment_tree --top 10
+#   python -m store.comment_tree --note_id 6413cf6b00000000270115b5 --thread <comment_id>
+import argparse
+import heapq
+import sqlite3
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+NO_NODE = -1
+
+
+class CommentTreeIndex:
+    def __init__(self):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.notes: List[str] = []
+        self.note_index: Dict[str, int] = {}
+        self.note_of = array("l")
+        self.parent = array("l")
+        self.first_child = array("l")
+        self.next_sibling = array("l")
+        # head of the root comment chain of each note, linked through next_sibling
+        self.first_root = array("l")
+        self.size = array("l")
+        self.depth = array("l")
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, rows: Callable[[], Iterable[Tuple[str, str, Optional[str]]]]) -> "CommentTreeIndex":
+        """
+        rows() yields (note_id, comment_id, parent_comment_id) and is called twice: once to intern
+        every id, once to link, so replies stored before their parent are linked too.
+        A reply whose parent was never stored becomes a root of its note.
+        """
+        tree = cls()
+        for note_id, comment_id, _ in rows():
+            if comment_id in tree.index:
+                continue
+            note = tree.note_index.get(note_id)
+            if note is None:
+                note = tree.note_index[note_id] = len(tree.notes)
+                tree.notes.append(note_id)
+                tree.first_root.append(NO_NODE)
+            tree.index[comment_id] = len(tree.ids)
+            tree.ids.append(comment_id)
+            tree.note_of.append(note)
+        count = len(tree.ids)
+        tree.parent = array("l", [NO_NODE]) * count
+        tree.first_child = array("l", [NO_NODE]) * count
+        tree.next_sibling = array("l", [NO_NODE]) * count
+
+        # tails only live while linking, so children and roots keep their stored order
+        last_child = array("l", [NO_NODE]) * count
+        last_root = array("l", [NO_NODE]) * len(tree.notes)
+        for _, comment_id, parent_comment_id in rows():
+            node = tree.index[comment_id]
+            parent = tree.index.get(parent_comment_id) if parent_comment_id else None
+            if parent is not None and parent != node and tree.note_of[parent] == tree.note_of[node]:
+                tree.parent[node] = parent
+                if last_child[parent] == NO_NODE:
+                    tree.first_child[parent] = node
+                else:
+                    tree.next_sibling[last_child[parent]] = node
+                last_child[parent] = node
+            else:
+                note = tree.note_of[node]
+                if last_root[note] == NO_NODE:
+                    tree.first_root[note] = node
+                else:
+                    tree.next_sibling[last_root[note]] = node
+                last_root[note] = node
+        tree._compute_sizes()
+        return tree
+
+    @classmethod
+    def from_db(cls, conn: sqlite3.Connection, note_id: Optional[str] = None) -> "CommentTreeIndex":
+        """
+        Index the stored comments of one note, or of every note, streaming the rows from SQLite.
+        """
+        sql = "SELECT note_id, comment_id, parent_comment_id FROM xhs_note_comment"
+        params: Tuple = ()
+        if note_id is not None:
+            sql += " WHERE note_id = ?"
+            params = (note_id,)
+        return cls.build(lambda: conn.execute(sql + " ORDER BY id", params))
+
+    def _children(self, node: int):
+        child = self.first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def _roots(self, note: int):
+        node = self.first_root[note]
+        while node != NO_NODE:
+            yield node
+            node = self.next_sibling[node]
+
+    def _compute_sizes(self):
+        count = len(self.ids)
+        self.size = array("l", [1]) * count
+        self.depth = array("l", [0]) * count
+        order = []
+        stack = [root for note in range(len(self.notes)) for root in self._roots(note)]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            for child in self._children(node):
+                self.depth[child] = self.depth[node] + 1
+                stack.append(child)
+        # children come after their parent in `order`, so summing in reverse is bottom-up
+        for node in reversed(order):
+            parent = self.parent[node]
+            if parent != NO_NODE:
+                self.size[parent] += self.size[node]
+
+    def roots(self, note_id: str) -> List[str]:
+        note = self.note_index.get(note_id)
+        if note is None:
+            return []
+        return [self.ids[node] for node in self._roots(note)]
+
+    def children(self, comment_id: str) -> List[str]:
+        return [self.ids[child] for child in self._children(self.index[comment_id])]
+
+    def reply_count(self, comment_id: str) -> int:
+        """
+        Replies anywhere below the comment.
+        """
+        return self.size[self.index[comment_id]] - 1
+
+    def subtree(self, comment_id: str) -> List[Tuple[str, int]]:
+        """
+        The comment and every reply below it in thread order, as (comment_id, depth below comment_id).
+        """
+        top = self.index[comment_id]
+        result = []
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            result.append((self.ids[node], self.depth[node] - self.depth[top]))
+            # reversed, so the first reply is popped first
+            stack.extend(reversed(list(self._children(node))))
+        return result
+
+    def top_threads(self, n: int = 10, note_id: Optional[str] = None) -> List[Tuple[str, int]]:
+        """
+        The n root comments with the most replies, as (comment_id, reply count), most first.
+        """
+        if note_id is not None:
+            note = self.note_index.get(note_id)
+            roots = list(self._roots(note)) if note is not None else []
+        else:
+            roots = [node for node in range(len(self.ids)) if self.parent[node] == NO_NODE]
+        top = heapq.nlargest(n, roots, key=self.size.__getitem__)
+        return [(self.ids[node], self.size[node] - 1) for node in top]
+
+    def stats(self, note_id: Optional[str] = None) -> Dict:
+        """
+        Comment, thread and depth statistics of one note or of the whole index.
+        """
+        if note_id is not None:
+            note = self.note_index.get(note_id)
+            nodes = []
+            stack = list(self._roots(note)) if note is not None else []
+            while stack:
+                node = stack.pop()
+                nodes.append(node)
+                stack.extend(self._children(node))
+        else:
+            nodes = range(len(self.ids))
+        roots = [node for node in nodes if self.parent[node] == NO_NODE]
+        thread_sizes = [self.size[node] for node in roots]
+        return {
+            "comments": len(nodes),
+            "threads": len(roots),
+            "threads_with_replies": sum(1 for size in thread_sizes if size > 1),
+            "largest_thread": max(thread_sizes, default=0),
+            "mean_thread_size": sum(thread_sizes) / len(roots) if roots else 0.0,
+            "max_depth": max((self.depth[node] for node in nodes), default=0),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="comment thread statistics from the crawl database.")
+    parser.add_argument('--db', type=str, default=config.sqlite_db_path)
+    parser.add_argument('--note_id', type=str, help="only this note")
+    parser.add_argument('--top', type=int, default=10, help="print the threads with the most replies")
+    parser.add_argument('--thread', type=str, help="print the thread below this comment id")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    tree = CommentTreeIndex.from_db(conn, args.note_id)
+    print(tree.stats(args.note_id))
+    for comment_id, replies in tree.top_threads(args.top, args.note_id):
+        print(f"{replies:>8} replies  {comment_id}")
+    if args.thread:
+        contents = dict(conn.execute(
+            "SELECT comment_id, content FROM xhs_note_comment WHERE note_id = "
+            "(SELECT note_id FROM xhs_note_comment WHERE comment_id = ?)", (args.thread,)
+        ))
+        for comment_id, depth in tree.subtree(args.thread):
+            print(f"{'  ' * depth}{comment_id}: {contents.get(comment_id, '')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,454 @@
+# Engagement history of every crawled note: liked/collected/comment/share counts over time.
+#
+# update_xhs_note overwrites the note row on each refresh, so the counts it replaced are gone.
+# Here each refresh appends one sample to the note's series in a memory-mapped file
+# (config.engagement_history_path). Samples are delta encoded in fixed-size blocks:
+#   header   note index, next block of the same note (-1 at the end), samples used,
+#            minute and the four counts of the first sample (int32)
+#   samples  minutes since the previous sample (uint16) and the change of each count (int16),
+#            SAMPLES_PER_BLOCK of them; the first one is the header itself
+# so a full block of 112 bytes holds 8 samples, 14 bytes a sample (more while it is not full),
+# where a full row snapshot takes hundreds. A sample whose change does not fit (a gap over 45
+# days, a count moving by more than 32767) starts a new block with absolute values, as does a
+# full block. Time is kept at minute resolution.
+#
+# Blocks are appended in time order, so a note's blocks form a chain in increasing file order:
+#   history()   walks one note's chain and decodes it, for a range query on that note
+#   growth()    decodes the whole file in chunks with numpy, no Python loop per note, and gives
+#               each note's change over a time window: from its last sample at or before the
+#               window start (or its first sample in the window) to its last sample in the window
+# Note ids are kept in a side file (<path>.ids, line n is note n). Only one process writes a
+# file at a time (an exclusive flock, or a lock on the first byte on Windows, where readers go
+# through the memory map only); any number may read it.
+#
+#   python -m store.engagement_history --top 20 --column liked_count --days 7
+#   python -m store.engagement_history --note_id 6413cf6b00000000270115b5
+import argparse
+import atexit
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+import config
+
+logger = logging.getLogger("store")
+
+COLUMNS = ("liked_count", "collected_count", "comment_count", "share_count")
+SAMPLES_PER_BLOCK = 8
+NO_BLOCK = -1
+MAGIC = b"XHSENG1\0"
+# magic, samples per block, blocks used
+HEADER = struct.Struct("<8sii")
+HEADER_SIZE = 64
+BLOCK = np.dtype([
+    ("note", "<i4"), ("next", "<i4"), ("count", "<i4"), ("base_minute", "<i4"),
+    ("base", "<i4", (len(COLUMNS),)),
+    ("dt", "<u2", (SAMPLES_PER_BLOCK,)),
+    ("dv", "<i2", (SAMPLES_PER_BLOCK, len(COLUMNS))),
+])
+NEXT_OFFSET = BLOCK.fields["next"][1]
+COUNT_OFFSET = BLOCK.fields["count"][1]
+DT_OFFSET = BLOCK.fields["dt"][1]
+DV_OFFSET = BLOCK.fields["dv"][1]
+BLOCK_HEAD = struct.Struct("<iiii4i")
+SAMPLE = struct.Struct("<4h")
+MAX_DT = np.iinfo(np.uint16).max
+MAX_DV = np.iinfo(np.int16).max
+# decoded samples: time in milliseconds, then the counts
+HISTORY = np.dtype([("time", "<i8")] + [(column, "<i8") for column in COLUMNS])
+GROWTH = np.dtype([
+    ("note", "<i4"), ("first_time", "<i8"), ("last_time", "<i8"),
+    ("delta", "<i8", (len(COLUMNS),)), ("per_hour", "<f8", (len(COLUMNS),)),
+])
+CHUNK_BLOCKS = 1 << 18
+
+
+def decode(blocks: np.ndarray):
+    """
+    Absolute minutes (n, SAMPLES_PER_BLOCK), counts (n, SAMPLES_PER_BLOCK, 4) and the mask of
+    used samples of an array of blocks.
+    """
+    used = np.arange(SAMPLES_PER_BLOCK) < blocks["count"][:, None]
+    minutes = blocks["base_minute"][:, None].astype(np.int64) + np.cumsum(
+        np.where(used, blocks["dt"], 0), axis=1, dtype=np.int64
+    )
+    values = blocks["base"][:, None, :].astype(np.int64) + np.cumsum(
+        np.where(used[:, :, None], blocks["dv"], 0), axis=1, dtype=np.int64
+    )
+    return minutes, values, used
+
+
+def lock_writer(fd: int):
+    """
+    Take the writer lock of an open data file without waiting, BlockingIOError when another process holds it.
+    """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return
+    os.lseek(fd, 0, os.SEEK_SET)
+    try:
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError as ex:
+        raise BlockingIOError(*ex.args) from ex
+
+
+class EngagementHistory:
+    def __init__(self, path: str, readonly: bool = False, initial_blocks: int = 1 << 14):
+        """
+        :param path: data file, created when missing (unless readonly)
+        :param readonly: open for queries only, sees the samples written before it was opened
+        :param initial_blocks: blocks a new file has room for, it doubles when full
+        """
+        self.path = path
+        self.readonly = readonly
+        flags = (os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT) | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(path, flags, 0o644)
+        try:
+            if not readonly:
+                # a second writer would interleave blocks in the same file
+                lock_writer(self._fd)
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, HEADER_SIZE + initial_blocks * BLOCK.itemsize)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, HEADER.pack(MAGIC, SAMPLES_PER_BLOCK, 0))
+            self._map()
+        except Exception:
+            os.close(self._fd)
+            raise
+        magic, samples_per_block, self.used = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or samples_per_block != SAMPLES_PER_BLOCK:
+            self.close()
+            raise ValueError(f"{path} is not an engagement history file")
+
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        ids_path = f"{path}.ids"
+        if os.path.exists(ids_path):
+            with open(ids_path, encoding="utf-8") as f:
+                self.ids = f.read().splitlines()
+            self.index = {note_id: note for note, note_id in enumerate(self.ids)}
+        self._ids_file = None if readonly else open(ids_path, "a", encoding="utf-8", buffering=1)
+        self._load_tails()
+        self.stats: Dict[str, int] = {"samples": 0, "blocks": 0, "out_of_order": 0}
+
+    def _map(self):
+        size = os.fstat(self._fd).st_size
+        self._mm = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE)
+        self.capacity = (size - HEADER_SIZE) // BLOCK.itemsize
+
+    def _blocks(self, begin: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        A view of blocks [begin, end) of the file; do not keep it across appends (the file may be remapped).
+        """
+        end = self.used if end is None else end
+        return np.ndarray((end - begin,), dtype=BLOCK, buffer=self._mm, offset=HEADER_SIZE + begin * BLOCK.itemsize)
+
+    def _load_tails(self):
+        """
+        First and last block of every note, and its latest sample, rebuilt from the block headers.
+        """
+        notes = len(self.ids)
+        head = np.full(notes, NO_BLOCK, dtype=np.int32)
+        tail = np.full(notes, NO_BLOCK, dtype=np.int32)
+        last_minute = np.zeros(notes, dtype=np.int32)
+        last_values = np.zeros((notes, len(COLUMNS)), dtype=np.int32)
+        for begin in range(0, self.used, CHUNK_BLOCKS):
+            blocks = self._blocks(begin, min(begin + CHUNK_BLOCKS, self.used))
+            # blocks of notes missing from the ids file (lost in a crash) are left out
+            known = (blocks["note"] >= 0) & (blocks["note"] < notes)
+            block_notes = blocks["note"][known]
+            block_index = np.arange(begin, begin + len(blocks), dtype=np.int32)[known]
+            first = head[block_notes] == NO_BLOCK
+            # the lowest index of each note wins: assign in reverse so it is written last
+            head[block_notes[first][::-1]] = block_index[first][::-1]
+            tail[block_notes] = block_index
+            minutes, values, used = decode(blocks[known])
+            last = blocks["count"][known] - 1
+            rows = np.arange(len(last))
+            last_minute[block_notes] = minutes[rows, last]
+            last_values[block_notes] = values[rows, last]
+            del blocks
+        self.head = array("i", head.tobytes())
+        self.tail = array("i", tail.tobytes())
+        self.last_minute = array("i", last_minute.tobytes())
+        self.last_values = array("i", last_values.tobytes())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _grow(self):
+        self._mm.close()
+        os.ftruncate(self._fd, HEADER_SIZE + max(self.capacity * 2, 1) * BLOCK.itemsize)
+        self._map()
+
+    def _new_block(self, note: int, minute: int, counts: Sequence[int]) -> int:
+        if self.used == self.capacity:
+            self._grow()
+        block = self.used
+        BLOCK_HEAD.pack_into(self._mm, HEADER_SIZE + block * BLOCK.itemsize, note, NO_BLOCK, 1, minute, *counts)
+        self.used += 1
+        struct.pack_into("<i", self._mm, HEADER.size - 4, self.used)
+        self.stats["blocks"] += 1
+        return block
+
+    def append(self, note_id: str, time_ms: int, counts: Sequence[int]) -> bool:
+        """
+        Record the counts (in COLUMNS order) of a note at time_ms. Samples older than the
+        note's latest one are ignored (returns False).
+        """
+        minute = int(time_ms) // 60000
+        counts = [int(count) for count in counts]
+        note = self.index.get(note_id)
+        if note is None:
+            note = len(self.ids)
+            self._ids_file.write(note_id + "\n")
+            self.ids.append(note_id)
+            self.index[note_id] = note
+            self.head.append(NO_BLOCK)
+            self.tail.append(NO_BLOCK)
+            self.last_minute.append(0)
+            self.last_values.extend([0] * len(COLUMNS))
+        if self.tail[note] == NO_BLOCK:
+            # a new note, or one whose id was written just before a crash
+            block = self._new_block(note, minute, counts)
+            self.head[note] = self.tail[note] = block
+            self.last_minute[note] = minute
+            self.last_values[note * len(COLUMNS):(note + 1) * len(COLUMNS)] = array("i", counts)
+            self.stats["samples"] += 1
+            return True
+
+        dt = minute - self.last_minute[note]
+        if dt < 0:
+            self.stats["out_of_order"] += 1
+            return False
+        base = note * len(COLUMNS)
+        deltas = [count - self.last_values[base + column] for column, count in enumerate(counts)]
+        tail = self.tail[note]
+        offset = HEADER_SIZE + tail * BLOCK.itemsize
+        used = struct.unpack_from("<i", self._mm, offset + COUNT_OFFSET)[0]
+        if used < SAMPLES_PER_BLOCK and dt <= MAX_DT and all(-MAX_DV <= delta <= MAX_DV for delta in deltas):
+            struct.pack_into("<H", self._mm, offset + DT_OFFSET + used * 2, dt)
+            SAMPLE.pack_into(self._mm, offset + DV_OFFSET + used * SAMPLE.size, *deltas)
+            struct.pack_into("<i", self._mm, offset + COUNT_OFFSET, used + 1)
+        else:
+            block = self._new_block(note, minute, counts)
+            # the file may have been remapped, the offset is still valid
+            struct.pack_into("<i", self._mm, offset + NEXT_OFFSET, block)
+            self.tail[note] = block
+        self.last_minute[note] = minute
+        self.last_values[base:base + len(COLUMNS)] = array("i", counts)
+        self.stats["samples"] += 1
+        return True
+
+    def history(self, note_id: str, since: Optional[int] = None, until: Optional[int] = None) -> np.ndarray:
+        """
+        The note's samples with since <= time <= until (milliseconds), as a HISTORY array with time in milliseconds.
+        """
+        note = self.index.get(note_id)
+        chain = []
+        block = self.head[note] if note is not None else NO_BLOCK
+        view = self._blocks()
+        while block != NO_BLOCK:
+            chain.append(block)
+            block = int(view["next"][block])
+        if not chain:
+            return np.zeros(0, dtype=HISTORY)
+        minutes, values, used = decode(view[chain])
+        del view
+        result = np.zeros(int(used.sum()), dtype=HISTORY)
+        result["time"] = minutes[used] * 60000
+        for column, name in enumerate(COLUMNS):
+            result[name] = values[used][:, column]
+        low = np.searchsorted(result["time"], since, side="left") if since is not None else 0
+        high = np.searchsorted(result["time"], until, side="right") if until is not None else len(result)
+        return result[low:high]
+
+    def growth(self, since: int, until: int) -> np.ndarray:
+        """
+        Change of every note's counts over [since, until] (milliseconds), for notes with two
+        samples spanning part of it. Returns a GROWTH array; note indexes self.ids.
+        """
+        since_minute, until_minute = since // 60000, until // 60000
+        notes = len(self.ids)
+        start_minute = np.full(notes, -1, dtype=np.int64)
+        start_values = np.zeros((notes, len(COLUMNS)), dtype=np.int64)
+        first_minute = np.full(notes, -1, dtype=np.int64)
+        first_values = np.zeros((notes, len(COLUMNS)), dtype=np.int64)
+        last_minute = np.full(notes, -1, dtype=np.int64)
+        last_values = np.zeros((notes, len(COLUMNS)), dtype=np.int64)
+        for begin in range(0, self.used, CHUNK_BLOCKS):
+            blocks = self._blocks(begin, min(begin + CHUNK_BLOCKS, self.used))
+            minutes, values, used = decode(blocks)
+            sample_notes = np.broadcast_to(blocks["note"][:, None], used.shape)[used]
+            del blocks
+            minutes, values = minutes[used], values[used]
+            # samples of a note in file order are in time order, a stable sort keeps it
+            order = np.argsort(sample_notes, kind="stable")
+            sample_notes, minutes, values = sample_notes[order], minutes[order], values[order]
+            known = (sample_notes >= 0) & (sample_notes < notes)
+
+            before = known & (minutes <= since_minute)
+            index = _last_of_each(sample_notes[before])
+            picked = sample_notes[before][index]
+            start_minute[picked] = minutes[before][index]
+            start_values[picked] = values[before][index]
+
+            inside = known & (minutes > since_minute) & (minutes <= until_minute)
+            index = _first_of_each(sample_notes[inside])
+            picked = sample_notes[inside][index]
+            unset = first_minute[picked] < 0
+            first_minute[picked[unset]] = minutes[inside][index][unset]
+            first_values[picked[unset]] = values[inside][index][unset]
+            index = _last_of_each(sample_notes[inside])
+            picked = sample_notes[inside][index]
+            last_minute[picked] = minutes[inside][index]
+            last_values[picked] = values[inside][index]
+
+        has_start = start_minute >= 0
+        start_minute = np.where(has_start, start_minute, first_minute)
+        start_values = np.where(has_start[:, None], start_values, first_values)
+        selected = np.nonzero((last_minute >= 0) & (start_minute >= 0) & (last_minute > start_minute))[0]
+        result = np.zeros(len(selected), dtype=GROWTH)
+        result["note"] = selected
+        result["first_time"] = start_minute[selected] * 60000
+        result["last_time"] = last_minute[selected] * 60000
+        result["delta"] = last_values[selected] - start_values[selected]
+        hours = (last_minute[selected] - start_minute[selected]) / 60
+        result["per_hour"] = result["delta"] / hours[:, None]
+        return result
+
+    def top_growth(self, since: int, until: int, column: str = "liked_count", limit: int = 20,
+                   per_hour: bool = True) -> List[Dict]:
+        """
+        The notes whose `column` grew the most over [since, until], by rate or by absolute change.
+        """
+        growth = self.growth(since, until)
+        key = growth["per_hour" if per_hour else "delta"][:, COLUMNS.index(column)]
+        top = np.argsort(-key, kind="stable")[:limit]
+        return [{
+            "note_id": self.ids[row["note"]],
+            "first_time": int(row["first_time"]),
+            "last_time": int(row["last_time"]),
+            **{f"{name}_delta": int(row["delta"][column]) for column, name in enumerate(COLUMNS)},
+            f"{column}_per_hour": round(float(row["per_hour"][COLUMNS.index(column)]), 3),
+        } for row in growth[top]]
+
+    def file_size(self) -> int:
+        """
+        Bytes used by samples, headers and ids (the data file itself is preallocated).
+        """
+        ids_size = os.path.getsize(f"{self.path}.ids") if os.path.exists(f"{self.path}.ids") else 0
+        return HEADER_SIZE + self.used * BLOCK.itemsize + ids_size
+
+    def flush(self):
+        if not self.readonly:
+            self._mm.flush()
+            self._ids_file.flush()
+
+    def close(self):
+        if self._mm is None:
+            return
+        self.flush()
+        self._mm.close()
+        self._mm = None
+        if self._ids_file is not None:
+            self._ids_file.close()
+        os.close(self._fd)
+
+
+def _first_of_each(sorted_notes: np.ndarray) -> np.ndarray:
+    if not len(sorted_notes):
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.nonzero(np.diff(sorted_notes))[0] + 1))
+
+
+def _last_of_each(sorted_notes: np.ndarray) -> np.ndarray:
+    if not len(sorted_notes):
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate((np.nonzero(np.diff(sorted_notes))[0], [len(sorted_notes) - 1]))
+
+
+_history: Optional[EngagementHistory] = None
+_history_failed = False
+
+
+def get_history() -> Optional[EngagementHistory]:
+    """
+    The process-wide history at config.engagement_history_path, opened on first use and closed at
+    exit. None when disabled, or when another process is writing the file.
+    """
+    global _history, _history_failed
+    if _history is None and not _history_failed and config.engagement_history_path:
+        history_dir = os.path.dirname(config.engagement_history_path)
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+        try:
+            _history = EngagementHistory(config.engagement_history_path)
+        except BlockingIOError:
+            _history_failed = True
+            logger.warning("engagement history is written by another process, not recording here",
+                           extra={"fields": {"path": config.engagement_history_path}})
+            return None
+        atexit.register(close_history)
+    return _history
+
+
+def close_history():
+    global _history
+    if _history is not None:
+        _history.close()
+        _history = None
+
+
+CHINA_TIME = timezone(timedelta(hours=8))
+
+
+def date_to_ms(date: str) -> int:
+    """
+    YYYY-MM-DD at 00:00 China time, in milliseconds.
+    """
+    day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=CHINA_TIME)
+    return int(day.timestamp() * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engagement history of crawled notes.")
+    parser.add_argument('--path', type=str, default=config.engagement_history_path)
+    parser.add_argument('--note_id', type=str, help="print the samples of this note")
+    parser.add_argument('--top', type=int, default=20, help="print the fastest growing notes")
+    parser.add_argument('--column', choices=COLUMNS, default="liked_count")
+    parser.add_argument('--days', type=float, default=7, help="window ending now, unless --since/--until")
+    parser.add_argument('--since', type=str, help="YYYY-MM-DD")
+    parser.add_argument('--until', type=str, help="YYYY-MM-DD, exclusive")
+    parser.add_argument('--absolute', action='store_true', help="rank by change instead of change per hour")
+    args = parser.parse_args()
+
+    history = EngagementHistory(args.path, readonly=True)
+    until = date_to_ms(args.until) - 1 if args.until else int(time.time() * 1000)
+    since = date_to_ms(args.since) if args.since else until - int(args.days * 86400000)
+    print(f"{len(history)} notes, {history.used} blocks, {history.file_size() / 1024 / 1024:.1f} MiB")
+    if args.note_id:
+        for sample in history.history(args.note_id, since, until):
+            moment = datetime.fromtimestamp(sample["time"] / 1000, CHINA_TIME).strftime("%Y-%m-%d %H:%M")
+            print(moment, *(f"{name}={sample[name]}" for name in COLUMNS))
+        return
+    for item in history.top_growth(since, until, args.column, args.top, per_hour=not args.absolute):
+        print(item)
+
+
+if __name__ == '__main__':
+    main()
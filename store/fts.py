@@ -0,0 +1,149 @@
+# Full-text search over stored notes and comments with SQLite FTS5.
+#
+# FTS5's built-in tokenizers split on spaces and punctuation, so a run of Chinese text would
+# become one huge token. Text is therefore tokenized here before it reaches FTS5: every CJK
+# run becomes overlapping character bigrams plus its last character (健身房 -> 健身 身房 房),
+# other words are lowercased. A query is tokenized the same way and turned into FTS5 phrases
+# of consecutive bigrams, so 健身房 only matches text containing exactly that substring; a
+# single character becomes a prefix query. Ranking is bm25 with the title weighted over desc.
+#
+#   python -m store.fts 健身 减脂 --limit 10
+#   python -m store.fts 好看 --comments
+import argparse
+import re
+import sqlite3
+import time
+from typing import Dict, List
+
+import config
+
+CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+TOKEN_PATTERN = re.compile(f"[{CJK_RANGES}]+|[^\\W{CJK_RANGES}]+")
+CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+
+NOTE_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS xhs_note_fts USING fts5(title, desc)"
+COMMENT_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS xhs_note_comment_fts USING fts5(content)"
+# title matches count twice as much as desc matches
+NOTE_RANK = "bm25(2.0, 1.0)"
+
+
+def _is_cjk(run: str) -> bool:
+    return CJK_PATTERN.match(run) is not None
+
+
+def tokenize_text(text: str) -> str:
+    """
+    Text as stored in the FTS5 columns: space separated bigrams / words.
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(text or ""):
+        if not _is_cjk(run):
+            tokens.append(run.lower())
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        # the last character on its own, so single character queries can find it
+        tokens.append(run[-1])
+    return " ".join(tokens)
+
+
+def build_match_query(query: str) -> str:
+    """
+    FTS5 MATCH expression for a user query; every whitespace separated term must match.
+    Returns "" when the query has nothing searchable.
+    """
+    parts = []
+    for run in TOKEN_PATTERN.findall(query or ""):
+        if not _is_cjk(run):
+            parts.append(f'"{run.lower()}"*')
+        elif len(run) == 1:
+            parts.append(f'"{run}"*')
+        else:
+            bigrams = " ".join(run[i:i + 2] for i in range(len(run) - 1))
+            parts.append(f'"{bigrams}"')
+    return " AND ".join(parts)
+
+
+def create_fts_tables(conn: sqlite3.Connection):
+    conn.execute(NOTE_FTS_SCHEMA)
+    conn.execute(COMMENT_FTS_SCHEMA)
+    conn.execute("INSERT INTO xhs_note_fts(xhs_note_fts, rank) VALUES('rank', ?)", (NOTE_RANK,))
+
+
+def index_note(conn: sqlite3.Connection, rowid: int, title: str, desc: str):
+    """
+    (Re)index one note. rowid is the xhs_note row id, so results join back without a lookup table.
+    """
+    conn.execute("DELETE FROM xhs_note_fts WHERE rowid = ?", (rowid,))
+    conn.execute("INSERT INTO xhs_note_fts(rowid, title, desc) VALUES (?, ?, ?)",
+                 (rowid, tokenize_text(title), tokenize_text(desc)))
+
+
+def index_comment(conn: sqlite3.Connection, rowid: int, content: str):
+    conn.execute("DELETE FROM xhs_note_comment_fts WHERE rowid = ?", (rowid,))
+    conn.execute("INSERT INTO xhs_note_comment_fts(rowid, content) VALUES (?, ?)",
+                 (rowid, tokenize_text(content)))
+
+
+def search_notes(conn: sqlite3.Connection, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """
+    Notes matching query, best first. score is bm25 (lower is better).
+    Ranked inside the FTS table first so only the returned page is joined with xhs_note.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    rows = conn.execute(
+        'SELECT n.note_id, n.title, n."desc", n.user_id, n.nickname, n.liked_count, f.rank '
+        "FROM (SELECT rowid, rank FROM xhs_note_fts WHERE xhs_note_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?) AS f "
+        "JOIN xhs_note AS n ON n.id = f.rowid ORDER BY f.rank",
+        (match, limit, offset)
+    ).fetchall()
+    columns = ("note_id", "title", "desc", "user_id", "nickname", "liked_count", "score")
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def search_comments(conn: sqlite3.Connection, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """
+    Comments matching query, best first. score is bm25 (lower is better).
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    rows = conn.execute(
+        "SELECT c.comment_id, c.note_id, c.content, c.user_id, c.nickname, f.rank "
+        "FROM (SELECT rowid, rank FROM xhs_note_comment_fts WHERE xhs_note_comment_fts MATCH ? "
+        "ORDER BY rank LIMIT ? OFFSET ?) AS f "
+        "JOIN xhs_note_comment AS c ON c.id = f.rowid ORDER BY f.rank",
+        (match, limit, offset)
+    ).fetchall()
+    columns = ("comment_id", "note_id", "content", "user_id", "nickname", "score")
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search stored notes and comments.")
+    parser.add_argument('query', nargs='+', help="search terms, all of them must match")
+    parser.add_argument('--comments', action='store_true', help="search comments instead of notes")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--offset', type=int, default=0)
+    parser.add_argument('--db', type=str, default=config.sqlite_db_path)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    query = " ".join(args.query)
+    begin = time.perf_counter()
+    if args.comments:
+        results = search_comments(conn, query, args.limit, args.offset)
+    else:
+        results = search_notes(conn, query, args.limit, args.offset)
+    cost = time.perf_counter() - begin
+    for result in results:
+        if args.comments:
+            print(f"{result['score']:8.2f}  {result['note_id']}  {result['nickname']}: {result['content']}")
+        else:
+            print(f"{result['score']:8.2f}  {result['note_id']}  {result['title']}  ({result['nickname']})")
+    print(f"{len(results)} results in {cost * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
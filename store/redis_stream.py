@@ -0,0 +1,192 @@
+# Publishes crawled notes and comments to Redis Streams for downstream services, next to
+# the local SQLite store (main.py --stream_output).
+#
+# models.xhs.m_xhs hands every stored row to publish(), which only puts it on a bounded queue.
+# A background task takes up to `batch_size` rows from the queue, or whatever arrived within
+# `flush_interval` seconds of the first one, and writes them with one pipelined round trip of
+# XADD <stream> MAXLEN ~ <maxlen> * id <row id> data <row as JSON>. When Redis falls behind the
+# queue fills up and publish() waits, so the crawl slows down to what Redis accepts instead of
+# buffering without bound. A batch that fails is retried with backoff; after `max_retries`
+# failed attempts it is dropped and counted, so a Redis outage does not stop the crawl for good.
+#
+# Streams (config.redis_stream_*): <prefix>:notes and <prefix>:comments. Consumers read them with
+# XREAD / XREADGROUP. Any client from redis_client.get_redis_client works, memory:// included.
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import config
+import json_codec
+from redis_client import get_redis_client
+
+logger = logging.getLogger("store")
+
+NOTES = "notes"
+COMMENTS = "comments"
+# row key that identifies an item of each kind
+ID_FIELDS = {NOTES: "note_id", COMMENTS: "comment_id"}
+
+
+class RedisStreamSink:
+    def __init__(self, redis, prefix: str = "xhs", maxlen: int = 1000000, batch_size: int = 500,
+                 flush_interval: float = 0.2, max_pending: int = 5000, max_retries: int = 5):
+        """
+        :param redis: an aioredis client (or MemoryRedis)
+        :param prefix: streams are <prefix>:notes and <prefix>:comments
+        :param maxlen: approximate length each stream is capped at
+        :param batch_size: rows per pipelined round trip at most
+        :param flush_interval: seconds a row waits for more rows before its batch is written
+        :param max_pending: rows queued before publish() starts waiting (backpressure)
+        :param max_retries: attempts per batch before it is dropped
+        """
+        self.redis = redis
+        self.streams = {kind: f"{prefix}:{kind}" for kind in ID_FIELDS}
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue: "asyncio.Queue[Tuple[str, Dict]]" = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict = {"published": 0, "batches": 0, "failed_batches": 0, "dropped": 0, "retries": 0,
+                            "waits": 0, "wait_seconds": 0.0, "batch_seconds": 0.0, "max_batch_seconds": 0.0,
+                            "max_batch_size": 0}
+
+    async def publish(self, kind: str, item: Dict):
+        """
+        Queue a row for the stream of `kind` (NOTES or COMMENTS); waits while the queue is full.
+        """
+        entry = (kind, item)
+        try:
+            self._queue.put_nowait(entry)
+            return
+        except asyncio.QueueFull:
+            pass
+        begin = time.perf_counter()
+        await self._queue.put(entry)
+        self.stats["waits"] += 1
+        self.stats["wait_seconds"] += time.perf_counter() - begin
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _next_batch(self) -> List[Tuple[str, Dict]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: List[Tuple[str, Dict]]):
+        pipe = self.redis.pipeline(transaction=False)
+        for kind, item in batch:
+            pipe.xadd(self.streams[kind], {"id": item.get(ID_FIELDS[kind]) or "", "data": json_codec.dumps(item)},
+                      maxlen=self.maxlen, approximate=True)
+        await pipe.execute()
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write_with_retries(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_with_retries(self, batch: List[Tuple[str, Dict]]):
+        for attempt in range(self.max_retries):
+            begin = time.perf_counter()
+            try:
+                await self._write(batch)
+            except Exception as ex:
+                self.stats["failed_batches"] += 1
+                if attempt + 1 == self.max_retries:
+                    self.stats["dropped"] += len(batch)
+                    logger.error("stream batch dropped", extra={"fields": {"rows": len(batch), "error": repr(ex)}})
+                    return
+                self.stats["retries"] += 1
+                logger.warning("stream batch failed, retrying", extra={"fields": {"rows": len(batch), "error": repr(ex)}})
+                await asyncio.sleep(min(2 ** attempt * 0.5, 10))
+                continue
+            cost = time.perf_counter() - begin
+            self.stats["published"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["batch_seconds"] += cost
+            self.stats["max_batch_seconds"] = max(self.stats["max_batch_seconds"], cost)
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            return
+
+    def report(self) -> Dict:
+        """
+        stats plus the mean batch size and latency.
+        """
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "pending": self._queue.qsize(),
+            "mean_batch_size": self.stats["published"] / batches if batches else 0.0,
+            "mean_batch_seconds": self.stats["batch_seconds"] / batches if batches else 0.0,
+        }
+
+    async def flush(self):
+        """
+        Wait until every queued row has been written (or dropped).
+        """
+        self.start()
+        await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_sink: Optional[RedisStreamSink] = None
+
+
+def open_stream_sink() -> RedisStreamSink:
+    """
+    Start the process-wide sink on config.redis_db_host; m_xhs publishes to it from then on.
+    """
+    global _sink
+    if _sink is None:
+        _sink = RedisStreamSink(
+            get_redis_client(), prefix=config.redis_stream_prefix, maxlen=config.redis_stream_maxlen,
+            batch_size=config.redis_stream_batch_size, flush_interval=config.redis_stream_flush_interval,
+            max_pending=config.redis_stream_max_pending,
+        )
+        _sink.start()
+    return _sink
+
+
+def get_stream_sink() -> Optional[RedisStreamSink]:
+    return _sink
+
+
+async def close_stream_sink() -> Dict:
+    """
+    Write what is still queued and stop the sink, return its report ({} when it was never opened).
+    """
+    global _sink
+    if _sink is None:
+        return {}
+    sink, _sink = _sink, None
+    await sink.close()
+    return sink.report()
@@ -0,0 +1,283 @@
+# Local SQLite storage for crawled notes and comments (xhs_* tables) and Douyin videos and
+# comments (dy_* tables).
+#
+# One writer per process: models.xhs.m_xhs calls upsert_note()/upsert_comment() and
+# models.douyin.m_douyin upsert_aweme()/upsert_aweme_comment() for every row the crawler
+# sees. The database runs in WAL mode so readers (store.fts, query_service, analysts'
+# scripts) never block the writer. Writes are grouped into transactions instead of
+# paying an fsync per row: a transaction commits after `commit_every` rows, or `commit_interval`
+# seconds after its first row. The interval is a timer on the event loop, so rows written just
+# before the crawl goes idle still become visible to readers; outside an event loop it is
+# checked on each write and commit()/close() flush the rest.
+# The FTS5 index (store.fts) of the xhs tables is updated in the same transaction, and only
+# when the indexed text actually changed.
+import asyncio
+import atexit
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+import config
+from store.fts import create_fts_tables, index_comment, index_note
+
+NOTE_COLUMNS = (
+    "note_id", "type", "title", "desc", "time", "last_update_time", "user_id", "nickname", "avatar",
+    "ip_location", "image_list", "liked_count", "collected_count", "comment_count", "share_count",
+    "source_keyword", "last_modify_ts",
+)
+# kept when an update does not know them (a recrawl does not know which keyword found the note)
+KEEP_EXISTING_COLUMNS = ("source_keyword",)
+COMMENT_COLUMNS = (
+    "comment_id", "note_id", "create_time", "ip_location", "content", "user_id", "nickname", "avatar",
+    "sub_comment_count", "root_comment_id", "parent_comment_id", "last_modify_ts",
+)
+AWEME_COLUMNS = (
+    "aweme_id", "aweme_type", "title", "desc", "create_time", "user_id", "sec_uid", "nickname", "avatar",
+    "liked_count", "collected_count", "comment_count", "share_count", "ip_location", "last_modify_ts",
+)
+AWEME_COMMENT_COLUMNS = (
+    "comment_id", "aweme_id", "create_time", "ip_location", "content", "user_id", "nickname", "avatar",
+    "sub_comment_count", "last_modify_ts",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS xhs_note (
+    id INTEGER PRIMARY KEY,
+    note_id TEXT NOT NULL UNIQUE,
+    type TEXT,
+    title TEXT,
+    "desc" TEXT,
+    time INTEGER,
+    last_update_time INTEGER,
+    user_id TEXT,
+    nickname TEXT,
+    avatar TEXT,
+    ip_location TEXT,
+    image_list TEXT,
+    liked_count INTEGER,
+    collected_count INTEGER,
+    comment_count INTEGER,
+    share_count INTEGER,
+    source_keyword TEXT,
+    last_modify_ts INTEGER
+);
+CREATE TABLE IF NOT EXISTS xhs_note_comment (
+    id INTEGER PRIMARY KEY,
+    comment_id TEXT NOT NULL UNIQUE,
+    note_id TEXT NOT NULL,
+    create_time INTEGER,
+    ip_location TEXT,
+    content TEXT,
+    user_id TEXT,
+    nickname TEXT,
+    avatar TEXT,
+    sub_comment_count INTEGER,
+    root_comment_id TEXT,
+    parent_comment_id TEXT,
+    last_modify_ts INTEGER
+);
+CREATE TABLE IF NOT EXISTS dy_aweme (
+    id INTEGER PRIMARY KEY,
+    aweme_id TEXT NOT NULL UNIQUE,
+    aweme_type TEXT,
+    title TEXT,
+    "desc" TEXT,
+    create_time INTEGER,
+    user_id TEXT,
+    sec_uid TEXT,
+    nickname TEXT,
+    avatar TEXT,
+    liked_count INTEGER,
+    collected_count INTEGER,
+    comment_count INTEGER,
+    share_count INTEGER,
+    ip_location TEXT,
+    last_modify_ts INTEGER
+);
+CREATE TABLE IF NOT EXISTS dy_aweme_comment (
+    id INTEGER PRIMARY KEY,
+    comment_id TEXT NOT NULL UNIQUE,
+    aweme_id TEXT NOT NULL,
+    create_time INTEGER,
+    ip_location TEXT,
+    content TEXT,
+    user_id TEXT,
+    nickname TEXT,
+    avatar TEXT,
+    sub_comment_count INTEGER,
+    last_modify_ts INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_xhs_note_user_id ON xhs_note (user_id);
+CREATE INDEX IF NOT EXISTS idx_xhs_note_comment_note_id ON xhs_note_comment (note_id);
+CREATE INDEX IF NOT EXISTS idx_xhs_note_comment_user_id ON xhs_note_comment (user_id);
+CREATE INDEX IF NOT EXISTS idx_dy_aweme_user_id ON dy_aweme (user_id);
+CREATE INDEX IF NOT EXISTS idx_dy_aweme_comment_aweme_id ON dy_aweme_comment (aweme_id);
+"""
+# columns added after the first release, added in place to databases created before them
+ADDED_COLUMNS = {
+    "xhs_note": (("source_keyword", "TEXT"),),
+    "xhs_note_comment": (("root_comment_id", "TEXT"), ("parent_comment_id", "TEXT")),
+}
+
+
+def _quote(column: str) -> str:
+    return f'"{column}"'
+
+
+def _upsert_sql(table: str, columns, key: str) -> str:
+    names = ", ".join(_quote(column) for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    updates = ", ".join(
+        f"{_quote(column)} = COALESCE(excluded.{_quote(column)}, {_quote(column)})" if column in KEEP_EXISTING_COLUMNS
+        else f"{_quote(column)} = excluded.{_quote(column)}"
+        for column in columns if column != key
+    )
+    return (f"INSERT INTO {table} ({names}) VALUES ({placeholders}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {updates}")
+
+
+class SqliteStore:
+    def __init__(self, path: str, commit_every: int = 100, commit_interval: float = 1.0):
+        """
+        :param path: database file, created with its directory when missing
+        :param commit_every: commit after this many written rows
+        :param commit_interval: or when the open transaction is older than this (seconds)
+        """
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        # with WAL a crash can only lose the last transactions, never corrupt the file
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        create_fts_tables(self.conn)
+        self.conn.commit()
+        self._note_sql = _upsert_sql("xhs_note", NOTE_COLUMNS, "note_id")
+        self._comment_sql = _upsert_sql("xhs_note_comment", COMMENT_COLUMNS, "comment_id")
+        self._aweme_sql = _upsert_sql("dy_aweme", AWEME_COLUMNS, "aweme_id")
+        self._aweme_comment_sql = _upsert_sql("dy_aweme_comment", AWEME_COMMENT_COLUMNS, "comment_id")
+        self._pending = 0
+        self._transaction_begin = 0.0
+        self._commit_timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, int] = {"notes": 0, "comments": 0, "awemes": 0, "aweme_comments": 0,
+                                      "indexed": 0, "commits": 0}
+
+    def _add_missing_columns(self):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def upsert_note(self, note: Dict):
+        """
+        Insert or update a note row (m_xhs local_db_item) and reindex its title/desc if they changed.
+        """
+        previous = self.conn.execute(
+            'SELECT title, "desc" FROM xhs_note WHERE note_id = ?', (note["note_id"],)
+        ).fetchone()
+        self.conn.execute(self._note_sql, [note.get(column) for column in NOTE_COLUMNS])
+        if previous != (note.get("title"), note.get("desc")):
+            rowid = self.conn.execute("SELECT id FROM xhs_note WHERE note_id = ?", (note["note_id"],)).fetchone()[0]
+            index_note(self.conn, rowid, note.get("title"), note.get("desc"))
+            self.stats["indexed"] += 1
+        self.stats["notes"] += 1
+        self._written()
+
+    def upsert_comment(self, comment: Dict):
+        """
+        Insert or update a comment row (m_xhs local_db_item) and reindex its content if it changed.
+        """
+        previous = self.conn.execute(
+            "SELECT content FROM xhs_note_comment WHERE comment_id = ?", (comment["comment_id"],)
+        ).fetchone()
+        self.conn.execute(self._comment_sql, [comment.get(column) for column in COMMENT_COLUMNS])
+        if previous is None or previous[0] != comment.get("content"):
+            rowid = self.conn.execute(
+                "SELECT id FROM xhs_note_comment WHERE comment_id = ?", (comment["comment_id"],)
+            ).fetchone()[0]
+            index_comment(self.conn, rowid, comment.get("content"))
+            self.stats["indexed"] += 1
+        self.stats["comments"] += 1
+        self._written()
+
+    def upsert_aweme(self, aweme: Dict):
+        """
+        Insert or update a Douyin video row (m_douyin local_db_item).
+        """
+        self.conn.execute(self._aweme_sql, [aweme.get(column) for column in AWEME_COLUMNS])
+        self.stats["awemes"] += 1
+        self._written()
+
+    def upsert_aweme_comment(self, comment: Dict):
+        """
+        Insert or update a Douyin comment row (m_douyin local_db_item).
+        """
+        self.conn.execute(self._aweme_comment_sql, [comment.get(column) for column in AWEME_COMMENT_COLUMNS])
+        self.stats["aweme_comments"] += 1
+        self._written()
+
+    def _written(self):
+        now = time.monotonic()
+        if self._pending == 0:
+            self._transaction_begin = now
+        self._pending += 1
+        if self._pending >= self.commit_every or now - self._transaction_begin >= self.commit_interval:
+            self.commit()
+        elif self._pending == 1:
+            self._schedule_commit()
+
+    def _schedule_commit(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (scripts, tests): the next write or close() commits
+            return
+        # the connection belongs to this thread, so the timer runs on the loop and not in a thread
+        self._commit_timer = loop.call_later(self.commit_interval, self.commit)
+
+    def commit(self):
+        if self._commit_timer is not None:
+            self._commit_timer.cancel()
+            self._commit_timer = None
+        if self._pending:
+            self.conn.commit()
+            self.stats["commits"] += 1
+            self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+_store: Optional[SqliteStore] = None
+
+
+def get_store() -> SqliteStore:
+    """
+    The process-wide store at config.sqlite_db_path, opened on first use and committed at exit.
+    """
+    global _store
+    if _store is None:
+        _store = SqliteStore(config.sqlite_db_path, commit_every=config.sqlite_commit_every)
+        atexit.register(close_store)
+    return _store
+
+
+def close_store() -> Dict[str, int]:
+    """
+    Commit and close the process-wide store, return its stats ({} when it was never opened).
+    """
+    global _store
+    if _store is None:
+        return {}
+    stats = dict(_store.stats)
+    _store.close()
+    _store = None
+    return stats
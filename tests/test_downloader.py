@@ -0,0 +1,81 @@
+# media.downloader against an httpx mock transport: fresh downloads, resumes and a partial
+# file that was already complete (416).
+import asyncio
+import json
+import os
+
+import httpx
+
+from media.downloader import MediaDownloader
+
+BODY = b"\x89PNG" + bytes(range(256)) * 8
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    requested = request.headers.get("Range")
+    if requested is None:
+        return httpx.Response(200, content=BODY, headers={"content-type": "image/png"})
+    offset = int(requested[len("bytes="):-1])
+    if offset >= len(BODY):
+        return httpx.Response(416, content=b"<html></html>", headers={"content-type": "text/html"})
+    return httpx.Response(206, content=BODY[offset:], headers={"content-type": "image/png"})
+
+
+def download(media_dir: str, key: str, url: str):
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            downloader = MediaDownloader(client, media_dir, concurrency=2)
+            await downloader.start()
+            assert downloader.submit(key, url)
+            await downloader.close()
+            return downloader
+
+    return asyncio.run(scenario())
+
+
+def write_part(media_dir: str, key: str, data: bytes, content_type: str = None):
+    key_dir = os.path.join(media_dir, key[:2])
+    os.makedirs(key_dir, exist_ok=True)
+    with open(os.path.join(key_dir, f"{key}.part"), "wb") as f:
+        f.write(data)
+    if content_type is not None:
+        with open(os.path.join(key_dir, f"{key}.part.type"), "w", encoding="utf-8") as f:
+            f.write(content_type)
+
+
+def manifest(media_dir: str):
+    with open(os.path.join(media_dir, "manifest.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_fresh_download(tmp_path):
+    media_dir = str(tmp_path)
+    downloader = download(media_dir, "abc", "https://cdn/abc")
+    assert downloader.stats["downloaded"] == 1
+    assert downloader.find("abc") == os.path.join(media_dir, "ab", "abc.png")
+    assert sorted(os.listdir(os.path.join(media_dir, "ab"))) == ["abc.png"]
+    assert manifest(media_dir)[0]["size"] == len(BODY)
+
+
+def test_resume(tmp_path):
+    media_dir = str(tmp_path)
+    write_part(media_dir, "abc", BODY[:100], "image/png")
+    downloader = download(media_dir, "abc", "https://cdn/abc")
+    assert downloader.stats["resumed"] == 1
+    with open(downloader.find("abc"), "rb") as f:
+        assert f.read() == BODY
+
+
+def test_complete_part_keeps_its_type(tmp_path):
+    media_dir = str(tmp_path)
+    write_part(media_dir, "abc", BODY, "image/png")
+    downloader = download(media_dir, "abc", "https://cdn/abc")
+    assert downloader.find("abc") == os.path.join(media_dir, "ab", "abc.png")
+    assert manifest(media_dir)[0]["content_type"] == "image/png"
+
+
+def test_complete_part_without_type_guesses_from_url(tmp_path):
+    media_dir = str(tmp_path)
+    write_part(media_dir, "abc", BODY)
+    downloader = download(media_dir, "abc", "https://cdn/abc.jpg?x=1")
+    assert downloader.find("abc") == os.path.join(media_dir, "ab", "abc.jpg")
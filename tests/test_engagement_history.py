@@ -0,0 +1,59 @@
+# store.engagement_history: appends and range queries, and the single-writer lock with and
+# without fcntl (the Windows path is exercised through a stand-in for msvcrt).
+import os
+
+import pytest
+
+from store import engagement_history
+from store.engagement_history import EngagementHistory
+
+BASE_MS = 1685548800000
+
+
+def test_append_and_history(tmp_path):
+    path = str(tmp_path / "history.ts")
+    history = EngagementHistory(path, initial_blocks=1)
+    for minute in range(20):
+        assert history.append("note", BASE_MS + minute * 60000, [minute, minute * 2, 1, 0])
+    assert not history.append("note", BASE_MS, [0, 0, 0, 0])
+    history.close()
+
+    history = EngagementHistory(path, readonly=True)
+    samples = history.history("note", BASE_MS + 5 * 60000, BASE_MS + 9 * 60000)
+    assert samples["liked_count"].tolist() == [5, 6, 7, 8, 9]
+    assert samples["collected_count"].tolist() == [10, 12, 14, 16, 18]
+    history.close()
+
+
+def test_second_writer_is_refused(tmp_path):
+    path = str(tmp_path / "history.ts")
+    history = EngagementHistory(path)
+    fd = os.open(path, os.O_RDWR)
+    try:
+        with pytest.raises(BlockingIOError):
+            engagement_history.lock_writer(fd)
+    finally:
+        os.close(fd)
+        history.close()
+
+
+def test_lock_without_fcntl(monkeypatch, tmp_path):
+    class Msvcrt:
+        LK_NBLCK = 2
+        locked = set()
+
+        @classmethod
+        def locking(cls, fd, mode, nbytes):
+            inode = os.fstat(fd).st_ino
+            if inode in cls.locked:
+                raise PermissionError(13, "Permission denied")
+            cls.locked.add(inode)
+
+    monkeypatch.setattr(engagement_history, "fcntl", None)
+    monkeypatch.setattr(engagement_history, "msvcrt", Msvcrt, raising=False)
+    path = str(tmp_path / "history.ts")
+    history = EngagementHistory(path)
+    assert history.append("note", BASE_MS, [1, 2, 3, 4])
+    with pytest.raises(BlockingIOError):
+        EngagementHistory(path)
+    history.close()
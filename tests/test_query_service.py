@@ -0,0 +1,85 @@
+# query_service comment thread endpoints on a small database written by store.sqlite_store.
+import asyncio
+
+import pytest
+import tornado.httpclient
+import tornado.httpserver
+import tornado.testing
+
+import json_codec
+import query_service
+from store.sqlite_store import COMMENT_COLUMNS, SqliteStore
+
+
+def comment(comment_id: str, parent: str = "", note_id: str = "note"):
+    row = dict.fromkeys(COMMENT_COLUMNS, "")
+    row.update(comment_id=comment_id, note_id=note_id, create_time=0, sub_comment_count=0, last_modify_ts=0,
+               root_comment_id=parent, parent_comment_id=parent)
+    return row
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "crawler.db")
+    store = SqliteStore(path)
+    # root "a" with replies b, c and c's reply d; root "e" on its own; another note's comment
+    for row in (comment("a"), comment("b", "a"), comment("c", "a"), comment("d", "c"), comment("e"),
+                comment("x", note_id="other")):
+        store.upsert_comment(row)
+    store.close()
+    return path
+
+
+def serve(db_path: str, scenario):
+    async def run():
+        app = query_service.Application(db_path, autoreload=False)
+        sock, port = tornado.testing.bind_unused_port()
+        server = tornado.httpserver.HTTPServer(app)
+        server.add_sockets([sock])
+        client = tornado.httpclient.AsyncHTTPClient()
+
+        async def get(path: str):
+            response = await client.fetch(f"http://127.0.0.1:{port}{path}", raise_error=False)
+            return response.code, json_codec.loads(response.body) if response.code == 200 else None
+
+        try:
+            await scenario(app, get)
+        finally:
+            server.stop()
+            app.db.close()
+
+    asyncio.run(run())
+
+
+def test_subtree_rows_and_depths(db_path):
+    async def scenario(app, get):
+        code, body = await get("/comments/c/thread")
+        assert [(item["comment_id"], item["depth"]) for item in body["items"]] == [("c", 0), ("d", 1)]
+        code, body = await get("/comments/a/thread")
+        assert [item["comment_id"] for item in body["items"]] == ["a", "b", "c", "d"]
+        code, _ = await get("/comments/missing/thread")
+        assert code == 404
+
+    serve(db_path, scenario)
+
+
+def test_tree_index_is_reused_until_the_data_changes(db_path):
+    async def scenario(app, get):
+        await get("/comments/c/thread")
+        tree = app.trees["note"][1]
+        code, body = await get("/notes/note/threads")
+        assert [thread["comment"]["comment_id"] for thread in body["threads"]] == ["a", "e"]
+        assert app.trees["note"][1] is tree
+        app.data_version = lambda: (1, 1)
+        await get("/comments/c/thread")
+        assert app.trees["note"][1] is not tree
+
+    serve(db_path, scenario)
+
+
+def test_comments_are_fetched_in_batches(db_path, monkeypatch):
+    monkeypatch.setattr(query_service, "ID_BATCH_SIZE", 2)
+    conn = query_service.open_read_only(db_path)
+    rows = query_service.fetch_comments(conn, ["a", "b", "c", "d", "e", "missing"])
+    conn.close()
+    assert sorted(rows) == ["a", "b", "c", "d", "e"]
@@ -0,0 +1,108 @@
+# store.redis_stream.RedisStreamSink on the in-process Redis stand-in (memory://): batching
+# by size and by time, MAXLEN ~ trimming, backpressure and dropping batches Redis refuses.
+import asyncio
+
+import json_codec
+from memory_redis import MemoryRedis
+from store.redis_stream import COMMENTS, NOTES, RedisStreamSink
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def comment(index: int):
+    return {"comment_id": f"c{index}", "content": f"评论 {index}"}
+
+
+def test_batches_are_cut_at_batch_size():
+    async def scenario():
+        redis = MemoryRedis()
+        sink = RedisStreamSink(redis, prefix="test", batch_size=3, flush_interval=0.05)
+        for index in range(7):
+            await sink.publish(COMMENTS, comment(index))
+        await sink.close()
+        assert await redis.xlen("test:comments") == 7
+        assert sink.stats["batches"] == 3
+        assert sink.stats["max_batch_size"] == 3
+        entries = await redis.xrange("test:comments")
+        assert [fields["id"] for _, fields in entries] == [f"c{index}" for index in range(7)]
+        assert json_codec.loads(entries[0][1]["data"]) == comment(0)
+
+    run(scenario())
+
+
+def test_a_partial_batch_is_written_after_flush_interval():
+    async def scenario():
+        redis = MemoryRedis()
+        sink = RedisStreamSink(redis, prefix="test", batch_size=100, flush_interval=0.1)
+        sink.start()
+        await sink.publish(NOTES, {"note_id": "n1"})
+        await sink.publish(NOTES, {"note_id": "n2"})
+        await asyncio.sleep(0.03)
+        assert await redis.xlen("test:notes") == 0
+        await asyncio.sleep(0.2)
+        assert await redis.xlen("test:notes") == 2
+        assert sink.stats["batches"] == 1
+        await sink.close()
+
+    run(scenario())
+
+
+def test_streams_are_trimmed_to_maxlen():
+    async def scenario():
+        redis = MemoryRedis()
+        sink = RedisStreamSink(redis, prefix="test", maxlen=5, batch_size=4, flush_interval=0.01)
+        for index in range(20):
+            await sink.publish(COMMENTS, comment(index))
+        await sink.close()
+        entries = await redis.xrange("test:comments")
+        # MAXLEN ~ may keep a few more than asked for, never fewer, and always the newest
+        assert 5 <= len(entries) < 20
+        assert entries[-1][1]["id"] == "c19"
+
+    run(scenario())
+
+
+def test_publish_waits_when_max_pending_is_reached():
+    async def scenario():
+        redis = MemoryRedis()
+        sink = RedisStreamSink(redis, prefix="test", max_pending=2, flush_interval=0.01)
+        await sink.publish(COMMENTS, comment(0))
+        await sink.publish(COMMENTS, comment(1))
+        blocked = asyncio.create_task(sink.publish(COMMENTS, comment(2)))
+        await asyncio.sleep(0.02)
+        assert not blocked.done()
+        sink.start()
+        await asyncio.wait_for(blocked, timeout=1)
+        await sink.close()
+        assert sink.stats["waits"] == 1
+        assert await redis.xlen("test:comments") == 3
+
+    run(scenario())
+
+
+class FailingRedis:
+    class Pipeline:
+        def xadd(self, *args, **kwargs):
+            return self
+
+        async def execute(self):
+            raise ConnectionError("redis is down")
+
+    def pipeline(self, transaction: bool = True):
+        return self.Pipeline()
+
+
+def test_batch_is_dropped_after_max_retries():
+    async def scenario():
+        sink = RedisStreamSink(FailingRedis(), prefix="test", max_retries=2, flush_interval=0.01)
+        for index in range(3):
+            await sink.publish(COMMENTS, comment(index))
+        await sink.close()
+        assert sink.stats["failed_batches"] == 2
+        assert sink.stats["retries"] == 1
+        assert sink.stats["dropped"] == 3
+        assert sink.stats["published"] == 0
+
+    run(scenario())
@@ -0,0 +1,56 @@
+# sms_code hand-off between the SMS notification receiver and the phone login, on the
+# in-process Redis stand-in (memory://).
+import asyncio
+
+from memory_redis import MemoryRedis
+from sms_code import clear_sms_code, push_sms_code, sms_code_key, wait_sms_code
+
+PHONE = "13800000000"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_push_wakes_a_waiting_login():
+    async def scenario():
+        redis = MemoryRedis()
+        waiting = asyncio.create_task(wait_sms_code(redis, "xhs", PHONE, timeout=5))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await push_sms_code(redis, "xhs", PHONE, "171959")
+        assert await asyncio.wait_for(waiting, timeout=1) == "171959"
+
+    run(scenario())
+
+
+def test_newest_code_wins_and_the_rest_are_dropped():
+    async def scenario():
+        redis = MemoryRedis()
+        await push_sms_code(redis, "xhs", PHONE, "111111")
+        await push_sms_code(redis, "xhs", PHONE, "222222")
+        assert await wait_sms_code(redis, "xhs", PHONE, timeout=1) == "222222"
+        assert await redis.llen(sms_code_key("xhs", PHONE)) == 0
+
+    run(scenario())
+
+
+def test_clear_drops_codes_of_an_earlier_attempt():
+    async def scenario():
+        redis = MemoryRedis()
+        await push_sms_code(redis, "xhs", PHONE, "111111")
+        await push_sms_code(redis, "dy", PHONE, "333333")
+        await clear_sms_code(redis, "xhs", PHONE)
+        assert await redis.llen(sms_code_key("xhs", PHONE)) == 0
+        # other platforms' codes for the same phone are kept
+        assert await redis.llen(sms_code_key("dy", PHONE)) == 1
+
+    run(scenario())
+
+
+def test_timeout_returns_empty():
+    async def scenario():
+        redis = MemoryRedis()
+        assert await wait_sms_code(redis, "xhs", PHONE, timeout=0.05) == ""
+
+    run(scenario())
@@ -0,0 +1,44 @@
+# Startup budget: heavy or optional modules are imported by the code path that needs them,
+# so `main.py --help` and bad arguments stay fast and a plain search run does not pay for
+# media download, image dedup, browser health, clustering, recrawl or Redis.
+# Each check runs in a fresh interpreter, modules imported by other tests do not leak in.
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# generous, a warm `main.py --help` takes ~0.2s; importing playwright alone already costs ~0.1s more
+HELP_BUDGET = 2.0
+
+
+def loaded_modules(module: str, watched):
+    script = (
+        f"import sys, {module}\n"
+        f"print('\\n'.join(name for name in {list(watched)!r} if name in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return output.stdout.split()
+
+
+def test_help_within_budget():
+    begin = time.perf_counter()
+    output = subprocess.run([sys.executable, "main.py", "--help"], cwd=ROOT, capture_output=True, text=True)
+    cost = time.perf_counter() - begin
+    assert output.returncode == 0, output.stderr
+    assert "--platform" in output.stdout
+    assert cost < HELP_BUDGET, f"main.py --help took {cost:.2f}s"
+
+
+def test_main_defers_platform_modules():
+    heavy = ("playwright", "httpx", "numpy", "pandas", "PIL", "matplotlib", "aioredis", "media_platform.xhs.spider",
+             "media_platform.douyin.spider")
+    assert loaded_modules("main", heavy) == []
+
+
+def test_spider_defers_subsystems():
+    optional = ("numpy", "pandas", "PIL", "matplotlib", "aioredis", "batch_run", "browser.cookie_sync",
+                "browser.health", "cluster.worker", "media.downloader", "media.image_dedup", "scheduler.recrawl",
+                "sms_code", "store.engagement_history")
+    assert loaded_modules("media_platform.xhs.spider", optional) == []
+    assert loaded_modules("media_platform.douyin.spider", optional) == []
@@ -0,0 +1,136 @@
+# cluster.work_queue and the worker's item handling on the in-process Redis stand-in (memory://).
+import asyncio
+import contextlib
+
+import config
+from cluster.work_queue import WorkQueue
+from cluster.worker import _process, cluster_queues, run_worker
+from memory_redis import MemoryRedis
+from redis_client import close_redis_clients, get_redis_client
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_lease_and_ack():
+    async def scenario():
+        queue = WorkQueue(MemoryRedis(), "test:notes")
+        assert await queue.enqueue("a", "b") == 2
+        assert await queue.lease(timeout=None) == "a"
+        assert await queue.size() == (1, 1)
+        assert await queue.unfinished() == 2
+        await queue.ack("a")
+        assert await queue.size() == (1, 0)
+
+    run(scenario())
+
+
+def test_dedupe_is_scoped_to_a_run():
+    async def scenario():
+        redis = MemoryRedis()
+        queue = WorkQueue(redis, "test:notes", seen_ttl=60)
+        assert await queue.enqueue("a", "b", dedupe=True) == 2
+        assert await queue.enqueue("a", "c", dedupe=True) == 1
+        await queue.reset()
+        assert await queue.enqueue("a", dedupe=True) == 1
+
+    run(scenario())
+
+
+def test_seen_set_expires():
+    async def scenario():
+        queue = WorkQueue(MemoryRedis(), "test:notes", seen_ttl=0.05)
+        assert await queue.enqueue("a", dedupe=True) == 1
+        await asyncio.sleep(0.1)
+        assert await queue.enqueue("a", dedupe=True) == 1
+
+    run(scenario())
+
+
+def test_info_travels_with_the_item():
+    async def scenario():
+        queue = WorkQueue(MemoryRedis(), "test:notes")
+        await queue.enqueue("a", dedupe=True, info="健身")
+        await queue.enqueue("a", dedupe=True, info="旗袍")
+        item = await queue.lease(timeout=None)
+        assert await queue.info(item) == "健身"
+        await queue.ack(item)
+        assert await queue.info(item) is None
+
+    run(scenario())
+
+
+def test_failing_item_is_dead_lettered():
+    async def scenario():
+        queue = WorkQueue(MemoryRedis(), "test:notes", max_attempts=3)
+        await queue.enqueue("bad")
+        calls = []
+
+        async def handler(item):
+            calls.append(item)
+            raise ValueError(item)
+
+        while True:
+            item = await queue.lease(timeout=None)
+            if item is None:
+                break
+            assert not await _process(queue, item, handler)
+        assert len(calls) == 3
+        assert await queue.dead() == ["bad"]
+        assert await queue.size() == (0, 0)
+
+    run(scenario())
+
+
+def test_failed_note_detail_is_dead_lettered(monkeypatch):
+    monkeypatch.setattr(config, "redis_db_host", "memory://test-worker")
+
+    class Spider:
+        class xhs_client:
+            rate_limiter = None
+
+        def __init__(self):
+            self.fetched = []
+
+        async def get_note_detail(self, note_id, source_keyword=None):
+            # like XiaoHongShuSpider.get_note_detail when the fetch fails: logged, returns None
+            self.fetched.append(note_id)
+            return None
+
+        async def get_comments(self, note_id):
+            raise AssertionError("comments crawled for a note without detail")
+
+    async def scenario():
+        spider = Spider()
+        _, note_queue = cluster_queues(get_redis_client())
+        await note_queue.enqueue("bad", dedupe=True, info="健身")
+        worker = asyncio.create_task(run_worker(spider))
+        try:
+            for _ in range(100):
+                if await note_queue.dead():
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await worker
+            await close_redis_clients()
+        assert spider.fetched == ["bad"] * config.cluster_max_attempts
+        assert await note_queue.dead() == ["bad"]
+        assert await note_queue.size() == (0, 0)
+
+    run(scenario())
+
+
+def test_expired_leases_count_as_attempts():
+    async def scenario():
+        queue = WorkQueue(MemoryRedis(), "test:notes", visibility_timeout=0, max_attempts=2)
+        await queue.enqueue("stuck")
+        assert await queue.lease(timeout=None) == "stuck"
+        assert await queue.requeue_expired() == ["stuck"]
+        assert await queue.lease(timeout=None) == "stuck"
+        assert await queue.requeue_expired() == []
+        assert await queue.dead() == ["stuck"]
+
+    run(scenario())
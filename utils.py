@@ -1,9 +1,10 @@
+import os
 import re
+import json
 import time
 import base64
 import random
 from io import BytesIO
-from PIL import Image, ImageDraw
 from typing import Optional, List, Tuple, Dict
 from playwright.async_api import Page
 from playwright.async_api import Cookie
@@ -50,12 +51,38 @@ def convert_cookies(cookies: Optional[List[Cookie]]) -> Tuple[str, Dict]:
     return cookies_str, cookie_dict
 
 
+def is_storage_state_valid(path: str, session_cookie: str = "web_session") -> bool:
+    """
+    快速检查保存的 storage state 是否还能用：文件存在，且登录 cookie 未过期
+    :param path: storage state 文件路径
+    :param session_cookie: 代表登录态的 cookie 名
+    :return:
+    """
+    if not path or not os.path.exists(path):
+        return False
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+    for cookie in state.get("cookies", []):
+        if cookie.get("name") != session_cookie or not cookie.get("value"):
+            continue
+        expires = cookie.get("expires", -1)
+        # expires 为 -1 表示会话 cookie，没有过期时间
+        return expires == -1 or expires > time.time()
+    return False
+
+
 def show_qrcode(qr_code: str):
     """
     解析base64编码qrcode图像并显示它
     :param qr_code:
     :return:
     """
+    # PIL 只有二维码登录才用得到，放到函数内导入以加快其他登录方式的启动
+    from PIL import Image, ImageDraw
+
     qr_code = qr_code.split(",")[1]
     qr_code = base64.b64decode(qr_code)
     image = Image.open(BytesIO(qr_code))
@@ -77,12 +104,18 @@ def get_current_timestamp():
 
 
 def match_interact_info_count(count_str: str) -> int:
+    """
+    互动数转整数，兼容 "1732"、"1.2万"、"10+" 这类展示格式
+    :param count_str:
+    :return:
+    """
     if not count_str:
         return 0
 
-    match = re.search(r'\d+', count_str)
+    match = re.search(r'(\d+(?:\.\d+)?)\s*([万wW千kK]?)', str(count_str))
     if match:
-        number = match.group()
-        return int(number)
+        number, unit = match.groups()
+        multiple = {"万": 10000, "w": 10000, "W": 10000, "千": 1000, "k": 1000, "K": 1000}.get(unit, 1)
+        return int(float(number) * multiple)
     else:
         return 0